@@ -0,0 +1,172 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to generating the pages that the replay server serves.
+
+The pages are synthetic stand-ins that follow the structure of TikTok's pages
+closely enough to exercise every path through the poller. Pages captured from
+TikTok can be used instead by saving them in a directory as `<kind>.html`, and
+passing that directory to `Corpus`.
+"""
+
+import json
+import os
+import random
+from enum import StrEnum
+
+class PageKind(StrEnum):
+    """The kinds of page the corpus can produce."""
+
+    NORMAL = "normal"
+    DOM_ONLY = "dom-only"
+    LIVE = "live"
+    PRIVATE = "private"
+    MISSING = "missing"
+    PLEASE_WAIT = "please-wait"
+    ACCESS_DENIED = "access-denied"
+
+"""Kinds that are a property of the account, rather than of a single request."""
+ACCOUNT_KINDS = [PageKind.NORMAL, PageKind.DOM_ONLY, PageKind.PRIVATE,
+                 PageKind.MISSING]
+
+"""The number of videos listed on a profile page."""
+VIDEOS_PER_PAGE = 16
+
+def make_video_id(uploaded_at: int, salt: int) -> int:
+    """TikTok video IDs store the time they were uploaded in their upper 32
+    bits."""
+
+    return (uploaded_at << 32) | (salt & 0xFFFFFFFF)
+
+def filler(size: int, seed: int) -> str:
+    """Returns roughly `size` bytes of inline script, standing in for the CSS and
+    JavaScript that make up most of a real page."""
+
+    rng = random.Random(seed)
+    words = ["function", "return", "var", "const", "window", "document",
+             "webpack", "module", "exports", "tiktok", "style", "class"]
+    chunks = []
+    length = 0
+    while length < size:
+        chunk = " ".join(rng.choice(words) for _ in range(32)) + ";\n"
+        chunks.append(chunk)
+        length += len(chunk)
+    return "<script>" + "".join(chunks) + "</script>"
+
+class Corpus:
+    """Produces the page for a given username, kind and list of videos."""
+
+    def __init__(self, directory: str=None, filler_size: int=150 * 1024):
+        """
+        Parameters
+        ----------
+        directory : str
+            If given, any `<kind>.html` files in this directory are served for
+            that kind instead of the generated pages. They are served as-is, so
+            the videos in them never change.
+        filler_size : int
+            Bytes of filler to put in generated pages before their content, so
+            that they are about as large as TikTok's.
+        """
+
+        self.recorded = {}
+        if directory is not None:
+            for kind in PageKind:
+                path = os.path.join(directory, f"{kind}.html")
+                if os.path.exists(path):
+                    with open(path, mode='rb') as f:
+                        self.recorded[kind] = f.read()
+        self.filler = filler(filler_size, 0)
+
+    def page(self, username: str, kind: PageKind, videos: list) -> tuple:
+        """Returns tuple (status code, page). `videos` is a list of tuples
+        (video ID, caption), newest first."""
+
+        if kind in self.recorded:
+            status = 403 if kind == PageKind.ACCESS_DENIED else 200
+            return status, self.recorded[kind]
+        if kind == PageKind.ACCESS_DENIED:
+            return 403, (b"<html><head><title>Access Denied</title></head><body>"
+                         b"<h1>Access Denied</h1>You don't have permission to "
+                         b"access this server.</body></html>")
+        if kind == PageKind.PLEASE_WAIT:
+            return 200, (b"<html><head><title>TikTok</title></head><body>"
+                         b"<div>Please wait...</div></body></html>")
+        return 200, self.profile_page(username, kind, videos).encode('utf-8')
+
+    def universal_data(self, username: str, kind: PageKind,
+                       videos: list) -> dict:
+        status_code = {PageKind.MISSING: 10221}.get(kind, 0)
+        user = {"uniqueId": username,
+                "privateAccount": kind == PageKind.PRIVATE,
+                "roomId": "7300000000000000000" if kind == PageKind.LIVE else ""}
+        items = [] if kind in (PageKind.PRIVATE, PageKind.MISSING) else \
+            [{"id": str(video_id), "desc": caption} for video_id, caption in
+             videos]
+        return {"__DEFAULT_SCOPE__": {"webapp.user-detail": {
+            "statusCode": status_code, "userInfo": {"user": user},
+            "itemList": items}}}
+
+    def profile_page(self, username: str, kind: PageKind, videos: list) -> str:
+        parts = ["<!DOCTYPE html><html><head><title>TikTok</title>", self.filler,
+                 "</head><body><div id=\"app\">"]
+        if kind == PageKind.LIVE:
+            parts.append('<div class="css-1 SpanLiveBadge">LIVE</div>')
+        if kind == PageKind.MISSING:
+            parts.append('<div class="css-2-DivErrorContainer e1"><p>Couldn\'t '
+                         'find this account</p><p>Looking for videos?</p></div>')
+        elif kind == PageKind.PRIVATE:
+            parts.append('<div class="css-2-DivErrorContainer e1"><p>This '
+                         'account is private</p><p>Follow this account to see '
+                         'their content.</p></div>')
+        else:
+            parts.append('<div data-e2e="user-post-item-list" '
+                         'class="css-3-DivVideoFeed">')
+            for video_id, caption in videos:
+                parts.append(
+                    '<div class="css-4-DivItemContainer"><div '
+                    'data-e2e="user-post-item" class="css-5-DivContainer">'
+                    f'<a href="https://www.tiktok.com/@{username}/video/'
+                    f'{video_id}"><div class="css-6-DivPlayer"></div></a></div>'
+                    '<div data-e2e="user-post-item-desc" class="css-7-DivDesc">'
+                    f'<a title="{caption}" href="#">{caption}</a></div></div>')
+            parts.append("</div>")
+        parts.append("</div>")
+        if kind != PageKind.DOM_ONLY:
+            parts.append('<script id="__UNIVERSAL_DATA_FOR_REHYDRATION__" '
+                         'type="application/json">')
+            parts.append(json.dumps(self.universal_data(username, kind, videos)))
+            parts.append("</script>")
+        parts.append("</body></html>")
+        return "".join(parts)
+
+    def live_page(self, username: str, is_live: bool) -> tuple:
+        """Returns tuple (status code, page) for a user's LIVE page."""
+
+        data = {"LiveRoom": {"liveRoomUserInfo": {"user": {
+            "uniqueId": username, "status": 2 if is_live else 4,
+            "roomId": "7300000000000000000" if is_live else ""}}}}
+        return 200, ("<!DOCTYPE html><html><head><title>TikTok LIVE</title>"
+                     '<script id="SIGI_STATE" type="application/json">' +
+                     json.dumps(data) + "</script>" + self.filler +
+                     "</head><body></body></html>").encode('utf-8')
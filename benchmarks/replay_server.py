@@ -0,0 +1,233 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""A local HTTP server that stands in for TikTok, serving pages from a `Corpus`
+with configurable latency and failures.
+
+Run it on its own with `python benchmarks/replay_server.py`, or start it from
+another script with `ReplayServer.start()`.
+"""
+
+import argparse
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from corpus import Corpus, PageKind, ACCOUNT_KINDS, VIDEOS_PER_PAGE, \
+    make_video_id
+
+@dataclass
+class ReplaySettings:
+    # Seconds before each response is sent, plus up to `jitter` more.
+    latency: float = 0.05
+    jitter: float = 0.02
+    # Chance of each profile request failing in each way.
+    please_wait_rate: float = 0.02
+    access_denied_rate: float = 0.01
+    reset_rate: float = 0.005
+    # Chance of an account uploading a new video each time it is requested.
+    upload_rate: float = 0.05
+    # Chance of an account going LIVE or OFFLINE each time its LIVE status is
+    # requested.
+    live_toggle_rate: float = 0.05
+    # The share of accounts of each kind.
+    account_weights: dict = field(default_factory=lambda: {
+        PageKind.NORMAL: 0.85, PageKind.DOM_ONLY: 0.1, PageKind.PRIVATE: 0.03,
+        PageKind.MISSING: 0.02})
+    seed: int = 0
+
+class Account:
+    """What the server knows about one username."""
+
+    def __init__(self, username: str, settings: ReplaySettings):
+        seed = int.from_bytes(blake2b(f"{settings.seed}:{username}".encode(
+            'utf-8'), digest_size=8).digest(), 'big')
+        self.rng = random.Random(seed)
+        self.kind = self.rng.choices(
+            list(settings.account_weights.keys()),
+            list(settings.account_weights.values()))[0]
+        self.is_live = False
+        self.lock = threading.Lock()
+        uploaded_at = int(time.time()) - VIDEOS_PER_PAGE * 3600
+        self.videos = [(make_video_id(uploaded_at + i * 3600,
+                                      self.rng.getrandbits(32)),
+                        f"video {i} #fyp") for i in range(VIDEOS_PER_PAGE)]
+        self.videos.reverse()
+
+    def upload(self):
+        video_id = make_video_id(max(int(time.time()),
+                                     (self.videos[0][0] >> 32) + 1),
+                                 self.rng.getrandbits(32))
+        self.videos.insert(0, (video_id, f"new video {video_id} #fyp"))
+        del self.videos[VIDEOS_PER_PAGE:]
+
+class ReplayServer:
+    """Serves `/@<username>` profile pages and `/@<username>/live` LIVE pages."""
+
+    def __init__(self, corpus: Corpus, settings: ReplaySettings,
+                 host: str="127.0.0.1", port: int=0):
+        self.corpus = corpus
+        self.settings = settings
+        self.accounts = {}
+        self.accounts_lock = threading.Lock()
+        self.rng = random.Random(settings.seed)
+        self.rng_lock = threading.Lock()
+        self.requests = {}
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+        class Server(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                # Clients that close their connection early are expected.
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+        self.httpd = Server((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def account(self, username: str) -> Account:
+        with self.accounts_lock:
+            if username not in self.accounts:
+                self.accounts[username] = Account(username, self.settings)
+            return self.accounts[username]
+
+    def roll(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def count(self, outcome: str):
+        with self.rng_lock:
+            self.requests[outcome] = self.requests.get(outcome, 0) + 1
+
+    def handle(self, handler: BaseHTTPRequestHandler):
+        time.sleep(self.settings.latency + self.roll() * self.settings.jitter)
+        path = handler.path.split("?")[0].rstrip("/")
+        if not path.startswith("/@"):
+            self.send(handler, 404, b"Not Found")
+            return
+        username, _, rest = path[2:].partition("/")
+        account = self.account(username)
+        if rest == "live":
+            with account.lock:
+                if self.roll() < self.settings.live_toggle_rate:
+                    account.is_live = not account.is_live
+                is_live = account.is_live
+            self.count("live")
+            self.send(handler, *self.corpus.live_page(username, is_live))
+            return
+        roll = self.roll()
+        if roll < self.settings.reset_rate:
+            self.count("reset")
+            # Close the connection without responding.
+            handler.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                          struct.pack('ii', 1, 0))
+            handler.close_connection = True
+            return
+        roll -= self.settings.reset_rate
+        if roll < self.settings.access_denied_rate:
+            self.count(PageKind.ACCESS_DENIED)
+            self.send(handler, *self.corpus.page(
+                username, PageKind.ACCESS_DENIED, []))
+            return
+        roll -= self.settings.access_denied_rate
+        if roll < self.settings.please_wait_rate:
+            self.count(PageKind.PLEASE_WAIT)
+            self.send(handler, *self.corpus.page(
+                username, PageKind.PLEASE_WAIT, []))
+            return
+        with account.lock:
+            if self.roll() < self.settings.upload_rate:
+                account.upload()
+            kind = account.kind
+            if kind == PageKind.NORMAL and account.is_live:
+                kind = PageKind.LIVE
+            videos = list(account.videos)
+        self.count(kind)
+        self.send(handler, *self.corpus.page(username, kind, videos))
+
+    def send(self, handler: BaseHTTPRequestHandler, status: int, body: bytes):
+        try:
+            handler.send_response(status)
+            handler.send_header("Content-Type", "text/html; charset=utf-8")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The poller stopped receiving once it had what it needed.
+            handler.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serves pages that stand in for TikTok's, with "
+        "configurable latency and failures.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--corpus-dir", default=None,
+                        help="directory of recorded <kind>.html pages")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--please-wait-rate", type=float, default=0.02)
+    parser.add_argument("--access-denied-rate", type=float, default=0.01)
+    parser.add_argument("--reset-rate", type=float, default=0.005)
+    parser.add_argument("--upload-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = ReplayServer(Corpus(args.corpus_dir), ReplaySettings(
+        latency=args.latency, jitter=args.jitter,
+        please_wait_rate=args.please_wait_rate,
+        access_denied_rate=args.access_denied_rate, reset_rate=args.reset_rate,
+        upload_rate=args.upload_rate, seed=args.seed), args.host, args.port)
+    print(f"Replaying TikTok at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
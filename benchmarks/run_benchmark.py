@@ -0,0 +1,304 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Runs the real poller against the replay server, with a stub in place of the
+Discord client, and reports how it performed.
+
+    python benchmarks/run_benchmark.py --users 200 --duration 30
+
+Each run takes place in a new temporary directory, so it never touches the
+bot's own configuration, state or stats.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.dirname(BENCHMARK_DIRECTORY))
+
+from corpus import Corpus
+from replay_server import ReplayServer, ReplaySettings
+
+class StubChannel:
+    """Stands in for a Discord channel, counting what is sent to it."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, content=None, file=None):
+        self.sent += 1
+
+class StubUser:
+    def __init__(self, channel: StubChannel):
+        self.dm_channel = channel
+
+    async def create_dm(self):
+        return self.dm_channel
+
+class StubClient:
+    """Stands in for the Discord client. Every user and channel shares one
+    `StubChannel`."""
+
+    def __init__(self):
+        self.channel = StubChannel()
+
+    def get_user(self, user_id: int):
+        return StubUser(self.channel)
+
+    def get_channel(self, channel_id: int):
+        return self.channel
+
+    async def fetch_user(self, user_id: int):
+        return StubUser(self.channel)
+
+    async def fetch_channel(self, channel_id: int):
+        return self.channel
+
+class PhaseTimer:
+    """Measures the CPU time spent in each phase of polling, by wrapping the
+    functions that make up each phase.
+
+    Time spent in a wrapped function that was called by another wrapped
+    function only counts towards the inner function's phase.
+    """
+
+    def __init__(self):
+        self.cpu = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def wrap(self, owner, name: str, phase: str):
+        function = getattr(owner, name)
+        timer = self
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = timer.local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            started_at = time.thread_time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.thread_time() - started_at
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                with timer.lock:
+                    timer.cpu[phase] = timer.cpu.get(phase, 0.0) + elapsed - \
+                        nested
+                    timer.calls[phase] = timer.calls.get(phase, 0) + 1
+        setattr(owner, name, wrapper)
+
+def write_json(path: str, data):
+    with open(path, mode='w', encoding='utf-8') as f:
+        f.write(json.dumps(data))
+
+def set_up_directory(directory: str, args, base_url: str):
+    config = {f"user{i}": {str(1000 + j): {"videos": True, "lives": True} for
+                           j in range(args.subscribers)} for
+              i in range(args.users)}
+    write_json(os.path.join(directory, "config.json"), config)
+    write_json(os.path.join(directory, "options.json"), {
+        "profile-url": base_url + "/@{username}",
+        "live-check-url": base_url + "/@{username}/live",
+        "worker-count": args.workers,
+        "process-count": args.processes,
+        "live-worker-count": args.live_workers,
+        "live-check-interval": args.user_interval,
+        "live-poll-interval": 0.0,
+        "poll-interval": 0.0,
+        "base-user-interval": args.user_interval,
+        "min-user-interval": args.user_interval,
+        "max-user-interval": args.user_interval,
+        "http-pool-size": 1,
+        "dispatch-rate": 1000.0,
+        "config-backend": args.config_backend,
+        "phase-timing": args.phase_timing,
+    })
+    write_json(os.path.join(directory, "headers.json"), {})
+    with open(os.path.join(directory, "cookie.txt"), mode='w',
+              encoding='utf-8') as f:
+        f.write("")
+    with open(os.path.join(directory, "log_channel.txt"), mode='w',
+              encoding='utf-8') as f:
+        f.write("1")
+
+def instrument(timer: PhaseTimer, outcomes: dict, show_progress: bool):
+    """Wraps the functions that make up each phase. Must be called after the
+    working directory has been set up, as importing the poller reads it."""
+
+    import http_client
+    import profile_page
+    import page_poll
+    import state_store
+    import poller
+
+    timer.wrap(http_client.PollerHTTPClient, "stream_page", "fetch")
+    timer.wrap(profile_page.PageScanner, "decode", "decode")
+    timer.wrap(profile_page.ElementIndex, "__init__", "parse")
+    timer.wrap(page_poll, "find_videos", "parse")
+    timer.wrap(page_poll, "check_for_error_div", "parse")
+    timer.wrap(state_store.StateStore, "serialise", "persist")
+    timer.wrap(state_store.StateStore, "write", "persist")
+    timer.wrap(poller, "flush_stats", "persist")
+    timer.wrap(poller, "record_successful_poll", "stats")
+    timer.wrap(poller, "record_failed_poll", "stats")
+    timer.wrap(poller, "record_poll_latency", "stats")
+    timer.wrap(poller.PollingCog, "notify_videos", "notify")
+    timer.wrap(poller.PollingCog, "notify_deleted_videos", "notify")
+    timer.wrap(poller.PollingCog, "notify_monitor", "notify")
+    timer.wrap(poller.PollingCog, "notify_live", "notify")
+
+    if not show_progress:
+        poller.PollingCog.print_char = lambda self, char, worker_number: None
+
+    apply_outcome = poller.PollingCog.apply_outcome
+    @functools.wraps(apply_outcome)
+    async def count_outcome(self, username, outcome, *args, **kwargs):
+        key = str(outcome.reason or outcome.path)
+        outcomes[key] = outcomes.get(key, 0) + 1
+        return await apply_outcome(self, username, outcome, *args, **kwargs)
+    poller.PollingCog.apply_outcome = count_outcome
+
+async def run(args, client: StubClient):
+    import poller
+    cog = poller.PollingCog(client)
+    await asyncio.sleep(args.duration)
+    await cog.cog_unload()
+    # Give the workers a chance to finish being cancelled.
+    await asyncio.sleep(0.5)
+    return cog
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the real poller against the replay server, and "
+        "reports how it performed.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--subscribers", type=int, default=3,
+                        help="subscribers per user")
+    parser.add_argument("--duration", type=float, default=30.0,
+                        help="seconds to poll for")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=0)
+    parser.add_argument("--live-workers", type=int, default=2)
+    parser.add_argument("--user-interval", type=float, default=0.0,
+                        help="seconds between polls of the same user")
+    parser.add_argument("--config-backend", default="json")
+    parser.add_argument("--corpus-dir", default=None,
+                        help="directory of recorded <kind>.html pages")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--please-wait-rate", type=float, default=0.02)
+    parser.add_argument("--access-denied-rate", type=float, default=0.01)
+    parser.add_argument("--reset-rate", type=float, default=0.005)
+    parser.add_argument("--upload-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report peak Python memory use (slows polling)")
+    parser.add_argument("--phase-timing", action="store_true",
+                        help="turn on the poller's own phase timing, and print "
+                        "its summary")
+    parser.add_argument("--progress", action="store_true",
+                        help="print the poller's progress characters")
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args()
+
+    server = ReplayServer(Corpus(args.corpus_dir), ReplaySettings(
+        latency=args.latency, jitter=args.jitter,
+        please_wait_rate=args.please_wait_rate,
+        access_denied_rate=args.access_denied_rate, reset_rate=args.reset_rate,
+        upload_rate=args.upload_rate, seed=args.seed))
+    server.start()
+    directory = tempfile.mkdtemp(prefix="tiktoknotifier-benchmark-")
+    set_up_directory(directory, args, server.base_url)
+    os.chdir(directory)
+
+    timer = PhaseTimer()
+    outcomes = {}
+    instrument(timer, outcomes, args.progress)
+    client = StubClient()
+    if args.trace_memory:
+        tracemalloc.start()
+    cpu_started_at = time.process_time()
+    started_at = time.monotonic()
+    cog = asyncio.run(run(args, client))
+    elapsed = time.monotonic() - started_at
+    cpu = time.process_time() - cpu_started_at
+    server.stop()
+
+    polls = sum(outcomes.values())
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    results = {
+        "polls": polls,
+        "polls-per-second": polls / elapsed,
+        "outcomes": outcomes,
+        "live-checks": cog.live_lane.checks,
+        "request-rate": cog.governor.rate,
+        "messages-sent": client.channel.sent,
+        "server-responses": server.requests,
+        "cpu-seconds": cpu,
+        "child-cpu-seconds": children.ru_utime + children.ru_stime,
+        "phase-cpu-seconds": timer.cpu,
+        "phase-calls": timer.calls,
+        "max-rss-mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss /
+            1024.0,
+        "directory": directory,
+    }
+    if args.trace_memory:
+        results["peak-traced-mib"] = tracemalloc.get_traced_memory()[1] / \
+            (1024.0 * 1024.0)
+        tracemalloc.stop()
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"\nPolls: {polls} in {elapsed:.1f}s "
+          f"({results['polls-per-second']:.1f}/s)")
+    for outcome, count in sorted(outcomes.items()):
+        print(f"- {outcome}: {count}")
+    print(f"LIVE Checks: {results['live-checks']}")
+    print(cog.governor.summarise())
+    print(f"Messages Sent: {results['messages-sent']}")
+    print(f"CPU: {cpu:.2f}s (shard processes: "
+          f"{results['child-cpu-seconds']:.2f}s)")
+    for phase, seconds in sorted(timer.cpu.items(), key=lambda item: -item[1]):
+        print(f"- {phase}: {seconds:.3f}s over {timer.calls[phase]} calls")
+    print(f"Max RSS: {results['max-rss-mib']:.1f} MiB")
+    if "peak-traced-mib" in results:
+        print(f"Peak Traced Memory: {results['peak-traced-mib']:.1f} MiB")
+    if args.phase_timing:
+        from timings import summarise_timings
+        print(summarise_timings())
+
+if __name__ == "__main__":
+    main()
@@ -29,11 +29,12 @@ from discord.ext import commands
 
 # TikTokNotifier Imports.
 from read_token import read_token
-from config import update_setting, Setting, delete_discord_user, delete_setting, \
-    get_all_users_for_discord_user, get_user_for_discord_user, \
-    get_text_for_settings, find_group_of_username
+from config import ConfigTransaction, Setting, delete_discord_user, \
+    delete_setting, get_all_users_for_discord_user, get_user_for_discord_user, \
+    get_text_for_settings, get_text_for_filter_modes, find_group_of_username
 from poller import PollingCog, GROUP_COUNT
 from stats import summarise_stats, reset_stats
+from timings import summarise_timings, timing_enabled
 
 def initialise_bot(command_prefix: str="?"):
     """Sets up and runs the bot.
@@ -82,6 +83,12 @@ def initialise_bot(command_prefix: str="?"):
                        "filters to remove the filters applied to the user. If a "
                        "user has no filters (default), all video uploads will be "
                        "reported.\n"
+                       "Use `?filtermode username [ignore-case] [whole-words]` to "
+                       "change how the user's filters are matched. "
+                       "`ignore-case` ignores differences in upper and lower "
+                       "case, and `whole-words` stops filters from matching part "
+                       "of a longer word. Give no modes to go back to the "
+                       "default, exact matching.\n"
                        "Use `?stats get [username]` to get stats on how polling is "
                        "doing (success rate, reasons for failures for each user, "
                        "etc.). If no username is given, all stats across each user "
@@ -111,27 +118,31 @@ def initialise_bot(command_prefix: str="?"):
                            "this account.")
             return
         elif option == "all":
-            update_setting(username, user_id, Setting.VIDEOS, True)
-            update_setting(username, user_id, Setting.LIVES, True)
-            delete_setting(username, user_id, Setting.MONITOR)
+            with ConfigTransaction() as transaction:
+                transaction.update(username, user_id, Setting.VIDEOS, True)
+                transaction.update(username, user_id, Setting.LIVES, True)
+                transaction.delete(username, user_id, Setting.MONITOR)
             await ctx.send(f'Okay, I will DM you when `@{username}` uploads new '
                            'videos and when they go live!')
         elif option == "videos":
-            update_setting(username, user_id, Setting.VIDEOS, True)
-            update_setting(username, user_id, Setting.LIVES, False)
-            delete_setting(username, user_id, Setting.MONITOR)
+            with ConfigTransaction() as transaction:
+                transaction.update(username, user_id, Setting.VIDEOS, True)
+                transaction.update(username, user_id, Setting.LIVES, False)
+                transaction.delete(username, user_id, Setting.MONITOR)
             await ctx.send(f'Okay, I will DM you when `@{username}` uploads new '
                            'videos, but not when they go live!')
         elif option == "lives":
-            update_setting(username, user_id, Setting.VIDEOS, False)
-            update_setting(username, user_id, Setting.LIVES, True)
-            delete_setting(username, user_id, Setting.MONITOR)
+            with ConfigTransaction() as transaction:
+                transaction.update(username, user_id, Setting.VIDEOS, False)
+                transaction.update(username, user_id, Setting.LIVES, True)
+                transaction.delete(username, user_id, Setting.MONITOR)
             await ctx.send(f'Okay, I will DM you when `@{username}` goes live, but '
                            'not when they upload new videos!')
         elif option == "monitor":
-            update_setting(username, user_id, Setting.VIDEOS, False)
-            update_setting(username, user_id, Setting.LIVES, False)
-            update_setting(username, user_id, Setting.MONITOR, True)
+            with ConfigTransaction() as transaction:
+                transaction.update(username, user_id, Setting.VIDEOS, False)
+                transaction.update(username, user_id, Setting.LIVES, False)
+                transaction.update(username, user_id, Setting.MONITOR, True)
             await ctx.send(f'Okay, I will DM you when the `@{username}` account '
                            'becomes available or unavailable.')
         elif option == "none":
@@ -161,19 +172,25 @@ def initialise_bot(command_prefix: str="?"):
         for f in filters:
             new_filters.append(f)
         if len(new_filters) == 0:
-            delete_setting(username, user_id, Setting.FILTER)
+            with ConfigTransaction() as transaction:
+                transaction.delete(username, user_id, Setting.FILTER)
+                transaction.delete(username, user_id, Setting.FILTER_IGNORE_CASE)
+                transaction.delete(username, user_id, Setting.FILTER_WHOLE_WORDS)
             await ctx.send(f"Removed the following filters from `@{username}`:\n"
                            f"```\n{old_filters}\n```")
         else:
             # If VIDEOS and LIVES settings aren't set yet, initialise them.
+            with ConfigTransaction() as transaction:
+                if Setting.VIDEOS not in settings:
+                    transaction.update(username, user_id, Setting.VIDEOS, True)
+                if Setting.LIVES not in settings:
+                    transaction.update(username, user_id, Setting.LIVES, False)
+                # Update FILTER setting.
+                transaction.update(username, user_id, Setting.FILTER,
+                                   new_filters)
             if Setting.VIDEOS not in settings:
-                update_setting(username, user_id, Setting.VIDEOS, True)
                 await ctx.send(f"You are now being notified when `@{username}` "
                                "uploads a video.")
-            if Setting.LIVES not in settings:
-                update_setting(username, user_id, Setting.LIVES, False)
-            # Update FILTER setting.
-            update_setting(username, user_id, Setting.FILTER, new_filters)
             await ctx.send(f"Added new filters to `@{username}`:\n"
                            f"```\n{new_filters}\n```\n"
                            f"Old filters:\n```\n{old_filters}\n```")
@@ -183,6 +200,37 @@ def initialise_bot(command_prefix: str="?"):
             await ctx.send("Please provide the username of the TikTok account you "
                            "want to apply filters to!")
     
+    # Setup the `filtermode` command.
+    @client.command()
+    async def filtermode(ctx, username: str, *modes: str):
+        user_id = str(ctx.author.id)
+        username = username.lower()
+        modes = set([mode.lower() for mode in modes])
+        if not modes.issubset({"ignore-case", "whole-words"}):
+            await ctx.send("The only filter modes are `ignore-case` and "
+                           "`whole-words`!")
+            return
+        settings = get_user_for_discord_user(username, user_id)
+        if Setting.FILTER not in settings:
+            await ctx.send(f"You have no filters applied to `@{username}`!")
+            return
+        with ConfigTransaction() as transaction:
+            for setting, mode in [(Setting.FILTER_IGNORE_CASE, "ignore-case"),
+                                  (Setting.FILTER_WHOLE_WORDS, "whole-words")]:
+                if mode in modes:
+                    transaction.update(username, user_id, setting, True)
+                else:
+                    transaction.delete(username, user_id, setting)
+        how = get_text_for_filter_modes("ignore-case" in modes,
+                                        "whole-words" in modes)
+        await ctx.send(f"Filters for `@{username}` will now be matched"
+                       f"{how or ' exactly'}.")
+    @filtermode.error
+    async def filtermode_error(ctx, error):
+        if isinstance(error, commands.MissingRequiredArgument):
+            await ctx.send("Please provide the username of the TikTok account "
+                           "whose filters you want to change!")
+
     # Setup the `list` command.
     @client.command()
     async def list(ctx, username=""):
@@ -203,7 +251,10 @@ def initialise_bot(command_prefix: str="?"):
                     monitor=Setting.MONITOR in settings)
                 filters = ""
                 if Setting.FILTER in settings:
-                    filters = " Filters applied to video uploads: `" \
+                    modes = get_text_for_filter_modes(
+                        settings.get(Setting.FILTER_IGNORE_CASE, False),
+                        settings.get(Setting.FILTER_WHOLE_WORDS, False))
+                    filters = f" Filters applied to video uploads{modes}: `" \
                               f"{settings[Setting.FILTER]}`."
                 alarm_setting = ""
                 if user_id == OWNER_ID:
@@ -234,7 +285,10 @@ def initialise_bot(command_prefix: str="?"):
                         monitor=Setting.MONITOR in settings)
                     filters = ""
                     if Setting.FILTER in settings:
-                        filters = " Filters applied to videos: " \
+                        modes = get_text_for_filter_modes(
+                            settings.get(Setting.FILTER_IGNORE_CASE, False),
+                            settings.get(Setting.FILTER_WHOLE_WORDS, False))
+                        filters = f" Filters applied to videos{modes}: " \
                                  f"`{settings[Setting.FILTER]}`."
                     alarm_setting = ""
                     if user_id == OWNER_ID:
@@ -255,6 +309,18 @@ def initialise_bot(command_prefix: str="?"):
         username = username.lower()
         if cmd == "get":
             msg = summarise_stats(username)
+            poller = client.get_cog("PollingCog")
+            if not username and poller is not None:
+                msg += f"\n{poller.summarise_connections()}\n" \
+                    f"{poller.dispatcher.summarise()}\n" \
+                    f"{poller.discord_objects.summarise()}\n" \
+                    f"{poller.live_lane.summarise()}\n" \
+                    f"{poller.summarise_breakers()}\n" \
+                    f"{poller.governor.summarise()}"
+            elif poller is not None and username in poller.state:
+                msg += f"\n{poller.breaker.summarise(poller.state[username])}"
+            if timing_enabled():
+                msg += f"\n{summarise_timings(username)}"
             await ctx.send(msg)
         elif cmd == "reset":
             if (user_id == OWNER_ID):
@@ -284,13 +350,15 @@ def initialise_bot(command_prefix: str="?"):
         if flag:
             # If VIDEOS and LIVES settings aren't set yet, initialise them.
             settings = get_user_for_discord_user(username, user_id)
-            if Setting.VIDEOS not in settings:
-                update_setting(username, user_id, Setting.VIDEOS, False)
+            with ConfigTransaction() as transaction:
+                if Setting.VIDEOS not in settings:
+                    transaction.update(username, user_id, Setting.VIDEOS, False)
+                if Setting.LIVES not in settings:
+                    transaction.update(username, user_id, Setting.LIVES, True)
+                transaction.update(username, user_id, Setting.ALARM, True)
             if Setting.LIVES not in settings:
-                update_setting(username, user_id, Setting.LIVES, True)
                 await ctx.send(f"You are now being notified when `@{username}` "
                                "goes LIVE.")
-            update_setting(username, user_id, Setting.ALARM, True)
         else:
             delete_setting(username, user_id, Setting.ALARM)
         await ctx.send(f"Setting `@{username}`'s alarm setting to {flag}.")
@@ -299,5 +367,32 @@ def initialise_bot(command_prefix: str="?"):
         if isinstance(error, commands.BadBoolArgument):
             await ctx.send("The second argument must be a bool parameter!")
     
+    # Setup the `workers` admin command.
+    @client.command()
+    async def workers(ctx, count: int):
+        # Only allow the maintainer of the bot to operate this command!
+        user_id = str(ctx.author.id)
+        if (user_id != OWNER_ID):
+            await ctx.send("Only the bot's owner is allowed to use this command!")
+            return
+        poller = client.get_cog("PollingCog")
+        if poller is None:
+            await ctx.send("Polling hasn't started yet!")
+            return
+        if count < 1:
+            await ctx.send("There must be at least one worker!")
+            return
+        if poller.shards is not None:
+            await ctx.send("The number of workers can't be changed whilst "
+                           "polling from multiple processes!")
+            return
+        poller.set_worker_count(count)
+        await ctx.send(f"Now polling with {count} worker/s.")
+    @workers.error
+    async def workers_error(ctx, error):
+        if isinstance(error, (commands.BadArgument,
+                              commands.MissingRequiredArgument)):
+            await ctx.send("Please provide the number of workers to poll with!")
+    
     # Launch the bot.
     client.run(TOKEN)
@@ -0,0 +1,133 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to backing off from users whose pages keep failing in the same
+way, such as accounts that are private or no longer exist.
+
+Each user has a circuit breaker, kept in their state so that it survives
+restarts. It is closed while polls succeed. Once enough polls in a row fail
+for one of the tracked reasons, it opens, and the user isn't polled again until
+their backoff has passed. The breaker is then half-open: the next poll is a
+trial, which closes it if it succeeds, or opens it again for twice as long if
+it fails for a tracked reason.
+"""
+
+from enum import StrEnum
+from time import time
+
+from stats import ReasonForFailure
+
+class BreakerState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+"""Reasons for failure that are down to the account, rather than to TikTok or
+the connection, and so are tracked by default."""
+DEFAULT_TRACKED_REASONS = [
+    ReasonForFailure.PRIVATE_ACCOUNT,
+    ReasonForFailure.PAGE_NOT_AVAILABLE,
+    ReasonForFailure.NO_CONTENT,
+    ReasonForFailure.UNKNOWN_ERROR_DIV,
+]
+
+class AccountBreaker:
+    """Updates the circuit breakers stored in users' states.
+
+    A user's breaker is stored under the "breaker" key of their state, as a dict
+    with the keys "state", "reason", "failures", and "retryAt" (the time, since
+    the epoch, that an open breaker becomes half-open). Users without the key
+    have a closed breaker.
+    """
+
+    def __init__(self, failure_threshold: int, base_backoff: float,
+                 max_backoff: float, tracked_reasons: list):
+        """
+        Parameters
+        ----------
+        failure_threshold : int
+            The number of polls in a row that must fail for the same tracked
+            reason before the breaker opens.
+        base_backoff : float
+            Seconds the breaker stays open the first time it opens. Doubles
+            each time a trial poll fails.
+        max_backoff : float
+            The longest that the breaker can stay open for, in seconds.
+        tracked_reasons : list
+            The reasons for failure that count towards opening the breaker.
+        """
+
+        assert failure_threshold > 0
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.tracked_reasons = set(tracked_reasons)
+
+    def record_failure(self, state: dict, reason: ReasonForFailure):
+        if reason not in self.tracked_reasons:
+            return
+        breaker = state.get("breaker")
+        if breaker is None or breaker["reason"] != reason:
+            breaker = {"state": BreakerState.CLOSED, "reason": reason,
+                       "failures": 0, "retryAt": 0.0}
+            state["breaker"] = breaker
+        breaker["failures"] += 1
+        excess = breaker["failures"] - self.failure_threshold
+        if excess >= 0:
+            breaker["state"] = BreakerState.OPEN
+            breaker["retryAt"] = time() + self.backoff(excess)
+
+    def record_success(self, state: dict):
+        state.pop("breaker", None)
+
+    def backoff(self, excess_failures: int) -> float:
+        # Don't let the exponent grow without bound for accounts that have been
+        # broken for a very long time.
+        return min(self.base_backoff * 2 ** min(excess_failures, 32),
+                   self.max_backoff)
+
+    def delay(self, state: dict) -> float:
+        """Returns the number of seconds until the user may be polled again, or
+        0 if they may be polled now. Moves an open breaker whose backoff has
+        passed to half-open."""
+
+        breaker = state.get("breaker")
+        if breaker is None or breaker["state"] != BreakerState.OPEN:
+            return 0.0
+        remaining = breaker["retryAt"] - time()
+        if remaining > 0:
+            return remaining
+        breaker["state"] = BreakerState.HALF_OPEN
+        return 0.0
+
+    def summarise(self, state: dict) -> str:
+        breaker = state.get("breaker")
+        if breaker is None:
+            return f"Circuit Breaker: {BreakerState.CLOSED}"
+        msg = f"Circuit Breaker: {breaker['state']} after " \
+            f"{breaker['failures']} failure/s in a row " \
+            f"({breaker['reason'].replace('-', ' ').title()})"
+        if breaker["state"] == BreakerState.OPEN:
+            remaining = max(0.0, breaker["retryAt"] - time())
+            msg += f", retrying in {remaining:.0f}s"
+        return msg
@@ -25,9 +25,15 @@ SOFTWARE.
 
 from threading import Lock
 from enum import StrEnum
+from dataclasses import dataclass
+from types import MappingProxyType
+from time import monotonic
 import json
 
-from numpy import array_split
+from options import get_option
+from config_sqlite import SQLiteConfigStorage, Operation
+from groups import GroupMembership
+from metrics import CONFIG_WRITE_DURATION
 
 class Setting(StrEnum):
     """The keys used for the settings stored in the configuration."""
@@ -36,8 +42,24 @@ class Setting(StrEnum):
     LIVES = "lives"
     ALARM = "alarm"
     FILTER = "filter"
+    FILTER_IGNORE_CASE = "filter-ignore-case"
+    FILTER_WHOLE_WORDS = "filter-whole-words"
     MONITOR = "monitor"
 
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """A read-only view of the configuration at a point in time.
+
+    A new snapshot with a higher version is published whenever the configuration
+    changes, so a reader only has to rebuild anything it derives from the
+    configuration when the version differs from the one it last saw. Snapshots
+    must never be modified.
+    """
+
+    version: int
+    usernames: tuple
+    config: MappingProxyType
+
 """Lock used to guard access to the configuration."""
 __CONFIG_LOCK = Lock()
 
@@ -47,110 +69,252 @@ __CONFIG_FILE_LOCK = Lock()
 """Path to the configuration file."""
 __CONFIG_FILE_PATH = "./config.json"
 
+"""The SQLite database the configuration is stored in, or `None` if it is stored
+in the configuration file instead."""
+global __CONFIG_DATABASE
+__CONFIG_DATABASE = None
+if get_option("config-backend", "json") == "sqlite":
+    __CONFIG_DATABASE = SQLiteConfigStorage(
+        get_option("config-database-path", "./config.db"))
+
 """Cache of the configuration."""
 global __CONFIG_CACHE
-try:
-    with open(__CONFIG_FILE_PATH, mode='r', encoding='utf-8') as f:
-        __CONFIG_CACHE = json.loads(f.read())
-except Exception as e:
-    __CONFIG_CACHE = {}
-    print(f"COULDN'T READ FROM CONFIG FILE: {e}")
+if __CONFIG_DATABASE is not None:
+    __CONFIG_CACHE = __CONFIG_DATABASE.load()
+    # Databases with rows in them were migrated before migrations were marked.
+    if __CONFIG_CACHE and not __CONFIG_DATABASE.is_migrated():
+        __CONFIG_DATABASE.mark_migrated()
+if __CONFIG_DATABASE is None or not __CONFIG_DATABASE.is_migrated():
+    try:
+        with open(__CONFIG_FILE_PATH, mode='r', encoding='utf-8') as f:
+            __CONFIG_CACHE = json.loads(f.read())
+    except Exception as e:
+        __CONFIG_CACHE = {}
+        print(f"COULDN'T READ FROM CONFIG FILE: {e}")
+    # If the database is new, migrate the configuration file into it, once.
+    if __CONFIG_DATABASE is not None:
+        __CONFIG_DATABASE.import_config(__CONFIG_CACHE)
+        print(f"Migrated {__CONFIG_FILE_PATH} into the configuration database.")
 
 """List of the configured usernames. Needs to be a list because I want a defined
 order each time it is accessed during execution."""
 __CONFIG_USERNAMES = list(__CONFIG_CACHE.keys())
 
-def __write_config():
+"""Group membership tables, keyed by group count. Each is built the first time
+it is needed, and then updated as usernames are added and removed."""
+global __CONFIG_GROUPS
+__CONFIG_GROUPS = {}
+
+def __add_username(username: str):
+    """You must have previously acquired the __CONFIG_LOCK!"""
+
+    __CONFIG_USERNAMES.append(username)
+    for membership in __CONFIG_GROUPS.values():
+        membership.add(username)
+
+def __remove_username(username: str):
+    """You must have previously acquired the __CONFIG_LOCK!"""
+
+    __CONFIG_USERNAMES.remove(username)
+    for membership in __CONFIG_GROUPS.values():
+        membership.remove(username)
+
+def __get_groups(group_count: int) -> GroupMembership:
+    """You must have previously acquired the __CONFIG_LOCK!"""
+
+    if group_count not in __CONFIG_GROUPS:
+        __CONFIG_GROUPS[group_count] = \
+            GroupMembership(group_count, __CONFIG_USERNAMES)
+    return __CONFIG_GROUPS[group_count]
+
+"""Maps each Discord user ID to the usernames it has settings for. The usernames
+are stored as dict keys so that they keep the order they were added in."""
+global __CONFIG_USER_ID_INDEX
+__CONFIG_USER_ID_INDEX = {}
+for username, subscribers in __CONFIG_CACHE.items():
+    for user_id in subscribers:
+        __CONFIG_USER_ID_INDEX.setdefault(user_id, {})[username] = None
+
+def __freeze_user(username: str) -> MappingProxyType:
+    """You must have previously acquired the __CONFIG_LOCK!"""
+
+    return MappingProxyType({user_id: MappingProxyType(dict(settings)) for
+                             user_id, settings in
+                             __CONFIG_CACHE[username].items()})
+
+"""The latest snapshot of the configuration. Replaced, never modified, so it can
+be read without acquiring the __CONFIG_LOCK."""
+global __CONFIG_SNAPSHOT
+__CONFIG_SNAPSHOT = ConfigSnapshot(0, tuple(__CONFIG_USERNAMES),
+                                   MappingProxyType({username: __freeze_user(
+                                       username) for username in
+                                       __CONFIG_USERNAMES}))
+
+def __publish_config(changed_usernames: list):
+    """Publishes a new snapshot. Only the changed usernames' settings are copied,
+    the rest are shared with the previous snapshot.
+
+    You must have previously acquired the __CONFIG_LOCK!"""
+
+    global __CONFIG_SNAPSHOT
+    config = dict(__CONFIG_SNAPSHOT.config)
+    for username in changed_usernames:
+        if username in __CONFIG_CACHE:
+            config[username] = __freeze_user(username)
+        else:
+            config.pop(username, None)
+    __CONFIG_SNAPSHOT = ConfigSnapshot(__CONFIG_SNAPSHOT.version + 1,
+                                       tuple(__CONFIG_USERNAMES),
+                                       MappingProxyType(config))
+
+def __write_config(operations: list):
+    """Persists the given operations, which have already been applied to the
+    cache. If the configuration file is being used, the whole cache is written
+    to it instead."""
+
     global __CONFIG_CACHE
     with __CONFIG_FILE_LOCK:
-        try:
-            with open(__CONFIG_FILE_PATH, mode='w', encoding='utf-8') as f:
-                f.write(json.dumps(__CONFIG_CACHE))
-        except Exception as e:
-            print(f"COULDN'T WRITE TO CONFIG FILE: {e}")
+        started_at = monotonic()
+        if __CONFIG_DATABASE is not None:
+            try:
+                __CONFIG_DATABASE.apply(operations)
+            except Exception as e:
+                print(f"COULDN'T WRITE TO CONFIG DATABASE: {e}")
+                return
+        else:
+            try:
+                with open(__CONFIG_FILE_PATH, mode='w', encoding='utf-8') as f:
+                    f.write(json.dumps(__CONFIG_CACHE))
+            except Exception as e:
+                print(f"COULDN'T WRITE TO CONFIG FILE: {e}")
+                return
+        CONFIG_WRITE_DURATION.observe(monotonic() - started_at)
 
-def update_setting(username: str, user_id: str, setting: str, value):
-    global __CONFIG_CACHE
-    global __CONFIG_USERNAMES
-    with __CONFIG_LOCK:
-        if username not in __CONFIG_CACHE:
-            __CONFIG_CACHE[username] = {}
-            __CONFIG_USERNAMES.append(username)
-        if user_id not in __CONFIG_CACHE[username]:
-            __CONFIG_CACHE[username][user_id] = {}
-        __CONFIG_CACHE[username][user_id][setting] = value
-        __write_config()
+def __index_user_id(username: str, user_id: str):
+    """You must have previously acquired the __CONFIG_LOCK!"""
 
-def delete_setting(username: str, user_id: str, setting: str):
-    global __CONFIG_CACHE
-    global __CONFIG_USERNAMES
-    with __CONFIG_LOCK:
-        if username not in __CONFIG_CACHE:
-            __CONFIG_CACHE[username] = {}
-            __CONFIG_USERNAMES.append(username)
-        if user_id not in __CONFIG_CACHE[username]:
-            __CONFIG_CACHE[username][user_id] = {}
-        if setting in __CONFIG_CACHE[username][user_id]:
-            del __CONFIG_CACHE[username][user_id][setting]
-        if not __CONFIG_CACHE[username][user_id]:
+    if username in __CONFIG_CACHE and user_id in __CONFIG_CACHE[username]:
+        __CONFIG_USER_ID_INDEX.setdefault(user_id, {})[username] = None
+    elif user_id in __CONFIG_USER_ID_INDEX:
+        __CONFIG_USER_ID_INDEX[user_id].pop(username, None)
+        if not __CONFIG_USER_ID_INDEX[user_id]:
+            del __CONFIG_USER_ID_INDEX[user_id]
+
+def __apply_operation(operation: tuple):
+    """Applies an operation to the cache.
+
+    You must have previously acquired the __CONFIG_LOCK!"""
+
+    kind, username, user_id = operation[:3]
+    if kind == Operation.DELETE_USER:
+        if username in __CONFIG_CACHE and user_id in __CONFIG_CACHE[username]:
             del __CONFIG_CACHE[username][user_id]
             if not __CONFIG_CACHE[username]:
                 del __CONFIG_CACHE[username]
-                __CONFIG_USERNAMES.remove(username)
-        __write_config()
-
-def delete_discord_user(username: str, user_id: str):
-    global __CONFIG_CACHE
-    global __CONFIG_USERNAMES
-    with __CONFIG_LOCK:
-        if username in __CONFIG_CACHE and user_id in __CONFIG_CACHE[username]:
+                __remove_username(username)
+        __index_user_id(username, user_id)
+        return
+    if username not in __CONFIG_CACHE:
+        __CONFIG_CACHE[username] = {}
+        __add_username(username)
+    if user_id not in __CONFIG_CACHE[username]:
+        __CONFIG_CACHE[username][user_id] = {}
+    if kind == Operation.UPDATE:
+        __CONFIG_CACHE[username][user_id][operation[3]] = operation[4]
+    elif kind == Operation.DELETE:
+        __CONFIG_CACHE[username][user_id].pop(operation[3], None)
+        if not __CONFIG_CACHE[username][user_id]:
             del __CONFIG_CACHE[username][user_id]
             if not __CONFIG_CACHE[username]:
                 del __CONFIG_CACHE[username]
-                __CONFIG_USERNAMES.remove(username)
-        __write_config()
+                __remove_username(username)
+    __index_user_id(username, user_id)
+
+def apply_config_operations(operations: list):
+    """Applies a list of operations to the configuration atomically: pollers
+    either see all of them or none of them, and they are persisted with a single
+    write. Each operation is a tuple (Operation, username, user_id[, setting[,
+    value]])."""
+
+    if not operations:
+        return
+    with __CONFIG_LOCK:
+        for operation in operations:
+            __apply_operation(operation)
+        __publish_config(list(dict.fromkeys([operation[1] for operation in
+                                             operations])))
+        __write_config(operations)
+
+class ConfigTransaction:
+    """Collects changes to the configuration, then applies them all at once
+    when the `with` block exits. Nothing is applied if the block raises."""
+
+    def __init__(self):
+        self.operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def update(self, username: str, user_id: str, setting: str, value):
+        self.operations.append(
+            (Operation.UPDATE, username, user_id, setting, value))
+
+    def delete(self, username: str, user_id: str, setting: str):
+        self.operations.append((Operation.DELETE, username, user_id, setting))
+
+    def delete_discord_user(self, username: str, user_id: str):
+        self.operations.append((Operation.DELETE_USER, username, user_id))
+
+    def commit(self):
+        operations = self.operations
+        self.operations = []
+        apply_config_operations(operations)
+
+def update_setting(username: str, user_id: str, setting: str, value):
+    apply_config_operations(
+        [(Operation.UPDATE, username, user_id, setting, value)])
+
+def delete_setting(username: str, user_id: str, setting: str):
+    apply_config_operations([(Operation.DELETE, username, user_id, setting)])
+
+def delete_discord_user(username: str, user_id: str):
+    apply_config_operations([(Operation.DELETE_USER, username, user_id)])
 
 def get_all_users_for_discord_user(user_id: str):
-    global __CONFIG_CACHE
-    # On small scales, this is fine. But on larger scales, it would be better if
-    # the user_id -> username mapping was cached separately.
     return_dict = {}
     with __CONFIG_LOCK:
-        for username in __CONFIG_CACHE:
-            for discord_user_id, settings in __CONFIG_CACHE[username].items():
-                if user_id == discord_user_id:
-                    return_dict[username] = settings
+        config = __CONFIG_SNAPSHOT.config
+        for username in __CONFIG_USER_ID_INDEX.get(user_id, ()):
+            return_dict[username] = config[username][user_id]
     return return_dict
 
 def get_user_for_discord_user(username: str, user_id: str):
-    global __CONFIG_CACHE
-    with __CONFIG_LOCK:
-        if username in __CONFIG_CACHE and user_id in __CONFIG_CACHE[username]:
-            return __CONFIG_CACHE[username][user_id]
+    """Returns the user's settings for the given username. They are read-only,
+    and won't change if the configuration is changed afterwards."""
+
+    config = __CONFIG_SNAPSHOT.config
+    if username in config and user_id in config[username]:
+        return config[username][user_id]
     return {}
 
-def get_usernames_and_config():
-    global __CONFIG_CACHE
-    global __CONFIG_USERNAMES
-    with __CONFIG_LOCK:
-        return (__CONFIG_USERNAMES.copy(), __CONFIG_CACHE.copy())
+def get_config_snapshot() -> ConfigSnapshot:
+    """Returns the latest snapshot of the configuration without locking."""
 
-def get_username_group_and_config(group_number: int, group_count: int):
-    assert group_count >= 1
-    assert group_number >= 0 and group_number < group_count
-    global __CONFIG_CACHE
-    global __CONFIG_USERNAMES
-    with __CONFIG_LOCK:
-        username_groups = array_split(__CONFIG_USERNAMES.copy(), group_count)
-        return (username_groups[group_number].tolist(), __CONFIG_CACHE.copy())
+    return __CONFIG_SNAPSHOT
 
 def find_group_of_username(username: str, group_count: int) -> tuple:
+    """Returns tuple (group number, index within group, group size), or
+    `(None, None, None)` if the username isn't configured. The index can change
+    whenever a username is removed, so it should only be displayed."""
+
     assert group_count >= 1
-    for group_number in range(group_count):
-        username_group, _ = get_username_group_and_config(group_number, group_count)
-        if username in username_group:
-            return group_number, username_group.index(username), len(username_group)
-    return None, None, None
+    with __CONFIG_LOCK:
+        return __get_groups(group_count).find(username)
 
 def get_text_for_settings(videos: bool, lives: bool, monitor: bool):
     if monitor:
@@ -161,3 +325,11 @@ def get_text_for_settings(videos: bool, lives: bool, monitor: bool):
         return "videos"
     elif lives:
         return "lives"
+
+def get_text_for_filter_modes(ignore_case: bool, whole_words: bool):
+    modes = []
+    if ignore_case:
+        modes.append("ignoring case")
+    if whole_words:
+        modes.append("whole words only")
+    return f" ({', '.join(modes)})" if modes else ""
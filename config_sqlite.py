@@ -0,0 +1,131 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to storing the configuration in an SQLite database, instead of
+`config.json`."""
+
+from enum import StrEnum
+import json
+import sqlite3
+
+class Operation(StrEnum):
+    """The kinds of change that can be made to the configuration."""
+
+    UPDATE = "update"
+    DELETE = "delete"
+    DELETE_USER = "delete-user"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    username TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    setting TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (username, user_id, setting)
+);
+CREATE INDEX IF NOT EXISTS settings_by_username ON settings (username);
+CREATE INDEX IF NOT EXISTS settings_by_user_id ON settings (user_id);
+"""
+
+"""The `user_version` of a database that `config.json` has been migrated into."""
+MIGRATED_VERSION = 1
+
+class SQLiteConfigStorage:
+    """Stores each setting of each subscription as its own row, so that a
+    change only has to write the rows it affects.
+
+    Not thread-safe: the caller must serialise access to it.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def load(self) -> dict:
+        """Returns the configuration in the same layout as `config.json`, with
+        usernames in the order they were first added."""
+
+        config = {}
+        for username, user_id, setting, value in self.connection.execute(
+            "SELECT username, user_id, setting, value FROM settings "
+            "ORDER BY rowid"):
+            config.setdefault(username, {}).setdefault(user_id, {})[setting] = \
+                json.loads(value)
+        return config
+
+    def is_migrated(self) -> bool:
+        """Returns `True` if `config.json` has already been migrated into the
+        database, even if every subscription has been removed since."""
+
+        return self.connection.execute("PRAGMA user_version").fetchone()[0] >= \
+            MIGRATED_VERSION
+
+    def import_config(self, config: dict):
+        """One-time migration from the contents of `config.json`. Marks the
+        database as migrated in the same transaction, so that a crash part way
+        through leaves neither the rows nor the mark."""
+
+        with self.connection:
+            for username, subscribers in config.items():
+                for user_id, settings in subscribers.items():
+                    for setting, value in settings.items():
+                        self.__execute((Operation.UPDATE, username, user_id,
+                                        setting, value))
+            self.__mark_migrated()
+
+    def mark_migrated(self):
+        with self.connection:
+            self.__mark_migrated()
+
+    def __mark_migrated(self):
+        # PRAGMA arguments can't be bound as parameters.
+        self.connection.execute(f"PRAGMA user_version = {MIGRATED_VERSION}")
+
+    def apply(self, operations: list):
+        """Applies a list of operations in a single transaction. Each operation
+        is a tuple (Operation, username, user_id[, setting[, value]])."""
+
+        with self.connection:
+            for operation in operations:
+                self.__execute(operation)
+
+    def __execute(self, operation: tuple):
+        kind, username, user_id = operation[:3]
+        if kind == Operation.UPDATE:
+            self.connection.execute(
+                "INSERT INTO settings (username, user_id, setting, value) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (username, user_id, "
+                "setting) DO UPDATE SET value = excluded.value",
+                (username, user_id, operation[3], json.dumps(operation[4])))
+        elif kind == Operation.DELETE:
+            self.connection.execute(
+                "DELETE FROM settings WHERE username = ? AND "
+                "user_id = ? AND setting = ?",
+                (username, user_id, operation[3]))
+        elif kind == Operation.DELETE_USER:
+            self.connection.execute(
+                "DELETE FROM settings WHERE username = ? AND "
+                "user_id = ?", (username, user_id))
@@ -0,0 +1,138 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to caching the Discord objects that notifications and error
+logs are sent to, so that they don't have to be fetched from Discord's API
+every time."""
+
+from collections import OrderedDict
+from time import monotonic
+
+from metrics import DISCORD_OBJECT_LOOKUPS
+
+class TTLCache:
+    """A cache that holds at most `max_size` items, evicting the least recently
+    used first, and forgets items `ttl` seconds after they were stored."""
+
+    def __init__(self, max_size: int, ttl: float):
+        assert max_size > 0
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (expiry time, value)
+        self.items = OrderedDict()
+
+    def get(self, key):
+        """Returns `None` if the key isn't cached or has expired."""
+
+        item = self.items.get(key)
+        if item is None:
+            return None
+        if item[0] <= monotonic():
+            del self.items[key]
+            return None
+        self.items.move_to_end(key)
+        return item[1]
+
+    def put(self, key, value):
+        self.items[key] = (monotonic() + self.ttl, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def forget(self, key):
+        self.items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+class DiscordObjectCache:
+    """Resolves user IDs to DM channels, and channel IDs to channels.
+
+    The client's gateway cache is checked first, as it costs nothing. Only if
+    the object isn't there is it fetched from the API and cached here. If
+    sending to an object fails, it should be forgotten so that it is fetched
+    again next time.
+    """
+
+    def __init__(self, client, max_size: int, ttl: float):
+        self.client = client
+        self.dm_channels = TTLCache(max_size, ttl)
+        self.channels = TTLCache(max_size, ttl)
+        self.lookups = 0
+        self.hits = 0
+        self.fetches = 0
+
+    def record_lookup(self, source: str):
+        """`source` is "cache" if the object was cached here, "gateway" if it
+        was in the client's cache, or "api" if it had to be fetched."""
+
+        self.lookups += 1
+        if source == "cache":
+            self.hits += 1
+        DISCORD_OBJECT_LOOKUPS.inc(source)
+
+    async def get_dm_channel(self, user_id: str):
+        channel = self.dm_channels.get(user_id)
+        if channel is not None:
+            self.record_lookup("cache")
+            return channel
+        fetches = self.fetches
+        user = self.client.get_user(int(user_id))
+        if user is None:
+            self.fetches += 1
+            user = await self.client.fetch_user(int(user_id))
+        channel = user.dm_channel
+        if channel is None:
+            self.fetches += 1
+            channel = await user.create_dm()
+        self.record_lookup("gateway" if self.fetches == fetches else "api")
+        self.dm_channels.put(user_id, channel)
+        return channel
+
+    async def get_channel(self, channel_id: str):
+        channel = self.channels.get(channel_id)
+        if channel is not None:
+            self.record_lookup("cache")
+            return channel
+        channel = self.client.get_channel(int(channel_id))
+        if channel is None:
+            self.fetches += 1
+            channel = await self.client.fetch_channel(int(channel_id))
+            self.record_lookup("api")
+        else:
+            self.record_lookup("gateway")
+        self.channels.put(channel_id, channel)
+        return channel
+
+    def forget_dm_channel(self, user_id: str):
+        self.dm_channels.forget(user_id)
+
+    def forget_channel(self, channel_id: str):
+        self.channels.forget(channel_id)
+
+    def summarise(self) -> str:
+        cached = len(self.dm_channels) + len(self.channels)
+        hit_rate = self.hits / self.lookups * 100.0 if self.lookups else 0.0
+        return f"Discord Objects Cached: {cached} " \
+            f"(hit rate {hit_rate:.1f}% over {self.lookups} lookup/s, " \
+            f"{self.fetches} API fetch/es)"
@@ -0,0 +1,217 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to delivering notifications to Discord users in the background,
+so that polling never has to wait for them."""
+
+import asyncio
+from dataclasses import dataclass
+from time import monotonic
+
+from discord import HTTPException, Forbidden, NotFound
+
+from latency import LatencyHistogram
+from metrics import NOTIFICATIONS
+
+@dataclass
+class Notification:
+    user_id: str
+    message: str
+    queued_at: float
+    attempts: int = 0
+
+def is_transient(e: Exception) -> bool:
+    """Returns `True` if a failed delivery is worth retrying."""
+
+    if isinstance(e, (Forbidden, NotFound)):
+        # The user has blocked DMs from the bot, or no longer exists.
+        return False
+    if isinstance(e, HTTPException):
+        return e.status == 429 or e.status >= 500
+    # Anything else is most likely a connection problem.
+    return True
+
+class RateLimiter:
+    """A token bucket shared by every sender, so that they can't exceed the
+    given rate between them."""
+
+    def __init__(self, rate: float, burst: int):
+        assert rate > 0 and burst > 0
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate: float):
+        """Tokens added up until now are kept, and are added at the new rate
+        from now on."""
+
+        assert rate > 0
+        self.refill()
+        self.rate = rate
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self.refill()
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+class NotificationDispatcher:
+    """Queues notifications and delivers them with a pool of sender tasks."""
+
+    def __init__(self, send, sender_count: int, rate: float, max_attempts: int,
+                 retry_delay: float):
+        """
+        Parameters
+        ----------
+        send : coroutine function
+            Called with (user_id, message) to deliver a notification.
+        sender_count : int
+            The number of notifications that can be delivered at once.
+        rate : float
+            The maximum number of deliveries started per second.
+        max_attempts : int
+            The number of times to try delivering a notification before giving
+            up on it.
+        retry_delay : float
+            Seconds to wait before the first retry. Doubles with each retry.
+        """
+
+        assert sender_count > 0 and max_attempts > 0
+        self.send = send
+        self.sender_count = sender_count
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.rate_limiter = RateLimiter(rate, sender_count)
+        self.queue = asyncio.Queue()
+        self.senders = []
+        # Handle -> notification, for notifications that are waiting to be
+        # retried.
+        self.retry_handles = {}
+        self.peak_depth = 0
+        self.delivered = 0
+        self.retried = 0
+        self.dropped = 0
+        self.latency = LatencyHistogram()
+
+    def start(self):
+        for _ in range(self.sender_count):
+            self.senders.append(asyncio.create_task(self.sender()))
+
+    def stop(self):
+        """Anything still queued is dropped. Call `drain()` first to avoid
+        that."""
+
+        for sender in self.senders:
+            sender.cancel()
+        self.senders.clear()
+        for handle in self.retry_handles:
+            handle.cancel()
+        self.retry_handles.clear()
+
+    async def drain(self, timeout: float) -> int:
+        """Waits up to `timeout` seconds for every queued notification to be
+        delivered. Notifications waiting to be retried are retried straight
+        away. Returns the number that are still waiting to be delivered."""
+
+        deadline = monotonic() + timeout
+        while True:
+            for handle, notification in self.retry_handles.items():
+                handle.cancel()
+                self.__put(notification)
+            self.retry_handles.clear()
+            # Also waits for the notifications that are being sent right now.
+            try:
+                await asyncio.wait_for(self.queue.join(),
+                                       deadline - monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not self.retry_handles:
+                break
+        return self.queue_depth()
+
+    def enqueue(self, user_id: str, message: str):
+        """Queues a notification. Never blocks."""
+
+        self.__put(Notification(user_id, message, monotonic()))
+
+    def __put(self, notification: Notification):
+        self.queue.put_nowait(notification)
+        self.peak_depth = max(self.peak_depth, self.queue.qsize())
+
+    def __retry_later(self, notification: Notification):
+        delay = self.retry_delay * 2 ** (notification.attempts - 1)
+        handle = None
+        def retry():
+            self.retry_handles.pop(handle, None)
+            self.__put(notification)
+        handle = asyncio.get_running_loop().call_later(delay, retry)
+        self.retry_handles[handle] = notification
+
+    async def sender(self):
+        while True:
+            notification = await self.queue.get()
+            try:
+                await self.rate_limiter.acquire()
+                notification.attempts += 1
+                await self.send(notification.user_id, notification.message)
+                self.delivered += 1
+                NOTIFICATIONS.inc("delivered")
+                self.latency.record(monotonic() - notification.queued_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if is_transient(e) and \
+                    notification.attempts < self.max_attempts:
+                    self.retried += 1
+                    NOTIFICATIONS.inc("retried")
+                    self.__retry_later(notification)
+                else:
+                    self.dropped += 1
+                    NOTIFICATIONS.inc("dropped")
+                    print(f"COULDN'T DM {notification.user_id} AFTER "
+                          f"{notification.attempts} ATTEMPT/S: {e}")
+            finally:
+                self.queue.task_done()
+
+    def queue_depth(self) -> int:
+        """The number of notifications waiting to be delivered, including those
+        waiting to be retried."""
+
+        return self.queue.qsize() + len(self.retry_handles)
+
+    def summarise(self) -> str:
+        return f"Notifications Queued: {self.queue_depth()} (peak " \
+            f"{self.peak_depth})\nNotifications Delivered: {self.delivered} " \
+            f"(retried {self.retried}, dropped {self.dropped})\n" \
+            f"Notification Latency: {self.latency.summarise()}"
@@ -0,0 +1,175 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to matching video captions against subscribers' filters."""
+
+from collections import deque
+
+from config import Setting
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+class Automaton:
+    """An Aho-Corasick automaton, which finds every occurrence of any number of
+    phrases in a single pass over a text."""
+
+    def __init__(self, phrases: list):
+        # Each state is a dict of character -> next state.
+        self.transitions = [{}]
+        self.fail = [0]
+        # The indices of the phrases that end at each state.
+        self.outputs = [[]]
+        self.lengths = [len(phrase) for phrase in phrases]
+        for i, phrase in enumerate(phrases):
+            state = 0
+            for char in phrase:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            self.outputs[state].append(i)
+        # Breadth-first, so that a state's fail link is always set before its
+        # children's.
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = \
+                    self.transitions[fallback].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.outputs[next_state] += self.outputs[self.fail[next_state]]
+
+    def find(self, text: str):
+        """Yields tuple (phrase index, start, end) for each occurrence."""
+
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(char, 0)
+            for i in self.outputs[state]:
+                yield i, position + 1 - self.lengths[i], position + 1
+
+class CaptionMatcher:
+    """Matches a caption against every filter that the subscribers of one
+    username have, in one pass."""
+
+    def __init__(self, subscribers: dict):
+        """
+        Parameters
+        ----------
+        subscribers : dict
+            Maps each user ID with filters to their settings.
+        """
+
+        # Subscribers with an empty filter phrase match every caption.
+        self.always = set()
+        # (ignore case, whole words) -> phrase -> user IDs.
+        phrases = {}
+        for user_id, settings in subscribers.items():
+            ignore_case = settings.get(Setting.FILTER_IGNORE_CASE, False)
+            whole_words = settings.get(Setting.FILTER_WHOLE_WORDS, False)
+            for phrase in settings[Setting.FILTER]:
+                if ignore_case:
+                    phrase = phrase.lower()
+                if not phrase:
+                    self.always.add(user_id)
+                    continue
+                phrases.setdefault((ignore_case, whole_words), {}) \
+                    .setdefault(phrase, set()).add(user_id)
+        self.user_count = len(subscribers)
+        # Case sensitive phrases are searched for in the caption, and case
+        # insensitive ones in the lower case caption, by separate automatons.
+        self.automatons = {}
+        for ignore_case in (False, True):
+            entries = []
+            for whole_words in (False, True):
+                for phrase, user_ids in \
+                    phrases.get((ignore_case, whole_words), {}).items():
+                    entries.append((phrase, whole_words, user_ids))
+            if entries:
+                self.automatons[ignore_case] = (
+                    Automaton([phrase for phrase, _, _ in entries]), entries)
+
+    def match(self, caption: str) -> set:
+        """Returns the user IDs whose filters match the caption."""
+
+        matched = set(self.always)
+        for ignore_case, (automaton, entries) in self.automatons.items():
+            text = caption.lower() if ignore_case else caption
+            for i, start, end in automaton.find(text):
+                phrase, whole_words, user_ids = entries[i]
+                if whole_words and \
+                    ((start > 0 and is_word_char(text[start - 1])) or
+                     (end < len(text) and is_word_char(text[end]))):
+                    continue
+                matched |= user_ids
+                if len(matched) == self.user_count:
+                    return matched
+        return matched
+
+class CaptionMatcherCache:
+    """Keeps a `CaptionMatcher` for each username whose subscribers have
+    filters.
+
+    Relies on configuration snapshots sharing the settings of usernames that
+    haven't changed, so that only the matchers of changed usernames have to be
+    rebuilt.
+    """
+
+    def __init__(self):
+        self.matchers = {}
+        # username -> the settings each matcher was built from.
+        self.sources = {}
+
+    def refresh(self, config):
+        for username in list(self.sources.keys()):
+            if username not in config:
+                del self.sources[username]
+                self.matchers.pop(username, None)
+        for username, subscribers in config.items():
+            if self.sources.get(username) is subscribers:
+                continue
+            self.sources[username] = subscribers
+            filtered = {user_id: settings for user_id, settings in
+                        subscribers.items() if Setting.FILTER in settings}
+            if filtered:
+                self.matchers[username] = CaptionMatcher(filtered)
+            else:
+                self.matchers.pop(username, None)
+
+    def match(self, username: str, caption: str) -> set:
+        """Returns the user IDs subscribed to the username whose filters match
+        the caption."""
+
+        if username not in self.matchers:
+            return set()
+        return self.matchers[username].match(caption)
@@ -0,0 +1,135 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to detecting user pages that haven't changed since they were
+last parsed."""
+
+from hashlib import blake2b
+import re
+
+"""The parts of a user page that we read from. If none of them are in a page,
+it can't be fingerprinted. Each marker is paired with whether the whole div it
+is in is included in the fingerprint, or only whether the marker is there."""
+REGION_MARKERS = [
+    (b'data-e2e="user-post-item-list"', True),
+    (b'DivErrorContainer', True),
+    (b'SpanLiveBadge', False),
+]
+
+"""Matches the opening and closing tags of divs."""
+DIV_TAG = re.compile(rb'<(/?)div\b', re.IGNORECASE)
+
+def find_enclosing_div(content: bytes, position: int):
+    """Returns tuple (start, end) of the div whose opening tag contains the
+    given position, including its closing tag, or `None` if it isn't closed."""
+
+    start = content.rfind(b'<div', 0, position)
+    if start < 0:
+        return None
+    depth = 0
+    for tag in DIV_TAG.finditer(content, start):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return start, content.find(b'>', tag.end()) + 1
+    return None
+
+def fingerprint_page(content: bytes):
+    """Hashes the parts of a user page that we read from. Returns `None` if
+    there is nothing in the page to hash, or if part of it is missing."""
+
+    digest = blake2b(digest_size=16)
+    found_any = False
+    for marker, whole_div in REGION_MARKERS:
+        position = content.find(marker)
+        if position < 0:
+            digest.update(b'\0')
+            continue
+        found_any = True
+        digest.update(b'\1')
+        if whole_div:
+            # The whole div has to be hashed, or a change towards its end,
+            # such as a video being deleted, would go unnoticed.
+            region = find_enclosing_div(content, position)
+            if region is None:
+                return None
+            digest.update(content[region[0]:region[1]])
+    return digest.hexdigest() if found_any else None
+
+class PageFingerprintCache:
+    """Remembers what each user's page looked like the last time it was
+    parsed successfully.
+
+    Where TikTok provides `ETag` or `Last-Modified` headers, they are sent back
+    so that an unchanged page doesn't have to be downloaded at all. Otherwise,
+    the relevant parts of the page are hashed, but only if the whole page was
+    received: a page that was cut short could be missing the parts that
+    changed.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def conditional_headers(self, username: str) -> dict:
+        """Returns the headers to send with the next request for this user."""
+
+        entry = self.entries.get(username)
+        if entry is None:
+            return {}
+        headers = {}
+        if entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last-modified"] is not None:
+            headers["If-Modified-Since"] = entry["last-modified"]
+        return headers
+
+    def is_unchanged(self, username: str, response) -> bool:
+        entry = self.entries.get(username)
+        if entry is None:
+            return False
+        if response.status_code == 304:
+            return True
+        return entry["digest"] is not None and response.complete and \
+            entry["digest"] == fingerprint_page(response.content)
+
+    @staticmethod
+    def fingerprint(response) -> dict:
+        """Returns what needs to be remembered about a page. Small enough to be
+        sent between processes."""
+
+        return {
+            "etag": response.headers.get("ETag"),
+            "last-modified": response.headers.get("Last-Modified"),
+            "digest": fingerprint_page(response.content) if response.complete
+                else None,
+        }
+
+    def remember(self, username: str, response):
+        """Call once a page has been parsed successfully."""
+
+        self.remember_fingerprint(username, self.fingerprint(response))
+
+    def remember_fingerprint(self, username: str, fingerprint: dict):
+        self.entries[username] = fingerprint
+
+    def forget(self, username: str):
+        self.entries.pop(username, None)
@@ -0,0 +1,147 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to adapting how fast users' pages are requested to how TikTok
+is responding.
+
+Every poll worker and LIVE worker takes a token from one shared bucket before
+each request.
+The bucket's rate is controlled by additive increase, multiplicative decrease
+(AIMD): whilst responses are clean, the rate climbs slowly back towards its
+ceiling, and as soon as too many responses are "Access Denied" or "Please
+wait...", it is cut sharply.
+"""
+
+from time import monotonic
+
+from stats import ReasonForFailure
+from dispatch import RateLimiter
+
+"""Reasons for failure that mean TikTok wants us to slow down."""
+THROTTLE_REASONS = {ReasonForFailure.ACCESS_DENIED,
+                    ReasonForFailure.PLEASE_WAIT}
+
+class RateGovernor:
+    """Adjusts a shared request rate between a floor and a ceiling, using
+    AIMD."""
+
+    def __init__(self, max_rate: float, min_rate: float, increase: float,
+                 decrease: float, threshold: float, adjust_interval: float,
+                 on_change=None):
+        """
+        Parameters
+        ----------
+        max_rate : float
+            The ceiling, in requests per second. The rate starts here.
+        min_rate : float
+            The floor, in requests per second.
+        increase : float
+            Added to the rate after each clean adjustment interval.
+        decrease : float
+            The rate is multiplied by this when it is cut.
+        threshold : float
+            The fraction of responses within an adjustment interval that must
+            be throttled before the rate is cut.
+        adjust_interval : float
+            Seconds between adjustments. The rate can be cut before the interval
+            is up if enough responses are throttled.
+        on_change : function
+            If given, called with the new rate whenever it changes.
+
+        Only `local_share` of the rate is given to this process' own bucket. The
+        rest is left for `on_change` to hand out to other processes.
+        """
+
+        assert 0 < min_rate <= max_rate
+        assert 0 < decrease < 1
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.threshold = threshold
+        self.adjust_interval = adjust_interval
+        self.on_change = on_change
+        self.rate = max_rate
+        self.local_share = 1.0
+        self.limiter = RateLimiter(max_rate, 1)
+        self.responses = 0
+        self.throttled = 0
+        self.interval_started_at = monotonic()
+        self.increases = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        """Waits until the next request may be made."""
+
+        await self.limiter.acquire()
+
+    def record(self, reason: ReasonForFailure):
+        """Records how a request went. `reason` is `None` if it succeeded."""
+
+        now = monotonic()
+        self.responses += 1
+        if reason in THROTTLE_REASONS:
+            self.throttled += 1
+        fraction = self.throttled / self.responses
+        if now - self.interval_started_at < self.adjust_interval:
+            # Don't wait out the interval if TikTok is clearly throttling us,
+            # but don't cut the rate over a single unlucky response either.
+            if self.throttled < 2 or fraction <= self.threshold:
+                return
+        if fraction > self.threshold:
+            self.decreases += 1
+            self.set_rate(self.rate * self.decrease)
+        elif self.throttled == 0 and self.rate < self.max_rate:
+            self.increases += 1
+            self.set_rate(self.rate + self.increase)
+        self.responses = 0
+        self.throttled = 0
+        self.interval_started_at = now
+
+    def set_rate(self, rate: float):
+        rate = min(max(rate, self.min_rate), self.max_rate)
+        if rate == self.rate:
+            return
+        self.rate = rate
+        self.limiter.set_rate(rate * self.local_share)
+        if self.on_change is not None:
+            self.on_change(rate)
+
+    def set_local_share(self, local_share: float):
+        assert 0 < local_share <= 1
+        self.local_share = local_share
+        self.limiter.set_rate(self.rate * local_share)
+
+    def set_max_rate(self, max_rate: float):
+        """Moves the ceiling, scaling the current rate with it so that an
+        unthrottled rate stays at the ceiling."""
+
+        max_rate = max(max_rate, self.min_rate)
+        rate = self.rate * max_rate / self.max_rate
+        self.max_rate = max_rate
+        self.set_rate(rate)
+
+    def summarise(self) -> str:
+        return f"Request Rate: {self.rate:.2f}/s (ceiling {self.max_rate:.2f}/s, " \
+            f"floor {self.min_rate:.2f}/s; cut {self.decreases} time/s, raised " \
+            f"{self.increases} time/s)"
@@ -0,0 +1,89 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to splitting usernames into groups."""
+
+from hashlib import blake2b
+
+def rendezvous_group(username: str, group_count: int) -> int:
+    """Assigns a username to a group using rendezvous hashing.
+
+    A username's group only depends on the username and the number of groups,
+    so it doesn't change when other usernames are added or removed. It is also
+    the same in every process, unlike Python's built-in `hash()`.
+    """
+
+    def score(group_number: int) -> int:
+        digest = blake2b(f"{group_number}:{username}".encode('utf-8'),
+                         digest_size=8)
+        return int.from_bytes(digest.digest(), 'big')
+
+    return max(range(group_count), key=score)
+
+class GroupMembership:
+    """Keeps track of which group each username is in, and where it is within
+    that group.
+
+    A username's group never changes, but its index within the group isn't
+    stable: removing a username moves another into its place.
+    """
+
+    def __init__(self, group_count: int, usernames: list):
+        assert group_count >= 1
+        self.group_count = group_count
+        self.groups = [[] for _ in range(group_count)]
+        # username -> (group number, index within group)
+        self.positions = {}
+        for username in usernames:
+            self.add(username)
+
+    def add(self, username: str):
+        if username in self.positions:
+            return
+        group_number = rendezvous_group(username, self.group_count)
+        self.positions[username] = (group_number,
+                                    len(self.groups[group_number]))
+        self.groups[group_number].append(username)
+
+    def remove(self, username: str):
+        """Moves the last username in the group into the removed username's
+        place, so nothing else has to move. The moved username's index changes,
+        and the group is no longer in the order the usernames were added."""
+
+        if username not in self.positions:
+            return
+        group_number, index = self.positions.pop(username)
+        group = self.groups[group_number]
+        last_username = group.pop()
+        if last_username != username:
+            group[index] = last_username
+            self.positions[last_username] = (group_number, index)
+
+    def find(self, username: str) -> tuple:
+        """Returns tuple (group number, index within group, group size), or
+        `(None, None, None)` if the username isn't in any group."""
+
+        if username not in self.positions:
+            return None, None, None
+        group_number, index = self.positions[username]
+        return group_number, index, len(self.groups[group_number])
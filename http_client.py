@@ -0,0 +1,225 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to the HTTP connections used to poll TikTok."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from weakref import WeakSet
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from profile_page import PageScanner
+
+# urllib3 will only decode brotli responses if one of these is installed, so
+# only ask for them if it is.
+try:
+    import brotli
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+"""Used if `headers.json` doesn't provide a user agent."""
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) " \
+    "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+"""The number of bytes to read from a response at a time."""
+CHUNK_SIZE = 16 * 1024
+
+@dataclass
+class StreamedPage:
+    """A user's page, which may have been cut short once the `PageScanner`
+    found everything it needed."""
+
+    status_code: int
+    headers: dict
+    scanner: PageScanner
+    complete: bool
+
+    @property
+    def content(self) -> bytes:
+        return self.scanner.content
+
+    @property
+    def markers(self) -> set:
+        return self.scanner.markers
+
+    @property
+    def profile(self):
+        return self.scanner.profile
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+class FetchExecutor:
+    """The threads that every HTTP client in a process receives pages on.
+
+    Each worker only fetches one page at a time, so there is a thread for each
+    worker. Threads are only started once they are needed.
+    """
+
+    def __init__(self, size: int):
+        assert size > 0
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size,
+                                           thread_name_prefix="fetch")
+
+    def resize(self, size: int):
+        """Only ever grows, as idle threads cost next to nothing. Pages that
+        are already being received finish on the old threads."""
+
+        if size <= self.size:
+            return
+        old_executor = self.executor
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size,
+                                           thread_name_prefix="fetch")
+        old_executor.shutdown(wait=False)
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+class PollerHTTPClient:
+    """A HTTP session owned by a single poll worker.
+
+    Connections are kept alive between polls, so that the TLS handshake only
+    has to be carried out when a connection is opened for the first time, or
+    after TikTok closes it.
+    """
+
+    def __init__(self, executor: FetchExecutor, pool_size: int,
+                 connect_timeout: float, read_timeout: float,
+                 early_exit: bool=True, drain_limit: int=0):
+        """
+        Parameters
+        ----------
+        executor : FetchExecutor
+            Shared by every client in the process. Should have a thread for
+            each client.
+        pool_size : int
+            The maximum number of connections kept alive per host.
+        connect_timeout : float
+            Seconds to wait for a connection to be established.
+        read_timeout : float
+            Seconds to wait between bytes received from the server.
+        early_exit : bool
+            If `True`, a response's connection is closed as soon as we have
+            everything we need from it. If `False`, the rest of the response
+            is read and thrown away so that the connection can be reused.
+        drain_limit : int
+            Even if `early_exit` is `True`, the rest of a response is read and
+            thrown away if no more than this many bytes of it remain, as that
+            is cheaper than opening a new connection.
+        """
+
+        assert pool_size > 0
+        self.timeout = (connect_timeout, read_timeout)
+        self.early_exit = early_exit
+        self.drain_limit = drain_limit
+        self.executor = executor
+        self.session = Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                   max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.headers["User-Agent"] = DEFAULT_USER_AGENT
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self.session.headers["Connection"] = "keep-alive"
+        # urllib3's own counts miss connections that are closed and then
+        # reconnected, so every socket a request is sent on is remembered
+        # instead. A reconnected connection has a new socket.
+        self.sockets = WeakSet()
+        self.opened = 0
+        self.requests = 0
+
+    async def fetch_page(self, url: str, username: str, cookies=None,
+                         headers=None, scanner_class=PageScanner) -> StreamedPage:
+        return await self.executor.run(self.stream_page, url, username,
+                                       cookies, headers, scanner_class)
+
+    def stream_page(self, url: str, username: str, cookies=None,
+                    headers=None, scanner_class=PageScanner) -> StreamedPage:
+        """Blocking. Receives a user's page, scanning it as it arrives with an
+        instance of `scanner_class`."""
+
+        scanner = scanner_class(username)
+        complete = True
+        with self.session.get(url, cookies=cookies, headers=headers,
+                              timeout=self.timeout, stream=True) as response:
+            self.record_connection(response)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                scanner.feed(chunk)
+                if scanner.done:
+                    complete = False
+                    break
+            if not complete and self.should_drain(response):
+                for _ in response.iter_content(CHUNK_SIZE):
+                    pass
+            return StreamedPage(response.status_code, response.headers,
+                                scanner, complete)
+
+    def should_drain(self, response) -> bool:
+        """Returns `True` if the rest of a response that is no longer needed
+        should be received, so that its connection can be reused."""
+
+        if not self.early_exit:
+            return True
+        try:
+            # Both count the bytes as they were sent, before decompression.
+            remaining = int(response.headers["Content-Length"]) - \
+                response.raw.tell()
+        except (KeyError, ValueError):
+            # The length isn't known, so the rest could be any size.
+            return False
+        return remaining <= self.drain_limit
+
+    def record_connection(self, response):
+        """Blocking. Counts a request, and the connection it was sent on if it
+        was opened for it."""
+
+        self.requests += 1
+        connection = getattr(response.raw, "connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None and sock not in self.sockets:
+            self.sockets.add(sock)
+            self.opened += 1
+
+    def connection_counts(self) -> tuple[int, int]:
+        """Returns tuple (connections opened, requests that reused an existing
+        connection)."""
+
+        return self.opened, max(self.requests - self.opened, 0)
+
+    async def close(self):
+        self.session.close()
@@ -0,0 +1,130 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Fixed-size structures for recording poll latencies and success rates, so
+that memory use doesn't grow with uptime."""
+
+from bisect import bisect_left
+from math import inf
+
+"""The upper bound of each latency bucket, in seconds."""
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, inf]
+
+class LatencyHistogram:
+    """Counts latency samples in fixed buckets."""
+
+    def __init__(self, counts: list=None):
+        if counts is None or len(counts) != len(LATENCY_BUCKETS):
+            counts = [0] * len(LATENCY_BUCKETS)
+        self.counts = counts
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def add(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, fraction: float):
+        """Estimates a percentile by interpolating within its bucket. Returns
+        `None` if there are no samples."""
+
+        total = self.total()
+        if total == 0:
+            return None
+        target = fraction * total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count > 0 and seen + count >= target:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i]
+                if upper == inf:
+                    return lower
+                return lower + (upper - lower) * (target - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-2]
+
+    def summarise(self) -> str:
+        if self.total() == 0:
+            return "N/A"
+        return ", ".join(["p{}: {:.2f}s".format(name, self.percentile(fraction))
+                          for name, fraction in [(50, 0.5), (95, 0.95),
+                                                 (99, 0.99)]])
+
+class RollingCounter:
+    """Counts successes and failures over a sliding window, using a ring of
+    fixed-width slots."""
+
+    def __init__(self, slot_count: int, slot_seconds: float):
+        self.slot_seconds = slot_seconds
+        self.successes = [0] * slot_count
+        self.failures = [0] * slot_count
+        # The slot number that each index of the ring was last used for.
+        self.slot_numbers = [-1] * slot_count
+
+    def __slot(self, now: float) -> int:
+        slot_number = int(now // self.slot_seconds)
+        i = slot_number % len(self.slot_numbers)
+        if self.slot_numbers[i] != slot_number:
+            self.slot_numbers[i] = slot_number
+            self.successes[i] = 0
+            self.failures[i] = 0
+        return i
+
+    def record(self, success: bool, now: float):
+        i = self.__slot(now)
+        if success:
+            self.successes[i] += 1
+        else:
+            self.failures[i] += 1
+
+    def totals(self, now: float) -> tuple[int, int]:
+        """Returns tuple (successes, failures) within the window."""
+
+        oldest = int(now // self.slot_seconds) - len(self.slot_numbers) + 1
+        successes = 0
+        failures = 0
+        for i, slot_number in enumerate(self.slot_numbers):
+            if slot_number >= oldest:
+                successes += self.successes[i]
+                failures += self.failures[i]
+        return successes, failures
+
+    def summarise(self, now: float) -> str:
+        successes, failures = self.totals(now)
+        if successes + failures == 0:
+            return "N/A"
+        return "{:.2f}% of {}".format(
+            successes / (successes + failures) * 100.0, successes + failures)
+
+def new_rolling_counters() -> dict:
+    """Returns the rolling counters that are kept for each user, and for all
+    users combined."""
+
+    return {
+        "minute": RollingCounter(60, 1.0),
+        "hour": RollingCounter(60, 60.0),
+    }
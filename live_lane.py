@@ -0,0 +1,159 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to checking whether users are LIVE, separately from polling
+their profile pages for uploads."""
+
+import asyncio
+from time import monotonic
+
+from config import get_config_snapshot
+from stats import ReasonForFailure
+from scheduler import PollScheduler
+from http_client import PollerHTTPClient
+from profile_page import LiveScanner, PageMarker
+from latency import LatencyHistogram, new_rolling_counters
+from metrics import LIVE_CHECKS
+
+class LiveLane:
+    """Checks users for LIVE status with its own workers and schedule.
+
+    Pages are only scanned up to the part that reveals whether their user is
+    LIVE. Whether the rest is received follows the cog's streaming options.
+    Checks share the cog's request rate with polls.
+    The lane owns the `isLive`, `wasLive` and `lastLiveAt` fields of each user's
+    state.
+    """
+
+    def __init__(self, cog, url: str, worker_count: int, check_interval: float,
+                 worker_interval: float):
+        """
+        Parameters
+        ----------
+        cog : PollingCog
+            Provides the cookies, headers, state and notifications.
+        url : str
+            The page to check, with `{username}` in place of the username.
+        worker_count : int
+            The number of users that can be checked at once.
+        check_interval : float
+            Seconds between checks of the same user.
+        worker_interval : float
+            Seconds each worker waits between its checks.
+        """
+
+        assert worker_count > 0
+        self.cog = cog
+        self.url = url
+        self.worker_count = worker_count
+        self.check_interval = check_interval
+        self.worker_interval = worker_interval
+        self.scheduler = PollScheduler()
+        self.workers = []
+        self.checks = 0
+        self.failures = {}
+        self.latency = LatencyHistogram()
+        self.rolling = new_rolling_counters()
+
+    def start(self):
+        for worker_number in range(self.worker_count):
+            self.workers.append(asyncio.create_task(self.worker(worker_number)))
+
+    def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers.clear()
+
+    def sync(self, usernames):
+        self.scheduler.sync(usernames)
+
+    async def worker(self, worker_number: int):
+        http_client = PollerHTTPClient(self.cog.fetch_executor,
+                                       self.cog.HTTP_POOL_SIZE,
+                                       self.cog.CONNECT_TIMEOUT,
+                                       self.cog.READ_TIMEOUT,
+                                       self.cog.STREAM_EARLY_EXIT,
+                                       self.cog.STREAM_DRAIN_LIMIT)
+        try:
+            while True:
+                username = await self.scheduler.get()
+                await self.cog.governor.acquire()
+                started_at = monotonic()
+                try:
+                    reason = await self.check(username, http_client)
+                except Exception as e:
+                    print(f"EXCEPTION IN LIVE WORKER {worker_number + 1}: {e}")
+                    reason = ReasonForFailure.CONNECTION_BROKEN
+                finally:
+                    self.scheduler.reschedule(username, self.check_interval)
+                self.record(reason, monotonic() - started_at)
+                self.cog.print_char('!' if reason else 'L', worker_number)
+                await asyncio.sleep(self.worker_interval)
+        finally:
+            await http_client.close()
+
+    async def check(self, username: str, http_client: PollerHTTPClient):
+        """Returns the reason the check failed, or `None` if it succeeded."""
+
+        page = await http_client.fetch_page(
+            self.url.format(username=username), username,
+            cookies=self.cog.cookies, headers=self.cog.headers,
+            scanner_class=LiveScanner)
+        if PageMarker.ACCESS_DENIED in page.markers:
+            return ReasonForFailure.ACCESS_DENIED
+        if PageMarker.PLEASE_WAIT in page.markers:
+            return ReasonForFailure.PLEASE_WAIT
+        is_live = page.scanner.is_live
+        if is_live is None:
+            return ReasonForFailure.LIVE_STATUS_UNKNOWN
+        config = get_config_snapshot().config
+        if username not in config:
+            return None
+        was_live, is_live = self.cog.update_live_state(username, is_live)
+        if was_live != is_live:
+            self.cog.notify_live(config, username, is_live)
+        return None
+
+    def record(self, reason: ReasonForFailure, seconds: float):
+        self.checks += 1
+        LIVE_CHECKS.inc("failure" if reason else "success")
+        self.cog.governor.record(reason)
+        if reason:
+            self.failures[reason] = self.failures.get(reason, 0) + 1
+        self.latency.record(seconds)
+        now = monotonic()
+        for counter in self.rolling.values():
+            counter.record(not reason, now)
+
+    def summarise(self) -> str:
+        now = monotonic()
+        failures = "".join([f"\n- {reason}: {count}" for reason, count in
+                            self.failures.items()])
+        return f"LIVE Checks: {self.checks} " \
+            f"(users queued: {len(self.scheduler.usernames)})\n" \
+            f"LIVE Check Success (last minute): " \
+            f"{self.rolling['minute'].summarise(now)}\n" \
+            f"LIVE Check Success (last hour): " \
+            f"{self.rolling['hour'].summarise(now)}\n" \
+            f"LIVE Check Latency: {self.latency.summarise()}\n" \
+            f"LIVE Check Failures: {sum(self.failures.values())}{failures}"
@@ -0,0 +1,266 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to exposing the bot's metrics in Prometheus' text format.
+
+Metrics are updated as things happen, so serving them only has to format the
+current values. They are served over HTTP if the `metrics-port` option is
+given.
+"""
+
+import asyncio
+from bisect import bisect_left
+from threading import Lock
+
+"""The upper bound of each duration bucket, in seconds. Prometheus adds the
++Inf bucket itself."""
+DURATION_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0,
+                    8.0, 16.0, 32.0]
+
+"""The upper bound of each bucket of time between polls of the same user, in
+seconds."""
+INTERVAL_BUCKETS = [10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0,
+                    3600.0, 7200.0]
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace("\"", "\\\"")
+
+def format_labels(label_names: tuple, label_values: tuple, extra: str="") -> str:
+    pairs = [f"{name}=\"{escape_label_value(value)}\"" for name, value in
+             zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A metric, with a value for each combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, label_names: tuple=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.lock = Lock()
+        # tuple of label values -> value
+        self.values = {}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}"
+                         f"{format_labels(self.label_names, label_values)} "
+                         f"{format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + \
+                amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+class CallbackGauge(Metric):
+    """A gauge whose value is read from a function when it is served. The
+    function should be cheap, as it's called on every scrape."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.callback = None
+
+    def set_callback(self, callback):
+        """Pass `None` to stop serving the gauge."""
+
+        with self.lock:
+            self.callback = callback
+
+    def render(self) -> list:
+        with self.lock:
+            callback = self.callback
+        if callback is None:
+            return []
+        return [f"# HELP {self.name} {self.description}",
+                f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {format_value(callback())}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: list,
+                 label_names: tuple=()):
+        super().__init__(name, description, label_names)
+        self.buckets = buckets
+
+    def observe(self, value: float, *label_values):
+        with self.lock:
+            if label_values not in self.values:
+                # Count in each bucket, the +Inf bucket, then the sum.
+                self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry = self.values[label_values]
+            entry[bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}",
+                 f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            values = [(label_values, list(entry)) for label_values, entry in
+                      self.values.items()]
+        for label_values, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], entry):
+                cumulative += count
+                labels = format_labels(self.label_names, label_values,
+                                       f"le=\"{format_value(float(bound))}\"")
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+POLLS = Counter("tiktoknotifier_polls_total",
+                "Polls of users' pages, by result.", ("result",))
+POLLS_SERVED = Counter("tiktoknotifier_polls_served_total",
+                       "Successful polls, by which part of the poller found "
+                       "the result.", ("path",))
+POLL_FAILURES = Counter("tiktoknotifier_poll_failures_total",
+                        "Failed polls, by reason.", ("reason",))
+POLL_DURATION = Histogram("tiktoknotifier_poll_duration_seconds",
+                          "How long each poll took, from start to finish.",
+                          DURATION_BUCKETS)
+USER_POLL_INTERVAL = Histogram("tiktoknotifier_user_poll_interval_seconds",
+                               "Time between the starts of successive polls "
+                               "of the same user, by the user's group.",
+                               INTERVAL_BUCKETS, ("group",))
+LIVE_CHECKS = Counter("tiktoknotifier_live_checks_total",
+                      "LIVE checks, by result.", ("result",))
+NOTIFICATIONS = Counter("tiktoknotifier_notifications_total",
+                        "Notification delivery attempts, by result.",
+                        ("result",))
+DISCORD_OBJECT_LOOKUPS = Counter("tiktoknotifier_discord_object_lookups_total",
+                                 "Lookups of the Discord channels that "
+                                 "messages are sent to, by where the channel "
+                                 "was found.", ("source",))
+STATE_FLUSH_DURATION = Histogram("tiktoknotifier_state_flush_seconds",
+                                 "How long each write of the state file took.",
+                                 DURATION_BUCKETS)
+STATS_FLUSH_DURATION = Histogram("tiktoknotifier_stats_flush_seconds",
+                                 "How long each write of the stats file took.",
+                                 DURATION_BUCKETS)
+CONFIG_WRITE_DURATION = Histogram("tiktoknotifier_config_write_seconds",
+                                  "How long each write of the configuration "
+                                  "took.", DURATION_BUCKETS)
+EVENT_LOOP_LAG = Histogram("tiktoknotifier_event_loop_lag_seconds",
+                           "How late the event loop woke up a sleeping task.",
+                           DURATION_BUCKETS)
+SCHEDULER_QUEUED = CallbackGauge("tiktoknotifier_scheduler_queued_users",
+                                 "Users waiting in the poll scheduler.")
+SCHEDULER_OVERDUE = CallbackGauge("tiktoknotifier_scheduler_overdue_seconds",
+                                  "How long the most overdue user has been "
+                                  "waiting to be polled.")
+LIVE_QUEUED = CallbackGauge("tiktoknotifier_live_queued_users",
+                            "Users waiting in the LIVE lane's scheduler.")
+NOTIFICATION_QUEUE_DEPTH = CallbackGauge(
+    "tiktoknotifier_notification_queue_depth",
+    "Notifications waiting to be delivered, including those waiting to be "
+    "retried.")
+REQUEST_RATE = CallbackGauge("tiktoknotifier_request_rate",
+                             "The rate, in requests per second, that users' "
+                             "pages may currently be polled at.")
+
+"""Every metric, in the order they are served."""
+ALL_METRICS = [POLLS, POLLS_SERVED, POLL_FAILURES, POLL_DURATION,
+               USER_POLL_INTERVAL, LIVE_CHECKS, NOTIFICATIONS,
+               DISCORD_OBJECT_LOOKUPS,
+               STATE_FLUSH_DURATION, STATS_FLUSH_DURATION, CONFIG_WRITE_DURATION,
+               EVENT_LOOP_LAG, SCHEDULER_QUEUED, SCHEDULER_OVERDUE, LIVE_QUEUED,
+               NOTIFICATION_QUEUE_DEPTH, REQUEST_RATE]
+
+def render_metrics() -> str:
+    lines = []
+    for metric in ALL_METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serves the metrics at `/metrics` over plain HTTP, from the event loop."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host,
+                                                 self.port)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5.0)
+            # Skip the headers, as nothing in them matters.
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5.0)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == "GET" and \
+                parts[1].split("?")[0] == "/metrics":
+                status = "200 OK"
+                body = render_metrics().encode('utf-8')
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; "
+                         f"version=0.0.4; charset=utf-8\r\nContent-Length: "
+                         f"{len(body)}\r\nConnection: close\r\n\r\n"
+                         .encode('latin-1') + body)
+            await writer.drain()
+        except Exception as e:
+            print(f"COULDN'T SERVE METRICS: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,51 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to reading the bot's tunable options."""
+
+import json
+
+"""Path to the options file."""
+__OPTIONS_FILE_PATH = "./options.json"
+
+"""Cache of the options. They are only read once, when the bot starts."""
+global __OPTIONS_CACHE
+try:
+    with open(__OPTIONS_FILE_PATH, mode='r', encoding='utf-8') as f:
+        __OPTIONS_CACHE = json.loads(f.read())
+except Exception as e:
+    __OPTIONS_CACHE = {}
+    print(f"Could not read options, using defaults: {e}")
+
+def get_option(name: str, default):
+    """Retrieves an option from `options.json`.
+
+    Parameters
+    ----------
+    name : str
+        The key of the option.
+    default
+        The value to return if the option hasn't been given.
+    """
+
+    return __OPTIONS_CACHE.get(name, default)
@@ -0,0 +1,283 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to fetching and parsing a user's page. Nothing here depends on
+the bot, so it can run in a separate process."""
+
+from dataclasses import dataclass
+from itertools import islice
+
+from stats import ReasonForFailure, PollPath
+from http_client import PollerHTTPClient, StreamedPage
+from fingerprint import PageFingerprintCache
+from profile_page import ElementIndex, PageMarker
+from timings import Phase, span, new_timings
+
+"""The markers that a page's DOM is only searched for if it contains."""
+DOM_MARKERS = {PageMarker.ERROR_CONTAINER, PageMarker.VIDEO_LIST}
+
+@dataclass
+class PollOutcome:
+    """The result of polling a user's page.
+
+    If `reason` is `None`, the poll succeeded. `videos` is a list of tuples
+    (video ID, caption), or `None` if the page hasn't changed since it was last
+    parsed successfully.
+    """
+
+    reason: ReasonForFailure = None
+    message: str = ""
+    # The primary error string, if the reason is an unknown error div.
+    detail: str = None
+    # `False` if the failure isn't worth logging.
+    log: bool = True
+    path: PollPath = None
+    videos: list = None
+    is_available: bool = True
+    # Not sent between processes.
+    page: StreamedPage = None
+    # Phase -> seconds spent fetching and parsing, if timing is on.
+    timings: dict = None
+    # What to remember about the page once the outcome has been applied, if it
+    # was fetched by another process.
+    fingerprint: dict = None
+
+    def compact(self):
+        """Returns a copy without the page, for sending to another process."""
+
+        fingerprint = PageFingerprintCache.fingerprint(self.page) if \
+            self.reason is None and self.page is not None else None
+        return PollOutcome(self.reason, self.message, self.detail, self.log,
+                           self.path, self.videos, self.is_available,
+                           timings=self.timings, fingerprint=fingerprint)
+
+    @property
+    def page_text(self):
+        return self.page.text if self.page is not None else None
+
+def check_for_error_div(index: ElementIndex):
+    """Returns empty list if there was no error div. Returns a list
+    of error strings if there was an error div."""
+
+    error_elements = index.find_by_class_substring('DivErrorContainer')
+    if len(error_elements) > 0:
+        return [p.text_content() for p in error_elements[0].iter('p')]
+    return []
+
+def classify_error_div(primary_error_string: str) -> ReasonForFailure:
+    estr = primary_error_string.strip().lower()
+    if "something went wrong" in estr:
+        return ReasonForFailure.SOMETHING_WENT_WRONG
+    elif "no content" in estr:
+        return ReasonForFailure.NO_CONTENT
+    elif "page not available" in estr:
+        return ReasonForFailure.PAGE_NOT_AVAILABLE
+    elif "private" in estr:
+        return ReasonForFailure.PRIVATE_ACCOUNT
+    else:
+        return ReasonForFailure.UNKNOWN_ERROR_DIV
+
+def find_videos(username: str, index: ElementIndex):
+    """Returns tuple (list of tuples (video ID, caption) in the order the
+    page lists them, error string, reason for failure)."""
+
+    # First, find the div containing all the user's videos.
+    video_list = index.find_by_data_e2e("user-post-item-list")
+    if len(video_list) == 0:
+        return [], f"Could not retrieve video list for @{username}!", \
+            ReasonForFailure.USER_POST_ITEM_LIST
+    video_list = video_list[0]
+    
+    # Then, retrieve the list of videos within that div. The first div is the
+    # list itself.
+    if len(list(islice(video_list.iter('div'), 2))) < 2:
+        return [], f"Could not retrieve videos within video list for " \
+                   f"@{username}!", ReasonForFailure.USER_POST_ITEM_LIST_DIV
+    
+    # Find every video's div, and every description div. A video's
+    # description is in the closest enclosing div that has one.
+    video_divs = index.find_by_data_e2e("user-post-item", within=video_list)
+    if len(video_divs) == 0:
+        return [], f"Could not find video div for @{username}! " \
+                   f"{video_divs}", ReasonForFailure.USER_POST_ITEM
+    desc_divs = {}
+    for desc_div in index.find_by_data_e2e("user-post-item-desc",
+                                           within=video_list):
+        for ancestor in desc_div.iterancestors():
+            if ancestor is video_list:
+                break
+            desc_divs.setdefault(ancestor, desc_div)
+    
+    # Extract each video's ID and description. The title attribute should
+    # still be present even if the caption is blank. If any video can't be
+    # read, the poll fails: the user's recent videos are compared with the
+    # last poll's, so a missing video would be reported as deleted, and then
+    # as a new upload once it could be read again.
+    videos = []
+    failure = None
+    for video_div in video_divs:
+        video_link = next(video_div.iter('a'), None)
+        if video_link == None or video_link.get('href') is None:
+            failure = failure or (f"Could not extract video link for "
+                f"@{username}! {video_link}", ReasonForFailure.NO_VIDEO_LINK)
+            continue
+        desc_div = None
+        for ancestor in video_div.iterancestors():
+            if ancestor is video_list or ancestor in desc_divs:
+                desc_div = desc_divs.get(ancestor)
+                break
+        if desc_div is None:
+            failure = failure or (f"Could not find video desc div for "
+                f"@{username}!", ReasonForFailure.USER_POST_ITEM_DESC)
+            continue
+        video_desc_link = next(desc_div.iter('a'), None)
+        if video_desc_link == None or video_desc_link.get('title') is None:
+            failure = failure or (f"Could not extract video desc for "
+                f"@{username}! {video_desc_link}",
+                ReasonForFailure.NO_VIDEO_DESC)
+            continue
+        video_id = video_link.get('href')[video_link.get('href').rfind('/')+1:]
+        try:
+            videos.append((int(video_id), video_desc_link.get('title')))
+        except Exception as e:
+            failure = failure or (f"Could not convert video ID to int for "
+                f"@{username}! {video_id}. {e}",
+                ReasonForFailure.FAULTY_VIDEO_LINK)
+    if failure is not None:
+        return [], failure[0], failure[1]
+    return videos, "", None
+
+async def poll_page(username: str, url: str, monitor_account: bool,
+                    http_client: PollerHTTPClient,
+                    fingerprints: PageFingerprintCache, cookies=None,
+                    headers=None) -> PollOutcome:
+    """Fetches and parses a user's page.
+
+    Parameters
+    ----------
+    username : str
+        The user to poll.
+    url : str
+        The user's page.
+    monitor_account : bool
+        `True` if we are only monitoring whether this account exists, instead of
+        reporting its uploads.
+    http_client : PollerHTTPClient
+        The client to fetch the page with.
+    fingerprints : PageFingerprintCache
+        Used to skip parsing the page if it hasn't changed. The caller should
+        remember the page once a successful outcome has been applied.
+    cookies, headers
+        Sent with the request.
+    """
+
+    # Submit GET request.
+    timings = new_timings()
+    conditional_headers = fingerprints.conditional_headers(username)
+    if headers is not None:
+        conditional_headers = {**headers, **conditional_headers}
+    try:
+        with span(Phase.FETCH, timings=timings):
+            page = await http_client.fetch_page(url, username, cookies=cookies,
+                                                headers=conditional_headers)
+    except Exception as e:
+        return PollOutcome(ReasonForFailure.CONNECTION_BROKEN,
+                           f"Connection broke when polling for @{username}: {e}",
+                           timings=timings)
+    with span(Phase.PARSE, timings=timings):
+        outcome = parse_page(username, page, monitor_account, fingerprints)
+    outcome.timings = timings
+    return outcome
+
+def parse_page(username: str, page: StreamedPage, monitor_account: bool,
+               fingerprints: PageFingerprintCache) -> PollOutcome:
+    """Finds a user's videos in their page, or the reason they couldn't be
+    found. See `poll_page()`."""
+
+    # Is TikTok beginning to deny access? In which case, ignore this request.
+    if PageMarker.ACCESS_DENIED in page.markers:
+        return PollOutcome(ReasonForFailure.ACCESS_DENIED,
+                           f"Access denied when polling for @{username}!",
+                           page=page)
+    
+    # In a similar vein, TikTok can have brief periods where it responds with an
+    # incomplete web page that contains "Please wait..." Seems like something is
+    # going wrong with the JavaScript. Rendering the page doesn't work, so we
+    # will have to skip polls until it stops...
+    if PageMarker.PLEASE_WAIT in page.markers:
+        return PollOutcome(ReasonForFailure.PLEASE_WAIT, log=False)
+
+    # If the page hasn't changed since it was last parsed successfully, then
+    # neither has anything we would find in it.
+    if fingerprints.is_unchanged(username, page):
+        return PollOutcome(path=PollPath.UNCHANGED)
+    
+    is_available = True
+    
+    # Try to read the page from the data TikTok embeds within it first, as it
+    # is much quicker than searching the DOM. The page scanner will have
+    # already done this whilst the page was being received. If that wasn't
+    # possible, fall back to the DOM.
+    profile = page.profile
+    if profile is not None:
+        path = PollPath.HYDRATION
+        error_strings = [profile.error_string] if profile.error_string else []
+    else:
+        # If there is an element which has the 'DivErrorContainer', then
+        # something is wrong with the page. Could be that it is a private
+        # account, or the account doesn't exist, or they haven't uploaded
+        # anything yet. Report it in the console and move on to the next user.
+        # If the page scanner saw the whole page and found neither an error div
+        # nor a video list, there's no point parsing it to look for them.
+        path = PollPath.DOM
+        index = ElementIndex(page.content) if not page.complete or \
+            page.markers & DOM_MARKERS else ElementIndex(b"")
+        error_strings = check_for_error_div(index) if not page.complete or \
+            PageMarker.ERROR_CONTAINER in page.markers else []
+    if len(error_strings) > 0:
+        if monitor_account and \
+            "couldn't find this account" in error_strings[0].strip().lower():
+            is_available = False
+        else:
+            reason = classify_error_div(error_strings[0])
+            return PollOutcome(reason, f"Couldn't retrieve latest uploads for "
+                               f"@{username}: {error_strings}",
+                               error_strings[0] if reason ==
+                               ReasonForFailure.UNKNOWN_ERROR_DIV else None,
+                               page=page)
+    
+    # Find the videos' IDs and captions. If they couldn't be found, ignore this
+    # user.
+    # There can be cases where a different error div besides "couldn't find
+    # account" is returned for an unavailable account that we are monitoring,
+    # which case it is a failed poll and we need to catch it here. Otherwise,
+    # we aren't interested in these values when monitoring an account.
+    videos = []
+    if profile is not None:
+        videos = profile.videos
+    elif not monitor_account or is_available:
+        videos, error_string, reason = find_videos(username, index)
+        if len(error_string) > 0:
+            return PollOutcome(reason, error_string, page=page)
+    return PollOutcome(path=path, videos=videos, is_available=is_available,
+                       page=page)
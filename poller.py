@@ -23,25 +23,57 @@ SOFTWARE.
 
 """Polling cog to be added to the Discord bot."""
 
+import asyncio
 import traceback
 import json
+from time import time, monotonic
 from subprocess import run
-from threading import Lock
 from http.cookies import SimpleCookie
 from requests.cookies import RequestsCookieJar
 
 from discord import File
 from discord.ext import tasks, commands
-from requests_html import AsyncHTMLSession
 
-from config import get_usernames_and_config, get_username_group_and_config, Setting
-from stats import ReasonForFailure, record_successful_poll, record_failed_poll, \
-    remove_user
+from config import get_config_snapshot, ConfigSnapshot, Setting
+from stats import ReasonForFailure, record_successful_poll, \
+    record_failed_poll, remove_user, flush_stats, record_poll_latency
+from options import get_option
+from scheduler import PollScheduler, calculate_poll_interval
+from http_client import FetchExecutor, PollerHTTPClient
+from fingerprint import PageFingerprintCache
+from state_store import StateStore
+from page_poll import PollOutcome, poll_page
+from dispatch import NotificationDispatcher
+from discord_cache import DiscordObjectCache
+from filters import CaptionMatcherCache
+from live_lane import LiveLane
+from shard import ShardCoordinator
+from timings import Phase, span, new_timings, record_timings, \
+    remove_user_timings, flush_timings
+from groups import rendezvous_group
+from breaker import AccountBreaker, BreakerState, DEFAULT_TRACKED_REASONS
+from governor import RateGovernor
+from metrics import MetricsServer, POLLS, POLLS_SERVED, POLL_FAILURES, \
+    POLL_DURATION, USER_POLL_INTERVAL, STATE_FLUSH_DURATION, \
+    STATS_FLUSH_DURATION, EVENT_LOOP_LAG, SCHEDULER_QUEUED, SCHEDULER_OVERDUE, \
+    LIVE_QUEUED, NOTIFICATION_QUEUE_DEPTH, REQUEST_RATE
 
 global GROUP_COUNT
-GROUP_COUNT = 2
+GROUP_COUNT = get_option("group-count", 2)
 assert GROUP_COUNT > 0
 
+"""The number of workers to start polling with. Can be changed at runtime using
+`PollingCog.set_worker_count()`."""
+global WORKER_COUNT
+WORKER_COUNT = get_option("worker-count", 4)
+assert WORKER_COUNT > 0
+
+"""If greater than 0, users' pages are polled by this many separate processes
+instead of by workers in the bot's process."""
+global PROCESS_COUNT
+PROCESS_COUNT = get_option("process-count", 0)
+assert PROCESS_COUNT >= 0
+
 class PollingCog(commands.Cog):
     def __init__(self, client):
         self.client = client
@@ -54,15 +86,12 @@ class PollingCog(commands.Cog):
         except Exception as e:
             print(f"Could not load log channel ID: {e}")
 
-        # Load state.
-        self.STATE_FILE_PATH = "./state.json"
-        self.state_lock = Lock()
-        try:
-            with open(self.STATE_FILE_PATH, mode='r', encoding='utf-8') as f:
-                self.state = json.loads(f.read())
-        except Exception as e:
-            self.state = {}
-            print(f"COULDN'T LOAD STATE: {e}")
+        # Load state. It is written to disk every STATE_FLUSH_INTERVAL seconds,
+        # or sooner if enough users' states have changed.
+        self.STATE_FLUSH_INTERVAL = get_option("state-flush-interval", 10.0)
+        self.state_store = StateStore("./state.json",
+                                      get_option("state-flush-threshold", 50))
+        self.state = self.state_store.state
 
         # Load cookies: https://stackoverflow.com/a/49865026.
         self.raw_cookies = ""
@@ -77,24 +106,202 @@ class PollingCog(commands.Cog):
         except Exception as e:
             print(f"Could not read headers! {e}")
 
-        # Start polling.
-        self.GROUP_COLOURS = [
+        # Start polling. Each worker waits POLL_INTERVAL seconds between its
+        # polls. Each user waits between MIN_USER_INTERVAL and MAX_USER_INTERVAL
+        # seconds between their polls, depending on how active they are.
+        self.WORKER_COLOURS = [
             "\x1B[1;33m", # Yellow.
             "\x1B[1;36m", # Cyan.
+            "\x1B[1;35m", # Magenta.
+            "\x1B[1;32m", # Green.
         ]
-        assert len(self.GROUP_COLOURS) == GROUP_COUNT
-        self.poller_username_counters = [0] * GROUP_COUNT
-        self.session = [AsyncHTMLSession()] * GROUP_COUNT
-        self.poller_group1.start()
-        self.poller_group2.start()
+        self.POLL_INTERVAL = get_option("poll-interval", 3.0)
+        self.BASE_USER_INTERVAL = get_option("base-user-interval", 300.0)
+        self.MIN_USER_INTERVAL = get_option("min-user-interval", 30.0)
+        self.MAX_USER_INTERVAL = get_option("max-user-interval", 3600.0)
+        self.USER_INTERVAL_OVERRIDES = get_option("user-interval-overrides", {})
+        self.PROFILE_URL = get_option("profile-url",
+                                      "https://www.tiktok.com/@{username}")
+        self.RECENT_VIDEO_COUNT = get_option("recent-video-count", 10)
+        # Users whose pages keep failing for the same reason are backed off.
+        self.breaker = AccountBreaker(
+            get_option("breaker-failure-threshold", 3),
+            get_option("breaker-base-backoff", 600.0),
+            get_option("breaker-max-backoff", 86400.0),
+            get_option("breaker-reasons", DEFAULT_TRACKED_REASONS))
+        self.scheduler = PollScheduler()
+        self.HTTP_POOL_SIZE = get_option("http-pool-size", 2)
+        self.CONNECT_TIMEOUT = get_option("connect-timeout", 5.0)
+        self.READ_TIMEOUT = get_option("read-timeout", 15.0)
+        self.STREAM_EARLY_EXIT = get_option("stream-early-exit", True)
+        self.STREAM_DRAIN_LIMIT = get_option("stream-drain-limit", 256 * 1024)
+        self.http_clients = {}
+        self.page_fingerprints = PageFingerprintCache()
+        self.retired_connection_counts = (0, 0)
+        self.workers = {}
+        self.worker_target = 0
+        self.config_version = None
+        self.discord_objects = DiscordObjectCache(
+            client, get_option("discord-cache-size", 1024),
+            get_option("discord-cache-ttl", 3600.0))
+        # Notifications are delivered in the background, so that a user with
+        # many subscribers doesn't hold up polling.
+        self.dispatcher = NotificationDispatcher(
+            self.DM, get_option("dispatch-senders", 4),
+            get_option("dispatch-rate", 10.0),
+            get_option("dispatch-max-attempts", 5),
+            get_option("dispatch-retry-delay", 2.0))
+        self.DISPATCH_DRAIN_TIMEOUT = get_option("dispatch-drain-timeout", 10.0)
+        self.dispatcher.start()
+        self.monitored_usernames = set()
+        self.caption_matchers = CaptionMatcherCache()
+        # LIVE status is checked separately, and more often, than uploads.
+        self.live_lane = LiveLane(
+            self, get_option("live-check-url",
+                             "https://www.tiktok.com/@{username}/live"),
+            get_option("live-worker-count", 2),
+            get_option("live-check-interval", 60.0),
+            get_option("live-poll-interval", 1.0))
+        # Every poll worker and LIVE worker shares one request rate, which backs
+        # off when TikTok starts throttling us. By default, its ceiling is the
+        # rate the workers would make requests at if nothing else held them up,
+        # and follows the number of workers.
+        self.MAX_REQUEST_RATE = get_option("max-request-rate", None)
+        poll_rate, live_rate = self.get_unthrottled_request_rates(
+            WORKER_COUNT * max(PROCESS_COUNT, 1))
+        self.governor = RateGovernor(
+            self.MAX_REQUEST_RATE or poll_rate + live_rate,
+            get_option("min-request-rate", 0.05),
+            get_option("request-rate-increase", 0.05),
+            get_option("request-rate-decrease", 0.5),
+            get_option("request-rate-threshold", 0.05),
+            get_option("request-rate-adjust-interval", 10.0),
+            self.on_request_rate_change)
+        # Every poll worker and LIVE worker in this process receives pages on
+        # the same threads.
+        self.fetch_executor = FetchExecutor(self.live_lane.worker_count +
+                                            (WORKER_COUNT if PROCESS_COUNT == 0
+                                             else 0))
+        # Poll users' pages from separate processes, if configured to.
+        self.shards = None
+        if PROCESS_COUNT > 0:
+            self.shards = ShardCoordinator(PROCESS_COUNT, {
+                "worker-count": WORKER_COUNT,
+                "poll-interval": self.POLL_INTERVAL,
+                "profile-url": self.PROFILE_URL,
+                "http-pool-size": self.HTTP_POOL_SIZE,
+                "connect-timeout": self.CONNECT_TIMEOUT,
+                "read-timeout": self.READ_TIMEOUT,
+                "stream-early-exit": self.STREAM_EARLY_EXIT,
+                "stream-drain-limit": self.STREAM_DRAIN_LIMIT,
+                "raw-cookies": self.raw_cookies,
+                "headers": self.headers,
+                "request-rate": poll_rate / (poll_rate + live_rate) *
+                    self.governor.rate / PROCESS_COUNT,
+            }, self.handle_shard_outcome)
+            # This process only makes LIVE checks.
+            self.governor.set_local_share(live_rate / (poll_rate + live_rate))
+            self.shards.start()
+        # When each user's latest poll started, for measuring the time between
+        # polls of the same user.
+        self.poll_started_at = {}
+        # Serve metrics, if configured to.
+        self.metrics_server = None
+        metrics_port = get_option("metrics-port", 0)
+        if metrics_port > 0:
+            self.metrics_server = MetricsServer(
+                get_option("metrics-host", "127.0.0.1"), metrics_port)
+            # The cog can't wait for the server to start, so report it if it
+            # couldn't, e.g. because the port is already in use.
+            self.metrics_server_start = asyncio.create_task(
+                self.metrics_server.start())
+            self.metrics_server_start.add_done_callback(
+                self.report_metrics_server_start)
+            if self.shards is None:
+                SCHEDULER_QUEUED.set_callback(lambda: len(self.scheduler))
+                SCHEDULER_OVERDUE.set_callback(self.get_scheduler_overdue)
+            LIVE_QUEUED.set_callback(lambda: len(self.live_lane.scheduler))
+            NOTIFICATION_QUEUE_DEPTH.set_callback(self.dispatcher.queue_depth)
+            REQUEST_RATE.set_callback(lambda: self.governor.rate)
+            self.measure_event_loop_lag.start()
+        self.refresh_config(get_config_snapshot())
+        self.live_lane.start()
+        self.sync_scheduler.start()
+        if self.shards is None:
+            self.set_worker_count(WORKER_COUNT)
         self.clean_up_user_state.start()
         self.refresh_cookies.start()
+        self.flush_state.change_interval(seconds=self.STATE_FLUSH_INTERVAL)
+        self.flush_state.start()
+        self.flush_stats.change_interval(
+            seconds=get_option("stats-flush-interval", 30.0))
+        self.flush_stats.start()
     
-    def cog_unload(self):
-        self.poller_group1.cancel()
-        self.poller_group2.cancel()
+    def report_metrics_server_start(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Could not start metrics server: {task.exception()}")
+
+    async def cog_unload(self):
+        self.sync_scheduler.cancel()
+        self.live_lane.stop()
+        if self.shards is not None:
+            await self.shards.stop()
+        self.worker_target = 0
+        for worker in self.workers.values():
+            worker.cancel()
         self.clean_up_user_state.cancel()
         self.refresh_cookies.cancel()
+        self.flush_state.cancel()
+        self.flush_stats.cancel()
+        if self.metrics_server is not None:
+            self.measure_event_loop_lag.cancel()
+            self.metrics_server.stop()
+            for gauge in [SCHEDULER_QUEUED, SCHEDULER_OVERDUE, LIVE_QUEUED,
+                          NOTIFICATION_QUEUE_DEPTH, REQUEST_RATE]:
+                gauge.set_callback(None)
+        # Give the notifications that are still queued a chance to be sent.
+        undelivered = await self.dispatcher.drain(self.DISPATCH_DRAIN_TIMEOUT)
+        if undelivered > 0:
+            print(f"COULDN'T DM {undelivered} NOTIFICATION/S BEFORE UNLOADING")
+        self.dispatcher.stop()
+        self.fetch_executor.shutdown()
+        try:
+            self.state_store.flush_now()
+        except Exception as e:
+            print(f"COULDN'T WRITE TO STATE FILE: {e}")
+        flush_stats()
+        flush_timings()
+
+    def set_worker_count(self, count: int):
+        """Grows or shrinks the pool of poll workers. Surplus workers finish
+        their current poll before stopping."""
+
+        assert count > 0
+        self.worker_target = count
+        self.fetch_executor.resize(count + self.live_lane.worker_count)
+        if self.MAX_REQUEST_RATE is None:
+            poll_rate, live_rate = self.get_unthrottled_request_rates(count)
+            self.governor.set_max_rate(poll_rate + live_rate)
+        for worker_number in range(count):
+            if worker_number not in self.workers:
+                self.workers[worker_number] = \
+                    asyncio.create_task(self.poll_worker(worker_number))
+
+    def get_unthrottled_request_rates(self, poll_worker_count: int) -> tuple:
+        """Returns tuple (poll rate, LIVE check rate), in requests per second,
+        that the workers would make requests at if nothing else held them up.
+        Workers that don't wait between requests are assumed to manage 10 per
+        second each."""
+
+        def rate(worker_count: int, interval: float) -> float:
+            return worker_count / interval if interval > 0 else \
+                10.0 * worker_count
+        return (rate(poll_worker_count, self.POLL_INTERVAL),
+                rate(self.live_lane.worker_count, self.live_lane.worker_interval))
+
+    def on_request_rate_change(self, rate: float):
+        if self.shards is not None:
+            self.shards.set_rate(rate * (1.0 - self.governor.local_share))
 
     def load_cookies(self):
         try:
@@ -113,6 +320,8 @@ class PollingCog(commands.Cog):
     @tasks.loop(seconds=5.0)
     async def refresh_cookies(self):
         if self.load_cookies():
+            if self.shards is not None:
+                self.shards.set_cookies(self.raw_cookies)
             await self.error("Refreshed cookies.")
     
     @tasks.loop(seconds=60.0)
@@ -123,273 +332,318 @@ class PollingCog(commands.Cog):
         # I am not going to bother with the extremely unlikely case of a user's
         # configuration being removed as it is being polled AND this task is
         # running.
-        usernames, _ = get_usernames_and_config()
+        config = get_config_snapshot().config
         for username in list(self.state.keys()):
-            if username not in usernames:
+            if username not in config:
                 del self.state[username]
+                self.state_store.mark_dirty(username)
+                self.page_fingerprints.forget(username)
                 remove_user(username)
+                remove_user_timings(username)
+                self.poll_started_at.pop(username, None)
+
+    @tasks.loop(seconds=10.0)
+    async def flush_state(self):
         await self.write_state()
+
+    @tasks.loop(seconds=30.0)
+    async def flush_stats(self):
+        started_at = monotonic()
+        await asyncio.get_running_loop().run_in_executor(None, flush_stats)
+        STATS_FLUSH_DURATION.observe(monotonic() - started_at)
+        await asyncio.get_running_loop().run_in_executor(None, flush_timings)
     
-    @tasks.loop(seconds=3.0)
-    async def poller_group1(self):
+    @tasks.loop(seconds=1.0)
+    async def measure_event_loop_lag(self):
+        """Measures how much later than asked for the event loop wakes up a
+        sleeping task, which grows when something is blocking the loop."""
+
+        started_at = monotonic()
+        await asyncio.sleep(0.5)
+        EVENT_LOOP_LAG.observe(max(0.0, monotonic() - started_at - 0.5))
+
+    def get_scheduler_overdue(self) -> float:
+        delay = self.scheduler.time_until_next_due()
+        return 0.0 if delay is None else max(0.0, -delay)
+
+    @tasks.loop(seconds=1.0)
+    async def sync_scheduler(self):
+        """Adds newly configured users to the scheduler, and removes users whose
+        configurations have been deleted."""
+
+        self.refresh_config(get_config_snapshot())
+
+    def refresh_config(self, snapshot: ConfigSnapshot):
+        """Rebuilds everything derived from the configuration, if it has
+        changed since this was last called."""
+
+        if snapshot.version == self.config_version:
+            return
+        self.config_version = snapshot.version
+        self.monitored_usernames = {
+            username for username, subscribers in snapshot.config.items() if
+            any([Setting.MONITOR in settings for settings in
+                 subscribers.values()])}
+        self.caption_matchers.refresh(snapshot.config)
+        # Users whose subscribers only want LIVE notifications don't need their
+        # profile pages polled at all.
+        video_usernames = [
+            username for username, subscribers in snapshot.config.items() if
+            username in self.monitored_usernames or
+            any([settings.get(Setting.VIDEOS, False) for settings in
+                 subscribers.values()])]
+        if self.shards is not None:
+            # Shards don't know about breakers, so tell them which users are
+            # being held back.
+            delays = {username: self.get_breaker_delay(username) for username
+                      in video_usernames}
+            self.shards.sync({username: username in self.monitored_usernames for
+                              username in video_usernames},
+                             {username: delay for username, delay in
+                              delays.items() if delay > 0})
+        else:
+            self.scheduler.sync(video_usernames)
+        # The alarm rings whenever a user goes LIVE, even if no one wants to be
+        # notified about it.
+        self.live_lane.sync([
+            username for username, subscribers in snapshot.config.items() if
+            username not in self.monitored_usernames and
+            any([settings.get(Setting.LIVES, False) or
+                 settings.get(Setting.ALARM, False) for settings in
+                 subscribers.values()])])
+
+    async def poll_worker(self, worker_number: int):
+        http_client = PollerHTTPClient(self.fetch_executor, self.HTTP_POOL_SIZE,
+                                       self.CONNECT_TIMEOUT, self.READ_TIMEOUT,
+                                       self.STREAM_EARLY_EXIT,
+                                       self.STREAM_DRAIN_LIMIT)
+        self.http_clients[worker_number] = http_client
         try:
-            await self.poll(0)
-        except Exception as e:
-            await self.error(f"EXCEPTION IN GROUP 1: {e}",
-                             attach_this=traceback.format_exc(),
-                             filename_override="traceback_0.txt")
-    
-    @tasks.loop(seconds=3.0)
-    async def poller_group2(self):
+            while worker_number < self.worker_target:
+                username = await self.scheduler.get()
+                # Users are queued as soon as they're configured, including when
+                # the bot starts, even if their breaker is open.
+                breaker_delay = self.get_breaker_delay(username)
+                if breaker_delay > 0:
+                    self.scheduler.reschedule(username, breaker_delay)
+                    continue
+                await self.governor.acquire()
+                poll_started_at = monotonic()
+                self.record_poll_start(username, poll_started_at)
+                try:
+                    await self.poll(username, worker_number, http_client)
+                except Exception as e:
+                    await self.error(f"EXCEPTION IN WORKER {worker_number + 1}: "
+                                     f"{e}", attach_this=traceback.format_exc(),
+                                     filename_override=
+                                        f"traceback_{worker_number}.txt")
+                finally:
+                    record_poll_latency(username, monotonic() - poll_started_at)
+                    POLL_DURATION.observe(monotonic() - poll_started_at)
+                    self.scheduler.reschedule(username,
+                                              self.get_user_interval(username))
+                    self.state_store.mark_dirty(username)
+                if self.state_store.needs_flush():
+                    await self.write_state()
+                await asyncio.sleep(self.POLL_INTERVAL)
+        finally:
+            if self.workers.get(worker_number) is asyncio.current_task():
+                del self.workers[worker_number]
+            del self.http_clients[worker_number]
+            opened, reused = http_client.connection_counts()
+            self.retired_connection_counts = (
+                self.retired_connection_counts[0] + opened,
+                self.retired_connection_counts[1] + reused)
+            await http_client.close()
+
+    def record_poll_start(self, username: str, started_at: float):
+        previous = self.poll_started_at.get(username)
+        self.poll_started_at[username] = started_at
+        if previous is not None:
+            USER_POLL_INTERVAL.observe(
+                started_at - previous,
+                rendezvous_group(username, GROUP_COUNT) + 1)
+
+    def get_user_interval(self, username: str) -> float:
+        """Returns the number of seconds to wait before polling a user again."""
+
+        config = get_config_snapshot().config
+        state = self.state.get(username, {})
+        min_interval, max_interval = self.USER_INTERVAL_OVERRIDES.get(
+            username, (self.MIN_USER_INTERVAL, self.MAX_USER_INTERVAL))
+        return max(calculate_poll_interval(state, len(config.get(username, {})),
+                                           self.BASE_USER_INTERVAL,
+                                           min_interval, max_interval),
+                   self.get_breaker_delay(username))
+
+    async def poll(self, username: str, worker_number: int,
+                   http_client: PollerHTTPClient):
+        # If the user's configuration was removed whilst they were queued, there
+        # is nothing left to poll them for.
+        snapshot = get_config_snapshot()
+        self.refresh_config(snapshot)
+        if username not in snapshot.config:
+            return
+        outcome = await poll_page(username,
+                                  self.PROFILE_URL.format(username=username),
+                                  username in self.monitored_usernames,
+                                  http_client, self.page_fingerprints,
+                                  self.cookies, self.headers)
+        await self.apply_outcome(username, outcome, snapshot.config,
+                                 worker_number)
+
+    async def handle_shard_outcome(self, shard_number: int, username: str,
+                                   outcome: PollOutcome, seconds: float):
+        """Applies the outcome of a poll made by a shard process, then tells the
+        shard when to poll the user next."""
+
+        self.record_poll_start(username, monotonic() - seconds)
+        # Only let the shard skip this page next time if it was acted upon.
+        fingerprint = None
         try:
-            await self.poll(1)
+            snapshot = get_config_snapshot()
+            self.refresh_config(snapshot)
+            if username in snapshot.config:
+                await self.apply_outcome(username, outcome, snapshot.config,
+                                         shard_number)
+                fingerprint = outcome.fingerprint
         except Exception as e:
-            await self.error(f"EXCEPTION IN GROUP 2: {e}",
+            await self.error(f"EXCEPTION IN SHARD {shard_number + 1}: {e}",
                              attach_this=traceback.format_exc(),
-                             filename_override="traceback_1.txt")
+                             filename_override=f"traceback_{shard_number}.txt")
+        finally:
+            record_poll_latency(username, seconds)
+            POLL_DURATION.observe(seconds)
+            self.shards.reschedule(username, self.get_user_interval(username),
+                                   fingerprint)
+            self.state_store.mark_dirty(username)
+        if self.state_store.needs_flush():
+            await self.write_state()
 
-    async def poll(self, group_number: int):
-        assert group_number >= 0 and group_number < GROUP_COUNT
+    async def apply_outcome(self, username: str, outcome: PollOutcome,
+                            config, worker_number: int=None):
+        """Updates a user's state and stats with the outcome of a poll, and
+        sends any notifications that are due."""
 
-        # Get the configuration and username group this poller is responsible for.
-        # If there aren't any usernames to poll, wait until there are.
-        usernames, config = get_username_group_and_config(group_number, GROUP_COUNT)
-        if len(usernames) == 0:
-            return
-        
-        # Increment username counter, and adjust it if it falls out of range.
-        # Then, submit GET request.
-        username, response, counter_was_reset, e = \
-            await self.get_next_user(usernames, group_number)
-        if e is not None:
-            await self.error(f"Connection broke when polling for @{username}: {e}",
-                             ReasonForFailure.CONNECTION_BROKEN, username,
-                             group_number)
-            record_failed_poll(username, ReasonForFailure.CONNECTION_BROKEN)
+        # Phases timed here are added to those timed whilst polling, so that
+        # each phase is counted once per poll.
+        self.governor.record(outcome.reason)
+        timings = outcome.timings if outcome.timings is not None else \
+            new_timings()
+        try:
+            await self.apply_outcome_phases(username, outcome, config,
+                                            worker_number, timings)
+        finally:
+            record_timings(username, timings)
+
+    async def apply_outcome_phases(self, username: str, outcome: PollOutcome,
+                                   config, worker_number: int, timings: dict):
+        state = self.get_user_state(username)
+        if outcome.reason is not None:
+            if outcome.log:
+                await self.error(outcome.message, outcome.reason, username,
+                                 worker_number, outcome.page_text)
+            elif worker_number is not None:
+                self.print_char('!', worker_number)
+            with span(Phase.PERSIST, timings=timings):
+                self.record_breaker_outcome(username, outcome.reason)
+                record_failed_poll(username, outcome.reason, outcome.detail)
+            POLLS.inc("failure")
+            POLL_FAILURES.inc(outcome.reason)
             return
-        if counter_was_reset:
-            self.print_char(str(group_number), group_number)
-
-        # Is TikTok beginning to deny access? In which case, ignore this request.
-        if "Access Denied" in response.html.html:
-            await self.error(f"Access denied when polling for @{username}!",
-                             ReasonForFailure.ACCESS_DENIED, username, group_number,
-                             response.html.html)
-            record_failed_poll(username, ReasonForFailure.ACCESS_DENIED)
+
+        # If the page hasn't changed, then neither has the user's state.
+        if outcome.videos is None:
+            with span(Phase.PERSIST, timings=timings):
+                state["previousError"] = ""
+                state["loggedError"] = False
+                self.record_breaker_outcome(username, None)
+                record_successful_poll(username, outcome.path)
+            POLLS.inc("success")
+            POLLS_SERVED.inc(outcome.path)
+            if worker_number is not None:
+                self.print_char('.', worker_number)
             return
         
-        # In a similar vein, TikTok can have brief periods where it responds with an
-        # incomplete web page that contains "Please wait..." Seems like something is
-        # going wrong with the JavaScript. Rendering the page doesn't work, so we
-        # will have to skip polls until it stops...
-        if "Please wait..." in response.html.html:
-            record_failed_poll(username, ReasonForFailure.PLEASE_WAIT)
-            self.print_char('!', group_number)
-            return
+        # Update this user's state. LIVE status is kept up to date by the LIVE
+        # lane.
+        videos = outcome.videos[:self.RECENT_VIDEO_COUNT]
+        with span(Phase.PERSIST, timings=timings):
+            new_videos, vanished_video_ids = await self.update_user_state(
+                username, videos, outcome.is_available)
         
-        # Are we monitoring this account, instead of reporting uploads and LIVES?
-        monitor_account = any([Setting.MONITOR in settings for settings in
-                               config[username].values()])
-        is_available = True
-        
-        # If there is an element which has the 'DivErrorContainer', then something
-        # is wrong with the page. Could be that it is a private account, or the
-        # account doesn't exist, or they haven't uploaded anything yet. Report it in
-        # the console and move on to the next user.
-        div_elements = response.html.find('div')
-        error_strings = self.check_for_error_div(div_elements)
-        if len(error_strings) > 0:
-            if monitor_account and \
-                "couldn't find this account" in error_strings[0].strip().lower():
-                is_available = False
-            else:
-                reason = self.record_error_div(username, error_strings[0])
-                await self.error(f"Couldn't retrieve latest uploads for "
-                                 f"@{username}: {error_strings}", reason, username,
-                                 group_number, response.html.html)
-                return
-        
-        # Find the latest video's ID and caption. If they couldn't be found, ignore
-        # this user.
-        # There can be cases where a different error div besides "couldn't find
-        # account" is returned for an unavailable account that we are monitoring,
-        # which case it is a failed poll and we need to catch it here. Otherwise,
-        # we aren't interested in these values when monitoring an account.
-        latest_video_id, latest_video_caption, error_string, reason = \
-            -1, "", "", ""
-        if not monitor_account or is_available:
-            latest_video_id, latest_video_caption, error_string, reason = \
-                self.find_latest_video(username, div_elements)
-            if len(error_string) > 0:
-                await self.error(error_string, reason, username, group_number,
-                                    response.html.html)
-                return
-        
-        # Is this user now LIVE?
-        is_live = "SpanLiveBadge" in response.html.html
-        
-        # Update this user's state. Initialise state object for this user if it
-        # doesn't already exist. And update the LIVE flags.
-        previous_video_id = await self.update_user_state(username,
-                                                         latest_video_id,
-                                                         is_live,
-                                                         is_available)
-        
-        if monitor_account:
-            if not self.state[username]["wasAvailable"] and \
-                self.state[username]["isAvailable"]:
-                await self.notify_monitor(config, username, True)
-            elif self.state[username]["wasAvailable"] and \
-                not self.state[username]["isAvailable"]:
-                await self.notify_monitor(config, username, False)
-        else:
-            # If the stored video ID is larger than the latest video ID, it's likely
-            # the video became unavailable later. Send notification for it.
-            # Otherwise,
-            # if the latest video ID is larger, a new upload has been made, so send
-            # notification for that, too. Only send notifications if this isn't the
-            # first time a user's video ID has been retrieved.
-            if previous_video_id >= 0:
-                if previous_video_id > latest_video_id:
-                    await self.notify_deleted_video(config, username, previous_video_id)
-                elif previous_video_id < latest_video_id:
-                    await self.notify_video(config, username, latest_video_id, \
-                                            latest_video_caption)
-        
-            # If the user went LIVE or OFFLINE, send notification.
-            if not self.state[username]["wasLive"] and \
-                self.state[username]["isLive"]:
-                await self.notify_live(config, username, True)
-            elif self.state[username]["wasLive"] and \
-                not self.state[username]["isLive"]:
-                await self.notify_live(config, username, False)
+        with span(Phase.NOTIFY, timings=timings):
+            if username in self.monitored_usernames:
+                if not state["wasAvailable"] and state["isAvailable"]:
+                    self.notify_monitor(config, username, True)
+                elif state["wasAvailable"] and not state["isAvailable"]:
+                    self.notify_monitor(config, username, False)
+            elif username in config:
+                # Send one notification for all of the videos that were made
+                # unavailable, and one for all of the new uploads.
+                if vanished_video_ids:
+                    self.notify_deleted_videos(config, username,
+                                               vanished_video_ids)
+                if new_videos:
+                    self.notify_videos(config, username, new_videos)
         
         # Indicate via console that this poll was successful.
-        self.state[username]["previousError"] = ""
-        self.state[username]["loggedError"] = False
-        record_successful_poll(username)
-        self.print_char('.', group_number)
-    
-    def print_char(self, char: str, group_number: int):
-        print(f"{self.GROUP_COLOURS[group_number]}{char}", end='\x1B[0m',
-              flush=True)
-
-    async def get_next_user(self, usernames: list[str], group_number: int):
-        """Returns tuple (username, response, was this group's user
-        counter reset?, exception if get failed)"""
-
-        reset_counter = False
-        self.poller_username_counters[group_number] += 1
-        if self.poller_username_counters[group_number] >= len(usernames):
-            self.poller_username_counters[group_number] = 0
-            reset_counter = True
-        username = usernames[self.poller_username_counters[group_number]]
-        response = None
-        try:
-            response = await self.session[group_number].get(
-                f"https://www.tiktok.com/@{username}", cookies=self.cookies,
-                headers=self.headers)
-        except Exception as e:
-            return username, response, reset_counter, e
-        return username, response, reset_counter, None
+        with span(Phase.PERSIST, timings=timings):
+            state["previousError"] = ""
+            state["loggedError"] = False
+            self.record_breaker_outcome(username, None)
+            if outcome.page is not None:
+                self.page_fingerprints.remember(username, outcome.page)
+            record_successful_poll(username, outcome.path)
+        POLLS.inc("success")
+        POLLS_SERVED.inc(outcome.path)
+        if worker_number is not None:
+            self.print_char('.', worker_number)
     
-    def check_for_error_div(self, div_elements):
-        """Returns empty list if there was no error div. Returns a list
-        of error strings if there was an error div."""
-
-        error_elements = [element for element in div_elements \
-                    if "class" in element.attrs \
-                    and any([True for css_class in element.attrs['class'] \
-                             if 'DivErrorContainer' in css_class])]
-        if len(error_elements) > 0:
-            p_elements = error_elements[0].find('p')
-            return [p.text for p in p_elements]
-        return []
-
-    def record_error_div(self, username: str, primary_error_string: str):
-        estr = primary_error_string.strip().lower()
-        if "something went wrong" in estr:
-            record_failed_poll(username, ReasonForFailure.SOMETHING_WENT_WRONG)
-            return ReasonForFailure.SOMETHING_WENT_WRONG
-        elif "no content" in estr:
-            record_failed_poll(username, ReasonForFailure.NO_CONTENT)
-            return ReasonForFailure.NO_CONTENT
-        elif "page not available" in estr:
-            record_failed_poll(username, ReasonForFailure.PAGE_NOT_AVAILABLE)
-            return ReasonForFailure.PAGE_NOT_AVAILABLE
-        elif "private" in estr:
-            record_failed_poll(username, ReasonForFailure.PRIVATE_ACCOUNT)
-            return ReasonForFailure.PRIVATE_ACCOUNT
+    def summarise_connections(self) -> str:
+        opened, reused = self.retired_connection_counts
+        for http_client in self.http_clients.values():
+            client_opened, client_reused = http_client.connection_counts()
+            opened += client_opened
+            reused += client_reused
+        summary = f"Connections Opened: {opened}\nConnections Reused: {reused}"
+        if self.shards is not None:
+            summary += f"\n{self.shards.summarise()}"
+        return summary
+
+    def get_breaker_delay(self, username: str) -> float:
+        """Returns the number of seconds the user's breaker is holding them back
+        for. Monitored accounts are never held back, as being private or
+        unavailable is exactly what they're being monitored for."""
+
+        if username in self.monitored_usernames:
+            return 0.0
+        return self.breaker.delay(self.state.get(username, {}))
+
+    def record_breaker_outcome(self, username: str, reason: ReasonForFailure):
+        state = self.get_user_state(username)
+        if reason is None or username in self.monitored_usernames:
+            # Also clears any breaker left from before the user was monitored.
+            self.breaker.record_success(state)
         else:
-            record_failed_poll(username, ReasonForFailure.UNKNOWN_ERROR_DIV,
-                               primary_error_string)
-            return ReasonForFailure.UNKNOWN_ERROR_DIV
-    
-    def find_latest_video(self, username: str, div_elements):
-        # First, find the div containing all the user's videos.
-        video_list = [element for element in div_elements \
-                      if "data-e2e" in element.attrs and \
-                        element.attrs["data-e2e"] == "user-post-item-list"]
-        if len(video_list) == 0:
-            record_failed_poll(username, ReasonForFailure.USER_POST_ITEM_LIST)
-            return -1, "", f"Could not retrieve video list for @{username}!", \
-                ReasonForFailure.USER_POST_ITEM_LIST
-        
-        # Then, retrieve the list of videos within that div.
-        video_list = video_list[0].find('div')
-        if len(video_list) < 2:
-            record_failed_poll(username, ReasonForFailure.USER_POST_ITEM_LIST_DIV)
-            return -1, "", f"Could not retrieve videos within video list for " \
-                           f"@{username}!", ReasonForFailure.USER_POST_ITEM_LIST_DIV
-        
-        # Find the first video in that list.
-        first_video = video_list[1]
-        video_div = [element for element in first_video.find('div') \
-                     if 'data-e2e' in element.attrs and \
-                        element.attrs['data-e2e'] == "user-post-item"]
-        if len(video_div) != 1:
-            record_failed_poll(username, ReasonForFailure.USER_POST_ITEM)
-            return -1, "", f"Could not find video div for @{username}! " \
-                           f"{video_div}", ReasonForFailure.USER_POST_ITEM
-        
-        # Find the link to the video in the first video's div.
-        video_link = video_div[0].find('a', first=True)
-        if video_link == None or 'href' not in video_link.attrs:
-            record_failed_poll(username, ReasonForFailure.NO_VIDEO_LINK)
-            return -1, "", f"Could not extract video link for @{username}! " \
-                           f"{video_link}", ReasonForFailure.NO_VIDEO_LINK
-        
-        # Find the first video's description div.
-        video_desc_div = [element for element in first_video.find('div') \
-                     if 'data-e2e' in element.attrs and \
-                        element.attrs['data-e2e'] == "user-post-item-desc"]
-        if len(video_desc_div) != 1:
-            record_failed_poll(username, ReasonForFailure.USER_POST_ITEM_DESC)
-            return -1, "", f"Could not find video desc div for @{username}! " \
-                           f"{video_desc_div}", ReasonForFailure.USER_POST_ITEM_DESC
-        
-        # Find the first video's description.
-        # The title attribute should still be present even if the caption is blank.
-        video_desc_link = video_desc_div[0].find('a', first=True)
-        if video_desc_link == None or 'title' not in video_desc_link.attrs:
-            record_failed_poll(username, ReasonForFailure.NO_VIDEO_DESC)
-            return -1, "", f"Could not extract video desc for @{username}! " \
-                           f"{video_desc_link}", ReasonForFailure.NO_VIDEO_DESC
-        
-        # Extract and return the information.
-        latest_video_id = \
-            video_link.attrs['href'][video_link.attrs['href'].rfind('/')+1:]
-        latest_video_caption = video_desc_link.attrs['title']
-        try:
-            return int(latest_video_id), latest_video_caption, "", None
-        except Exception as e:
-            record_failed_poll(username, ReasonForFailure.FAULTY_VIDEO_LINK)
-            return -1, "", f"Could not convert video ID to int for @{username}! " \
-                           f"{latest_video_id}. {e}", \
-                            ReasonForFailure.FAULTY_VIDEO_LINK
-    
-    async def update_user_state(self, username: str, latest_video_id: int,
-                                is_live: bool, is_available: bool):
+            self.breaker.record_failure(state, reason)
+
+    def summarise_breakers(self) -> str:
+        counts = {BreakerState.OPEN: 0, BreakerState.HALF_OPEN: 0}
+        for state in self.state.values():
+            breaker = state.get("breaker")
+            if breaker is not None and breaker["state"] in counts:
+                counts[breaker["state"]] += 1
+        return f"Circuit Breakers Open: {counts[BreakerState.OPEN]} " \
+            f"(half-open: {counts[BreakerState.HALF_OPEN]})"
+
+    def print_char(self, char: str, worker_number: int):
+        colour = self.WORKER_COLOURS[worker_number % len(self.WORKER_COLOURS)]
+        print(f"{colour}{char}", end='\x1B[0m', flush=True)
+
+    def get_user_state(self, username: str) -> dict:
+        """Returns a user's state, initialising it if it doesn't exist yet."""
+
         if username not in self.state:
             self.state[username] = {
                 "wasLive": False,
@@ -400,10 +654,34 @@ class PollingCog(commands.Cog):
                 "previousError": "",
                 "loggedError": False
             }
-        self.state[username]["wasLive"] = self.state[username]["isLive"]
-        self.state[username]["isLive"] = is_live
-        previous_video_id = self.state[username]["latestVideoID"]
-        self.state[username]["latestVideoID"] = latest_video_id
+        return self.state[username]
+
+    def update_live_state(self, username: str, is_live: bool) -> tuple:
+        """Returns tuple (was LIVE, is LIVE)."""
+
+        state = self.get_user_state(username)
+        state["wasLive"] = state["isLive"]
+        state["isLive"] = is_live
+        if is_live:
+            state["lastLiveAt"] = time()
+        self.state_store.mark_dirty(username)
+        return state["wasLive"], state["isLive"]
+
+    async def update_user_state(self, username: str, videos: list,
+                                is_available: bool):
+        """Returns tuple (list of tuples (video ID, caption) of new uploads,
+        list of IDs of videos that were made unavailable). Both are empty if this
+        is the first time the user's videos have been retrieved."""
+
+        self.get_user_state(username)
+        # States written before recent video IDs were kept only have the latest.
+        previous_video_ids = self.state[username].get("recentVideoIDs", [
+            video_id for video_id in [self.state[username]["latestVideoID"]] if
+            video_id >= 0])
+        previous_latest_video_id = self.state[username]["latestVideoID"]
+        video_ids = [video_id for video_id, _ in videos]
+        self.state[username]["recentVideoIDs"] = video_ids
+        self.state[username]["latestVideoID"] = max(video_ids, default=-1)
         if "isAvailable" in self.state[username]:
             self.state[username]["wasAvailable"] = \
                 self.state[username]["isAvailable"]
@@ -411,67 +689,103 @@ class PollingCog(commands.Cog):
         else:
             self.state[username]["wasAvailable"] = is_available
             self.state[username]["isAvailable"] = is_available
-        await self.write_state()
-        return previous_video_id
+        if not previous_video_ids or not video_ids:
+            return [], []
+        # A video is new if we haven't seen it before, and it is newer than any
+        # we have seen, so that pinned videos and videos that move back into view
+        # aren't reported. A video has vanished if it is no longer listed even
+        # though it is newer than the oldest video listed, so that videos that
+        # were pushed out of view by new uploads aren't reported.
+        previous = set(previous_video_ids)
+        current = set(video_ids)
+        new_videos = [(video_id, caption) for video_id, caption in videos if
+                      video_id not in previous and
+                      video_id > previous_latest_video_id]
+        vanished_video_ids = [video_id for video_id in previous_video_ids if
+                              video_id not in current and
+                              video_id > video_ids[-1]]
+        return new_videos, vanished_video_ids
 
     async def write_state(self):
-        with self.state_lock:
-            try:
-                with open(self.STATE_FILE_PATH, mode='w', encoding='utf-8') as f:
-                    f.write(json.dumps(self.state))
-            except Exception as e:
-                await self.error(f"COULDN'T WRITE TO STATE FILE: {e}")
+        try:
+            started_at = monotonic()
+            with span(Phase.FLUSH):
+                written = await self.state_store.flush()
+            if written:
+                STATE_FLUSH_DURATION.observe(monotonic() - started_at)
+        except Exception as e:
+            await self.error(f"COULDN'T WRITE TO STATE FILE: {e}")
     
-    async def notify_monitor(self, config: dict, username: str, available: bool):
+    def notify_monitor(self, config: dict, username: str, available: bool):
         for user_id, settings in config[username].items():
             if settings[Setting.MONITOR]:
-                await self.DM(user_id, f"`@{username}` became "
-                              f"{'available' if available else 'unavailable'}! "
-                              f"<https://www.tiktok.com/@{username}/>")
+                self.dispatcher.enqueue(user_id, f"`@{username}` became "
+                    f"{'available' if available else 'unavailable'}! "
+                    f"<https://www.tiktok.com/@{username}/>")
 
-    async def notify_live(self, config: dict, username: str, wentOnline: bool):
+    def notify_live(self, config: dict, username: str, wentOnline: bool):
         for user_id, settings in config[username].items():
             if settings[Setting.LIVES]:
-                await self.DM(user_id, f"`@{username}` went "
-                              f"{'LIVE' if wentOnline else 'OFFLINE'}! "
-                              f"<https://www.tiktok.com/@{username}/live>")
+                self.dispatcher.enqueue(user_id, f"`@{username}` went "
+                    f"{'LIVE' if wentOnline else 'OFFLINE'}! "
+                    f"<https://www.tiktok.com/@{username}/live>")
             if wentOnline and Setting.ALARM in settings and settings[Setting.ALARM]:
                 # Will only work for me, on my Windows laptop.
                 run("START /B \"C:\\Program Files\\VLC\\vlc\" alarm.ogg",
                     shell=True)
 
-    async def notify_video(self, config: dict, username: str, video_id: int, \
-                           video_desc: str):
-        # Extremely unlikely to be more than one upload for small use-cases.
+    def notify_videos(self, config: dict, username: str, videos: list):
+        """Sends each subscriber one notification for all of the given uploads,
+        which are tuples (video ID, caption)."""
+
+        # Every subscriber's filters are matched against each caption at once.
+        matches = [self.caption_matchers.match(username, video_desc) for
+                   _, video_desc in videos]
         for user_id, settings in config[username].items():
             if settings[Setting.VIDEOS]:
-                # If this user has filters configured with it, only send
-                # notification if at least one of the words is found in the video's
-                # caption.
-                if Setting.FILTER in settings:
-                    if not any(phrase in video_desc \
-                               for phrase in settings[Setting.FILTER]):
-                        continue
-                await self.DM(user_id, f"New upload from `@{username}`! "
-                           f"<https://www.tiktok.com/@{username}/video/{video_id}>")
-
-    async def notify_deleted_video(self, config: dict, username: str, \
-                                   video_id: int):
+                # If this user has filters configured with it, only include
+                # videos with at least one of the words in their caption.
+                video_ids = [video_id for (video_id, _), matched in
+                             zip(videos, matches) if
+                             Setting.FILTER not in settings or user_id in matched]
+                if len(video_ids) == 1:
+                    self.dispatcher.enqueue(user_id, f"New upload from "
+                        f"`@{username}`! "
+                        f"<https://www.tiktok.com/@{username}/video/"
+                        f"{video_ids[0]}>")
+                elif len(video_ids) > 1:
+                    self.dispatcher.enqueue(user_id, f"{len(video_ids)} new "
+                        f"uploads from `@{username}`!\n" + "\n".join([
+                            f"<https://www.tiktok.com/@{username}/video/"
+                            f"{video_id}>" for video_id in video_ids]))
+
+    def notify_deleted_videos(self, config: dict, username: str, \
+                              video_ids: list):
+        links = ", ".join([f"<https://www.tiktok.com/@{username}/video/"
+                           f"{video_id}>" for video_id in video_ids])
         for user_id, settings in config[username].items():
             if settings[Setting.VIDEOS]:
-                await self.DM(user_id, f"`@{username}`'s latest upload "
-                        f"<https://www.tiktok.com/@{username}/video/{video_id}> "
-                        f"was made unavailable!")
+                if len(video_ids) == 1:
+                    self.dispatcher.enqueue(user_id, f"`@{username}`'s upload "
+                        f"{links} was made unavailable!")
+                else:
+                    self.dispatcher.enqueue(user_id, f"`@{username}`'s uploads "
+                        f"{links} were made unavailable!")
     
     async def DM(self, user_id: str, msg: str):
-        user = await self.client.fetch_user(user_id)
-        await user.send(msg)
+        with span(Phase.SEND):
+            channel = await self.discord_objects.get_dm_channel(user_id)
+            try:
+                await channel.send(msg)
+            except Exception:
+                self.discord_objects.forget_dm_channel(user_id)
+                raise
     
     async def error(self, msg: str, error_type: ReasonForFailure=None,
-                    username: str=None, group_number: int=None,
+                    username: str=None, worker_number: int=None,
                     attach_this: str=None, filename_override: str=None):
-        if group_number is not None:
-            self.print_char('!', group_number)
+        if worker_number is not None:
+            self.print_char('!', worker_number)
         if error_type is not None and username is not None:
             if "previousError" in self.state[username] and \
                 self.state[username]["previousError"] == error_type:
@@ -480,40 +794,43 @@ class PollingCog(commands.Cog):
                     not self.state[username]["loggedError"]):
                     self.state[username]["loggedError"] = True
                     try:
-                        channel = await self.client.fetch_channel(self.LOG_CHANNEL)
+                        channel = await self.discord_objects.get_channel(
+                            self.LOG_CHANNEL)
                         # If a HTML response is provided, write it to a file and attach it.
                         attachment = None
                         if attach_this is not None:
                             try:
-                                filepath = f"error_{group_number}.html" if \
+                                filepath = f"error_{worker_number}.html" if \
                                     filename_override is None else filename_override
                                 with open(filepath, mode='w', encoding='utf-8') as f:
                                     f.write(attach_this)
                                 attachment = File(filepath)
                             except: # Couldn't create attachment.
-                                self.print_char('?', group_number)
+                                self.print_char('?', worker_number)
                         await channel.send(content=msg, file=attachment)
                     except Exception as e:
                         # No valid log channel ID, just print it instead.
+                        self.discord_objects.forget_channel(self.LOG_CHANNEL)
                         print(msg)
             else:
                 self.state[username]["previousError"] = error_type
                 self.state[username]["loggedError"] = False
         else:
             try:
-                channel = await self.client.fetch_channel(self.LOG_CHANNEL)
+                channel = await self.discord_objects.get_channel(self.LOG_CHANNEL)
                 # If a HTML response is provided, write it to a file and attach it.
                 attachment = None
                 if attach_this is not None:
                     try:
-                        filepath = f"error_{group_number}.html" if \
+                        filepath = f"error_{worker_number}.html" if \
                             filename_override is None else filename_override
                         with open(filepath, mode='w', encoding='utf-8') as f:
                             f.write(attach_this)
                         attachment = File(filepath)
                     except: # Couldn't create attachment.
-                        self.print_char('?', group_number)
+                        self.print_char('?', worker_number)
                 await channel.send(content=msg, file=attachment)
             except Exception as e:
                 # No valid log channel ID, just print it instead.
+                self.discord_objects.forget_channel(self.LOG_CHANNEL)
                 print(msg)
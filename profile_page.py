@@ -0,0 +1,287 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to extracting information from a user's page."""
+
+from dataclasses import dataclass
+from enum import StrEnum
+import json
+
+from lxml import html as lxml_html
+from lxml.etree import ParserError
+
+"""The IDs of the script elements that TikTok has used to embed a page's data
+within it, newest first."""
+HYDRATION_SCRIPT_IDS = [
+    b'id="__UNIVERSAL_DATA_FOR_REHYDRATION__"',
+    b'id="SIGI_STATE"',
+]
+
+"""TikTok's status codes for user pages, mapped to the primary error string
+that the page's error div would show."""
+STATUS_CODE_ERRORS = {
+    10221: "Couldn't find this account",
+    10222: "This account is private",
+    10223: "Couldn't find this account",
+}
+
+class PageMarker(StrEnum):
+    """Strings that tell us something about a user's page as soon as they are
+    received."""
+
+    ACCESS_DENIED = "access-denied"
+    PLEASE_WAIT = "please-wait"
+    LIVE = "live"
+    ERROR_CONTAINER = "error-container"
+    VIDEO_LIST = "video-list"
+
+"""The bytes to search for to find each marker."""
+MARKER_BYTES = {
+    PageMarker.ACCESS_DENIED: b"Access Denied",
+    PageMarker.PLEASE_WAIT: b"Please wait...",
+    PageMarker.LIVE: b"SpanLiveBadge",
+    PageMarker.ERROR_CONTAINER: b"DivErrorContainer",
+    PageMarker.VIDEO_LIST: b'data-e2e="user-post-item-list"',
+}
+
+"""If any of these markers are found, the rest of the page isn't needed."""
+FINAL_MARKERS = {PageMarker.ACCESS_DENIED, PageMarker.PLEASE_WAIT}
+
+@dataclass
+class ProfileData:
+    """What we need to know about a user's page.
+
+    If `error_string` isn't empty, the page is showing an error and the other
+    fields should be ignored.
+    """
+
+    error_string: str
+    # List of tuples (video ID, caption), in the order the page lists them.
+    videos: list
+    is_live: bool
+
+def find_hydration_json(content: bytes):
+    """Returns the decoded data that TikTok embedded in a user's page, or `None`
+    if it couldn't be found."""
+
+    for script_id in HYDRATION_SCRIPT_IDS:
+        start = content.find(script_id)
+        if start < 0:
+            continue
+        start = content.find(b'>', start)
+        end = content.find(b'</script>', start)
+        if start < 0 or end < 0:
+            continue
+        try:
+            return json.loads(content[start + 1:end])
+        except ValueError:
+            continue
+    return None
+
+def is_room_live(room_id) -> bool:
+    return room_id is not None and str(room_id) not in ("", "0")
+
+def extract_profile_data(content: bytes, username: str):
+    """Reads a user's page from the data TikTok embeds within it. Returns `None`
+    if the data is missing or doesn't contain everything we need, in which case
+    the page's DOM has to be searched instead."""
+
+    data = find_hydration_json(content)
+    if not isinstance(data, dict):
+        return None
+    try:
+        if "__DEFAULT_SCOPE__" in data:
+            return __extract_universal_data(data)
+        if "UserModule" in data:
+            return __extract_sigi_state(data, username)
+    except (KeyError, TypeError, ValueError, IndexError):
+        pass
+    return None
+
+def __extract_universal_data(data: dict):
+    user_detail = data["__DEFAULT_SCOPE__"]["webapp.user-detail"]
+    status_code = user_detail.get("statusCode", 0)
+    if status_code in STATUS_CODE_ERRORS:
+        return ProfileData(STATUS_CODE_ERRORS[status_code], [], False)
+    if status_code != 0:
+        return None
+    user = user_detail["userInfo"]["user"]
+    items = user_detail.get("itemList")
+    if not items:
+        if user.get("privateAccount", False):
+            return ProfileData(STATUS_CODE_ERRORS[10222], [], False)
+        # Newer pages load their videos separately.
+        return None
+    return ProfileData("", [(int(item["id"]), item.get("desc", "")) for item
+                            in items], is_room_live(user.get("roomId")))
+
+def __extract_sigi_state(data: dict, username: str):
+    status_code = data.get("UserPage", {}).get("statusCode", 0)
+    if status_code in STATUS_CODE_ERRORS:
+        return ProfileData(STATUS_CODE_ERRORS[status_code], [], False)
+    if status_code != 0:
+        return None
+    users = data["UserModule"]["users"]
+    user = users[username] if username in users else \
+        next(iter(users.values()), None)
+    if user is None:
+        return None
+    video_ids = data.get("ItemList", {}).get("user-post", {}).get("list", [])
+    if not video_ids:
+        if user.get("privateAccount", False):
+            return ProfileData(STATUS_CODE_ERRORS[10222], [], False)
+        return None
+    videos = data["ItemModule"]
+    return ProfileData("", [(int(video_id), videos.get(video_id, {}).get("desc", ""))
+                            for video_id in video_ids],
+                       is_room_live(user.get("roomId")))
+
+"""TikTok's status for a LIVE room that is currently broadcasting."""
+LIVE_ROOM_STATUS = 2
+
+def extract_live_status(content: bytes, username: str):
+    """Reads whether a user is LIVE from the data TikTok embeds within either
+    their LIVE page or their profile page. Returns `None` if it couldn't be
+    determined."""
+
+    data = find_hydration_json(content)
+    if not isinstance(data, dict):
+        return None
+    try:
+        if "LiveRoom" in data:
+            user = data["LiveRoom"]["liveRoomUserInfo"]["user"]
+            if "status" in user:
+                return user["status"] == LIVE_ROOM_STATUS
+            return is_room_live(user.get("roomId"))
+    except (KeyError, TypeError):
+        return None
+    profile = extract_profile_data(content, username)
+    if profile is None or profile.error_string:
+        return None
+    return profile.is_live
+
+class ElementIndex:
+    """Indexes the `div` elements of a user's page by their `data-e2e` attribute
+    and CSS classes, in a single pass over the page."""
+
+    def __init__(self, content: bytes):
+        self.by_data_e2e = {}
+        self.by_class = {}
+        self.positions = {}
+        try:
+            root = lxml_html.fromstring(content)
+        except (ParserError, ValueError):
+            return
+        for position, element in enumerate(root.iter('div')):
+            self.positions[element] = position
+            data_e2e = element.get('data-e2e')
+            if data_e2e is not None:
+                self.by_data_e2e.setdefault(data_e2e, []).append(element)
+            for css_class in element.get('class', '').split():
+                self.by_class.setdefault(css_class, []).append(element)
+
+    def find_by_data_e2e(self, value: str, within=None) -> list:
+        """Returns the divs with the given `data-e2e` value, in document order.
+        If `within` is given, only it and its descendants are returned."""
+
+        elements = self.by_data_e2e.get(value, [])
+        if within is None:
+            return elements
+        return [element for element in elements if element is within or
+                any(ancestor is within for ancestor in element.iterancestors())]
+
+    def find_by_class_substring(self, substring: str) -> list:
+        """Returns the divs with a CSS class containing the given substring, in
+        document order."""
+
+        elements = {}
+        for css_class, class_elements in self.by_class.items():
+            if substring in css_class:
+                for element in class_elements:
+                    elements[self.positions[element]] = element
+        return [elements[position] for position in sorted(elements)]
+
+class PageScanner:
+    """Scans a user's page for markers as it is received, so that we can stop
+    receiving it as soon as we know everything we need to.
+
+    We're done when a final marker is found, or when the embedded page data has
+    been received and it contains everything we need.
+    """
+
+    def __init__(self, username: str):
+        self.username = username
+        self.buffer = bytearray()
+        self.markers = set()
+        self.profile = None
+        self.done = False
+        self.hydration_start = -1
+        self.hydration_checked = False
+        self.overlap = max([len(needle) for needle in MARKER_BYTES.values()] +
+                           [len(script_id) for script_id in HYDRATION_SCRIPT_IDS])
+
+    def feed(self, chunk: bytes):
+        # Search from slightly before the new chunk, in case a marker was split
+        # across two chunks.
+        start = max(0, len(self.buffer) - self.overlap)
+        self.buffer += chunk
+        for marker, needle in MARKER_BYTES.items():
+            if marker not in self.markers and \
+                self.buffer.find(needle, start) >= 0:
+                self.markers.add(marker)
+        if self.markers & FINAL_MARKERS:
+            self.done = True
+            return
+        if self.hydration_checked:
+            return
+        if self.hydration_start < 0:
+            for script_id in HYDRATION_SCRIPT_IDS:
+                self.hydration_start = self.buffer.find(script_id, start)
+                if self.hydration_start >= 0:
+                    break
+        if self.hydration_start >= 0 and \
+            self.buffer.find(b'</script>', max(start, self.hydration_start)) >= 0:
+            self.hydration_checked = True
+            self.done = self.decode(bytes(self.buffer))
+
+    def decode(self, content: bytes) -> bool:
+        """Called once the embedded page data has been received. Returns `True`
+        if it contains everything we need."""
+
+        self.profile = extract_profile_data(content, self.username)
+        return self.profile is not None
+
+    @property
+    def content(self) -> bytes:
+        return bytes(self.buffer)
+
+class LiveScanner(PageScanner):
+    """Scans a page only for whether its user is LIVE."""
+
+    def __init__(self, username: str):
+        super().__init__(username)
+        self.is_live = None
+
+    def decode(self, content: bytes) -> bool:
+        self.is_live = extract_live_status(content, self.username)
+        return self.is_live is not None
@@ -0,0 +1,155 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to deciding which user should be polled next."""
+
+import asyncio
+from heapq import heappush, heappop
+from itertools import count
+from math import log2
+from time import time, monotonic
+
+"""The number of seconds in a day."""
+DAY = 24 * 60 * 60
+
+def video_id_to_time(video_id: int) -> float:
+    """TikTok video IDs store the time they were uploaded in their upper 32
+    bits."""
+
+    return float(video_id >> 32) if video_id > 0 else 0.0
+
+def calculate_poll_interval(state: dict, subscriber_count: int,
+                            base_interval: float, min_interval: float,
+                            max_interval: float) -> float:
+    """Works out how long to wait before polling a user again, given what is
+    known about how active they are.
+
+    Parameters
+    ----------
+    state : dict
+        The user's state, or an empty dict if they haven't been polled yet.
+    subscriber_count : int
+        The number of Discord users subscribed to this user.
+    base_interval : float
+        The interval to use for a user that we know nothing about.
+    min_interval : float
+        The shortest interval that can be returned.
+    max_interval : float
+        The longest interval that can be returned.
+    """
+
+    now = time()
+    interval = base_interval
+    if state:
+        # Poll users that have recently uploaded or gone LIVE more often, and
+        # back off from those that have been quiet for a long time.
+        last_upload = video_id_to_time(state.get("latestVideoID", -1))
+        last_live = now if state.get("isLive", False) else \
+            state.get("lastLiveAt", 0.0)
+        last_active = max(last_upload, last_live)
+        if last_active == 0.0:
+            pass
+        elif now - last_active < DAY:
+            interval /= 4
+        elif now - last_active < 7 * DAY:
+            interval /= 2
+        elif now - last_active > 180 * DAY:
+            interval *= 8
+        elif now - last_active > 30 * DAY:
+            interval *= 4
+    # Users with more subscribers are worth polling more often.
+    if subscriber_count > 1:
+        interval /= 1 + log2(subscriber_count)
+    return min(max(interval, min_interval), max_interval)
+
+class PollScheduler:
+    """Priority queue of usernames, keyed by when they are next due to be
+    polled.
+
+    A username is taken out of the queue while it is being polled, so no two
+    workers can poll the same user at once. It must be given back using
+    `reschedule()` once the poll has finished.
+    """
+
+    def __init__(self):
+        self.heap = []
+        # username -> sequence number of its live heap entry. Entries in the
+        # heap that don't match are stale and are skipped.
+        self.entries = {}
+        self.usernames = set()
+        self.sequence = count()
+        self.changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def sync(self, usernames, delays: dict=None):
+        """Adds new usernames, and forgets removed ones. New usernames are due
+        immediately, unless `delays` maps them to the number of seconds to
+        wait."""
+
+        usernames = set(usernames)
+        delays = delays or {}
+        for username in usernames - self.usernames:
+            self.usernames.add(username)
+            self.schedule(username, monotonic() + delays.get(username, 0.0))
+        for username in self.usernames - usernames:
+            self.usernames.discard(username)
+            self.entries.pop(username, None)
+
+    def schedule(self, username: str, due: float):
+        sequence = next(self.sequence)
+        self.entries[username] = sequence
+        heappush(self.heap, (due, sequence, username))
+        self.changed.set()
+
+    def reschedule(self, username: str, interval: float):
+        """Puts a username back into the queue once it has been polled."""
+
+        if username in self.usernames:
+            self.schedule(username, monotonic() + interval)
+
+    def time_until_next_due(self):
+        """Returns `None` if there is nobody to poll."""
+
+        while self.heap:
+            due, sequence, username = self.heap[0]
+            if self.entries.get(username) == sequence:
+                return due - monotonic()
+            heappop(self.heap)
+        return None
+
+    async def get(self) -> str:
+        """Waits until a username is due, then takes it out of the queue."""
+
+        while True:
+            self.changed.clear()
+            delay = self.time_until_next_due()
+            if delay is not None and delay <= 0:
+                _, _, username = heappop(self.heap)
+                del self.entries[username]
+                return username
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
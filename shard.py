@@ -0,0 +1,269 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to polling users' pages from several processes at once.
+
+Each shard process owns the usernames that rendezvous hashing assigns to it,
+and fetches and parses their pages. It sends the outcome of each poll back to
+the coordinator in the bot's process, which owns the configuration, state,
+stats and notifications, and tells the shard when to poll each user next.
+"""
+
+import asyncio
+from enum import StrEnum
+import multiprocessing
+from http.cookies import SimpleCookie
+from time import monotonic
+
+from requests.cookies import RequestsCookieJar
+
+from stats import ReasonForFailure
+from groups import rendezvous_group
+from scheduler import PollScheduler
+from http_client import FetchExecutor, PollerHTTPClient
+from fingerprint import PageFingerprintCache
+from page_poll import PollOutcome, poll_page
+from dispatch import RateLimiter
+
+class ShardCommand(StrEnum):
+    """Messages sent from the coordinator to a shard."""
+
+    # (SYNC, dict of username -> whether the account is monitored, dict of
+    # username -> seconds to wait before first polling it, if it is new)
+    SYNC = "sync"
+    # (RESCHEDULE, username, seconds until the next poll, fingerprint of the
+    # page to remember, or None)
+    RESCHEDULE = "reschedule"
+    # (COOKIES, raw cookies)
+    COOKIES = "cookies"
+    # (RATE, requests per second this shard may make)
+    RATE = "rate"
+    # (STOP,)
+    STOP = "stop"
+
+def parse_cookies(raw_cookies: str):
+    cookies = RequestsCookieJar()
+    cookies.update(SimpleCookie(raw_cookies))
+    return cookies
+
+def run_shard(shard_number: int, settings: dict, commands, events):
+    """The entry point of a shard process."""
+
+    try:
+        asyncio.run(Shard(shard_number, settings, commands, events).run())
+    except KeyboardInterrupt:
+        pass
+
+class Shard:
+    """Polls the usernames assigned to one shard process."""
+
+    def __init__(self, shard_number: int, settings: dict, commands, events):
+        self.shard_number = shard_number
+        self.settings = settings
+        self.commands = commands
+        self.events = events
+        self.scheduler = PollScheduler()
+        self.monitored = set()
+        self.fingerprints = PageFingerprintCache()
+        self.cookies = parse_cookies(settings["raw-cookies"]) if \
+            settings["raw-cookies"] else None
+        self.rate_limiter = RateLimiter(settings["request-rate"], 1)
+        self.fetch_executor = FetchExecutor(settings["worker-count"])
+
+    async def run(self):
+        workers = [asyncio.create_task(self.worker(worker_number)) for
+                   worker_number in range(self.settings["worker-count"])]
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                command = await loop.run_in_executor(None, self.commands.get)
+                if command[0] == ShardCommand.STOP:
+                    break
+                elif command[0] == ShardCommand.SYNC:
+                    usernames = command[1]
+                    for username in self.scheduler.usernames - usernames.keys():
+                        self.fingerprints.forget(username)
+                    self.monitored = {username for username, monitored in
+                                      usernames.items() if monitored}
+                    self.scheduler.sync(usernames.keys(), command[2])
+                elif command[0] == ShardCommand.RESCHEDULE:
+                    # The page is only remembered once the coordinator has
+                    # applied the outcome, so that uploads are never skipped.
+                    if command[3] is not None and \
+                        command[1] in self.scheduler.usernames:
+                        self.fingerprints.remember_fingerprint(command[1],
+                                                               command[3])
+                    self.scheduler.reschedule(command[1], command[2])
+                elif command[0] == ShardCommand.COOKIES:
+                    self.cookies = parse_cookies(command[1])
+                elif command[0] == ShardCommand.RATE:
+                    self.rate_limiter.set_rate(command[1])
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self.fetch_executor.shutdown()
+
+    async def worker(self, worker_number: int):
+        http_client = PollerHTTPClient(self.fetch_executor,
+                                       self.settings["http-pool-size"],
+                                       self.settings["connect-timeout"],
+                                       self.settings["read-timeout"],
+                                       self.settings["stream-early-exit"],
+                                       self.settings["stream-drain-limit"])
+        try:
+            while True:
+                username = await self.scheduler.get()
+                await self.rate_limiter.acquire()
+                started_at = monotonic()
+                try:
+                    outcome = await poll_page(
+                        username,
+                        self.settings["profile-url"].format(username=username),
+                        username in self.monitored, http_client,
+                        self.fingerprints, self.cookies,
+                        self.settings["headers"])
+                except Exception as e:
+                    outcome = PollOutcome(ReasonForFailure.CONNECTION_BROKEN,
+                                          f"EXCEPTION IN SHARD "
+                                          f"{self.shard_number + 1}: {e}")
+                self.events.put((self.shard_number, username, outcome.compact(),
+                                 monotonic() - started_at))
+                await asyncio.sleep(self.settings["poll-interval"])
+        finally:
+            await http_client.close()
+
+class ShardCoordinator:
+    """Runs the shard processes, and hands the outcome of each of their polls to
+    a handler in the bot's process."""
+
+    def __init__(self, process_count: int, settings: dict, handle_outcome):
+        """
+        Parameters
+        ----------
+        process_count : int
+            The number of shard processes to run.
+        settings : dict
+            Passed to each shard. See `Shard`.
+        handle_outcome : coroutine function
+            Called with (shard number, username, `PollOutcome`, seconds the poll
+            took) for each poll. Must call `reschedule()` for the username.
+            Outcomes are handled concurrently, though never two for the same
+            username.
+        """
+
+        assert process_count > 0
+        self.process_count = process_count
+        self.handle_outcome = handle_outcome
+        context = multiprocessing.get_context("spawn")
+        self.events = context.Queue()
+        self.commands = [context.Queue() for _ in range(process_count)]
+        self.processes = [
+            context.Process(target=run_shard, args=(
+                shard_number, settings, self.commands[shard_number],
+                self.events), daemon=True, name=f"shard-{shard_number + 1}")
+            for shard_number in range(process_count)]
+        # The usernames last sent to each shard.
+        self.assignments = [{} for _ in range(process_count)]
+        self.reader = None
+        self.handlers = set()
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        self.reader = asyncio.create_task(self.read_events())
+
+    async def stop(self):
+        """Waits up to 5 seconds for the processes to stop, without blocking
+        the event loop, then terminates any that haven't."""
+
+        for commands in self.commands:
+            commands.put((ShardCommand.STOP,))
+        # Wake up the reader's thread so that it can exit.
+        self.events.put(None)
+        if self.reader is not None:
+            self.reader.cancel()
+        for handler in self.handlers:
+            handler.cancel()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(None, process.join, 5.0)
+                               for process in self.processes])
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+    def shard_of(self, username: str) -> int:
+        return rendezvous_group(username, self.process_count)
+
+    def sync(self, usernames: dict, delays: dict):
+        """Assigns usernames to shards. Takes a dict of username -> whether the
+        account is monitored, and a dict of username -> seconds a shard should
+        wait before first polling it, such as while its breaker is open."""
+
+        assignments = [{} for _ in range(self.process_count)]
+        for username, monitored in usernames.items():
+            assignments[self.shard_of(username)][username] = monitored
+        for shard_number, assignment in enumerate(assignments):
+            if assignment != self.assignments[shard_number]:
+                self.commands[shard_number].put((ShardCommand.SYNC, assignment, {
+                    username: delays[username] for username in assignment if
+                    username in delays}))
+        self.assignments = assignments
+
+    def reschedule(self, username: str, interval: float,
+                   fingerprint: dict=None):
+        """Pass the outcome's fingerprint if it was applied successfully, so
+        that the shard can skip the page next time if it hasn't changed."""
+
+        self.commands[self.shard_of(username)].put(
+            (ShardCommand.RESCHEDULE, username, interval, fingerprint))
+
+    def set_cookies(self, raw_cookies: str):
+        for commands in self.commands:
+            commands.put((ShardCommand.COOKIES, raw_cookies))
+
+    def set_rate(self, rate: float):
+        """Splits the given total request rate evenly between the shards."""
+
+        for commands in self.commands:
+            commands.put((ShardCommand.RATE, rate / self.process_count))
+
+    async def read_events(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, self.events.get)
+            if event is None:
+                return
+            # Don't let a slow outcome hold up the rest.
+            handler = asyncio.create_task(self.handle_event(event))
+            self.handlers.add(handler)
+            handler.add_done_callback(self.handlers.discard)
+
+    async def handle_event(self, event: tuple):
+        try:
+            await self.handle_outcome(*event)
+        except Exception as e:
+            print(f"COULDN'T HANDLE OUTCOME FROM SHARD {event[0] + 1}: {e}")
+
+    def summarise(self) -> str:
+        alive = sum([1 for process in self.processes if process.is_alive()])
+        return f"Shard Processes: {alive} of {self.process_count} alive"
@@ -0,0 +1,117 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Code related to storing the state of each polled user."""
+
+import asyncio
+import json
+import os
+from threading import Lock
+
+def write_file_atomically(path: str, contents: str):
+    """Writes to a temporary file first, then moves it over the original, so
+    that the original is never left half-written if the bot crashes."""
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, mode='w', encoding='utf-8') as f:
+        f.write(contents)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+class StateStore:
+    """Holds the state of each polled user, and writes it to disk in the
+    background.
+
+    Users whose state has changed must be marked dirty. Only their state is
+    serialised again when the store is flushed, the rest is reused from the
+    previous flush.
+    """
+
+    def __init__(self, path: str, dirty_threshold: int):
+        self.path = path
+        self.dirty_threshold = dirty_threshold
+        self.file_lock = Lock()
+        self.flush_lock = asyncio.Lock()
+        self.dirty = set()
+        # Set if the last write failed, so that it is retried on the next flush.
+        self.unwritten = False
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as f:
+                self.state = json.loads(f.read())
+        except Exception as e:
+            self.state = {}
+            print(f"COULDN'T LOAD STATE: {e}")
+        # username -> JSON of that user's state as of the last flush.
+        self.fragments = {username: json.dumps(state) for username, state in
+                          self.state.items()}
+
+    def mark_dirty(self, username: str):
+        """Call whenever a user's state is changed or removed."""
+
+        self.dirty.add(username)
+
+    def needs_flush(self) -> bool:
+        return len(self.dirty) >= self.dirty_threshold
+
+    def serialise(self) -> list:
+        """Serialises the dirty users and returns the users' JSON fragments."""
+
+        for username in self.dirty:
+            if username in self.state:
+                self.fragments[username] = json.dumps(self.state[username])
+            else:
+                self.fragments.pop(username, None)
+        self.dirty.clear()
+        return list(self.fragments.items())
+
+    def write(self, fragments: list):
+        """Blocking. Writes the given fragments to the state file."""
+
+        contents = "{" + ", ".join([f"{json.dumps(username)}: {fragment}" for
+                                    username, fragment in fragments]) + "}"
+        with self.file_lock:
+            write_file_atomically(self.path, contents)
+
+    async def flush(self):
+        """Writes the state file from a background thread, if anything has
+        changed since it was last written. Returns `True` if it was written."""
+
+        async with self.flush_lock:
+            if not self.dirty and not self.unwritten:
+                return False
+            fragments = self.serialise()
+            self.unwritten = True
+            await asyncio.get_running_loop().run_in_executor(None, self.write,
+                                                             fragments)
+            self.unwritten = False
+            return True
+
+    def flush_now(self):
+        """Blocking. Writes the state file immediately, e.g. when shutting
+        down."""
+
+        if self.dirty or self.unwritten:
+            self.unwritten = True
+            self.write(self.serialise())
+            self.unwritten = False
@@ -29,6 +29,9 @@ from threading import Lock
 from enum import StrEnum
 import json
 
+from state_store import write_file_atomically
+from latency import LatencyHistogram, new_rolling_counters
+
 class ReasonForFailure(StrEnum):
     """Reasons for a failed poll."""
 
@@ -47,58 +50,85 @@ class ReasonForFailure(StrEnum):
     USER_POST_ITEM_DESC = "user-post-item-desc"
     NO_VIDEO_DESC = "no-video-desc"
     FAULTY_VIDEO_LINK = "faulty-video-link"
+    # Only used by the LIVE lane, which keeps its own stats.
+    LIVE_STATUS_UNKNOWN = "live-status-unknown"
+
+class PollPath(StrEnum):
+    """Which part of the poller found the result of a successful poll."""
+
+    UNCHANGED = "unchanged"
+    HYDRATION = "hydration"
+    DOM = "dom"
+
+"""Captions for each poll path, used when summarising stats."""
+POLL_PATH_CAPTIONS = {
+    PollPath.UNCHANGED: "Unchanged Page (Parse Skipped)",
+    PollPath.HYDRATION: "Embedded Page Data",
+    PollPath.DOM: "DOM Search",
+}
 
 global __STATS_LOCK
 __STATS_LOCK = Lock()
 
+"""Lock used to guard writing the stats file. If both locks are needed, this one
+must be acquired first."""
+global __STATS_FILE_LOCK
+__STATS_FILE_LOCK = Lock()
+
 global __STATS_FILE_PATH
 __STATS_FILE_PATH = "./stats.json"
 
 global __STATS_CACHE
 
+"""Rolling success counters for each user, and for all users combined. These
+are only kept in memory."""
+global __STATS_ROLLING
+__STATS_ROLLING = {}
+global __STATS_GLOBAL_ROLLING
+__STATS_GLOBAL_ROLLING = new_rolling_counters()
+
+"""Set whenever the stats change, and cleared once they've been written."""
+global __STATS_DIRTY
+__STATS_DIRTY = False
+
 def time_as_str(time_to_convert=None) -> str:
     if time_to_convert is None: time_to_convert = time()
     return datetime.fromtimestamp(time_to_convert).strftime('%Y-%m-%d %H:%M:%S')
 
 def __reset_stats():
     global __STATS_CACHE
+    global __STATS_LATEST_POLL
+    global __STATS_DIRTY
+    global __STATS_ROLLING
+    global __STATS_GLOBAL_ROLLING
     __STATS_CACHE = {}
+    __STATS_ROLLING = {}
+    __STATS_GLOBAL_ROLLING = new_rolling_counters()
+    __STATS_LATEST_POLL = ""
+    __STATS_DIRTY = True
     try:
         with open("last-reset-stats-at.txt", mode='w', encoding='utf-8') as f:
             f.write(time_as_str())
     except Exception as e:
         print(f"COULD NOT WRITE last-reset-stats-at.txt: {e}")
-    with __STATS_LATEST_POLL_LOCK:
-        try:
-            with open("latest-poll-result.txt", mode='w', encoding='utf-8') as f:
-                pass
-        except Exception as e:
-            print(f"COULDN'T CLEAR latest-poll-result.txt: {e}")
 
-global __STATS_LATEST_POLL_LOCK
-__STATS_LATEST_POLL_LOCK = Lock()
+"""The result of the latest poll. Kept in memory and written to
+latest-poll-result.txt along with the rest of the stats."""
+global __STATS_LATEST_POLL
+try:
+    with open("latest-poll-result.txt", mode='r', encoding='utf-8') as f:
+        __STATS_LATEST_POLL = f.read().strip()
+except Exception as e:
+    __STATS_LATEST_POLL = ""
 
 def __write_latest_poll(username: str, latest_poll: str):
     """You must have previously acquired the __STATS_LOCK!"""
 
+    global __STATS_LATEST_POLL
     __STATS_CACHE[username]["last-poll"] = latest_poll
     last_poll_at = time_as_str()
     __STATS_CACHE[username]["last-poll-at"] = last_poll_at
-    with __STATS_LATEST_POLL_LOCK:
-        try:
-            with open("latest-poll-result.txt", mode='w', encoding='utf-8') as f:
-                f.write(f"`@{username}`: {latest_poll}, at {last_poll_at}")
-        except Exception as e:
-            print(f"COULDN'T UPDATE latest-poll-result.txt WITH {latest_poll}: {e}")
-
-def __read_latest_poll() -> str:
-    with __STATS_LATEST_POLL_LOCK:
-        try:
-            with open("latest-poll-result.txt", mode='r', encoding='utf-8') as f:
-                return f.read().strip()
-        except Exception as e:
-            print(f"COULDN'T READ latest-poll-result.txt WITH: {e}")
-            return "<error reading latest-poll-result.txt>"
+    __STATS_LATEST_POLL = f"`@{username}`: {latest_poll}, at {last_poll_at}"
 
 def __add_user(username: str):
     if username in __STATS_CACHE: return
@@ -123,6 +153,8 @@ def __add_user(username: str):
             ReasonForFailure.NO_VIDEO_DESC: 0,
             ReasonForFailure.FAULTY_VIDEO_LINK: 0,
         },
+        "served-by": {},
+        "latency": LatencyHistogram().counts,
         "last-poll": "N/A",
         "last-poll-at": "N/A"
     }
@@ -134,19 +166,69 @@ except Exception as e:
     __reset_stats()
     print(f"COULDN'T READ FROM STATS FILE: {e}")
 
-def __write_stats():
+def __serialise_stats() -> tuple:
+    """Returns tuple (stats file contents, latest poll result), and marks the
+    stats as clean. You must have previously acquired the __STATS_LOCK!"""
+
+    global __STATS_DIRTY
+    __STATS_DIRTY = False
+    return json.dumps(__STATS_CACHE), __STATS_LATEST_POLL
+
+def __write_stats(contents: str, latest_poll: str):
+    """Blocking. You must have previously acquired the __STATS_FILE_LOCK, but
+    not the __STATS_LOCK, so that polls can be recorded whilst the file is being
+    written."""
+
     try:
-        with open(__STATS_FILE_PATH, mode='w', encoding='utf-8') as f:
-            f.write(json.dumps(__STATS_CACHE))
+        write_file_atomically(__STATS_FILE_PATH, contents)
     except Exception as e:
         print(f"COULDN'T WRITE TO STATS FILE: {e}")
+        # Try again next time.
+        __mark_dirty()
+        return
+    try:
+        write_file_atomically("latest-poll-result.txt", latest_poll)
+    except Exception as e:
+        print(f"COULDN'T UPDATE latest-poll-result.txt: {e}")
+
+def __mark_dirty():
+    global __STATS_DIRTY
+    __STATS_DIRTY = True
+
+def __record_outcome(username: str, success: bool):
+    """You must have previously acquired the __STATS_LOCK!"""
+
+    now = time()
+    if username not in __STATS_ROLLING:
+        __STATS_ROLLING[username] = new_rolling_counters()
+    for counters in [__STATS_ROLLING[username], __STATS_GLOBAL_ROLLING]:
+        for counter in counters.values():
+            counter.record(success, now)
+
+def flush_stats() -> None:
+    """Blocking. Writes the stats to disk if they have changed since they were
+    last written. Should be called periodically from a background thread, and
+    when shutting down."""
 
-def record_successful_poll(username: str):
+    # The file lock is held throughout, so that an older snapshot can never be
+    # written over a newer one.
+    with __STATS_FILE_LOCK:
+        with __STATS_LOCK:
+            if not __STATS_DIRTY:
+                return
+            contents, latest_poll = __serialise_stats()
+        __write_stats(contents, latest_poll)
+
+def record_successful_poll(username: str, path: PollPath=None):
     with __STATS_LOCK:
         __add_user(username)
         __STATS_CACHE[username]["success"] += 1
+        if path is not None:
+            served_by = __STATS_CACHE[username].setdefault("served-by", {})
+            served_by[path] = served_by.get(path, 0) + 1
+        __record_outcome(username, True)
         __write_latest_poll(username, "Success")
-        __write_stats()
+        __mark_dirty()
 
 def record_failed_poll(username: str, reason: ReasonForFailure,
                        error_div: str=None):
@@ -167,25 +249,49 @@ def record_failed_poll(username: str, reason: ReasonForFailure,
                 __STATS_CACHE[username]["failure"] \
                     [ReasonForFailure.UNKNOWN_ERROR_DIV][error_div] = 1
             latest_poll = error_div
+        __record_outcome(username, False)
         __write_latest_poll(username, latest_poll)
-        __write_stats()
+        __mark_dirty()
+
+def record_poll_latency(username: str, seconds: float):
+    """Records how long a poll took, from start to finish."""
 
-def reset_stats() -> None:
     with __STATS_LOCK:
-        __reset_stats()
-        __write_stats()
+        # Only polls that recorded a success or failure are counted.
+        if username not in __STATS_CACHE:
+            return
+        if "latency" not in __STATS_CACHE[username]:
+            __STATS_CACHE[username]["latency"] = LatencyHistogram().counts
+        histogram = LatencyHistogram(__STATS_CACHE[username]["latency"])
+        histogram.record(seconds)
+        __STATS_CACHE[username]["latency"] = histogram.counts
+        __mark_dirty()
+
+def reset_stats() -> None:
+    with __STATS_FILE_LOCK:
+        with __STATS_LOCK:
+            __reset_stats()
+            contents, latest_poll = __serialise_stats()
+        __write_stats(contents, latest_poll)
 
 def remove_user(username: str):
     with __STATS_LOCK:
+        __STATS_ROLLING.pop(username, None)
         if username in __STATS_CACHE:
             del __STATS_CACHE[username]
-            __write_stats()
+            __mark_dirty()
 
 def summarise_stats(username: str="") -> str:
     # Make copy so as not to lock up the rest of the bot.
     stats_copy = None
+    now = time()
     with __STATS_LOCK:
         stats_copy = __STATS_CACHE.copy()
+        global_rolling = {period: counter.summarise(now) for period, counter in
+                          __STATS_GLOBAL_ROLLING.items()}
+        user_rolling = {period: counter.summarise(now) for period, counter in
+                        __STATS_ROLLING[username].items()} \
+            if username in __STATS_ROLLING else None
     msg = ""
     if username is None or len(username) == 0:
         # Summarise entire stats.
@@ -193,6 +299,10 @@ def summarise_stats(username: str="") -> str:
         msg += f"Currently polling **{len(stats_copy.keys())}** user/s.\n"
         successful = sum([stats["success"] for stats in stats_copy.values()])
         msg += f"Successful: {successful}\n"
+        for path, caption in POLL_PATH_CAPTIONS.items():
+            served = sum([stats.get("served-by", {}).get(path, 0) for stats in
+                          stats_copy.values()])
+            msg += f"Served By {caption}: {served}\n"
         failure_counters = {}
         for stats in stats_copy.values():
             for failure_reason, count in stats["failure"].items():
@@ -227,6 +337,12 @@ def summarise_stats(username: str="") -> str:
         msg += f"Total Polls: {successful + failures}\n"
         msg += "Success Rate: {:.2f}%\n".format(
             successful / (successful + failures) * 100.0)
+        msg += f"Success Rate (Last Minute): {global_rolling['minute']}\n"
+        msg += f"Success Rate (Last Hour): {global_rolling['hour']}\n"
+        latency = LatencyHistogram()
+        for stats in stats_copy.values():
+            latency.add(LatencyHistogram(stats.get("latency")))
+        msg += f"Poll Latency: {latency.summarise()}\n"
     else:
         # Summarise user's stats.
         msg += f"**__{username}'s Polling Stats__**\n"
@@ -236,6 +352,9 @@ def summarise_stats(username: str="") -> str:
             successful = stats_copy[username]['success']
             total = successful
             msg += f"Successful: {total}\n"
+            for path, caption in POLL_PATH_CAPTIONS.items():
+                served = stats_copy[username].get("served-by", {}).get(path, 0)
+                msg += f"Served By {caption}: {served}\n"
             for failure_reason, count in stats_copy[username]["failure"].items():
                 if failure_reason == ReasonForFailure.UNKNOWN_ERROR_DIV:
                     for div_str, inner_count in count.items():
@@ -249,6 +368,11 @@ def summarise_stats(username: str="") -> str:
             msg += f"Total Failures: {total - successful}\n"
             msg += f"Total Polls: {total}\n"
             msg += "Success Rate: {:.2f}%\n".format(successful / total * 100)
+            if user_rolling is not None:
+                msg += f"Success Rate (Last Minute): {user_rolling['minute']}\n"
+                msg += f"Success Rate (Last Hour): {user_rolling['hour']}\n"
+            latency = LatencyHistogram(stats_copy[username].get("latency"))
+            msg += f"Poll Latency: {latency.summarise()}\n"
             if "last-poll" not in stats_copy[username]:
                 stats_copy[username]['last-poll'] = "Unknown"
             msg += f"Last Poll: {stats_copy[username]['last-poll']}\n"
@@ -263,5 +387,5 @@ def summarise_stats(username: str="") -> str:
     except Exception as e:
         print(f"COULD NOT READ last-reset-stats-at.txt: {e}")
         msg += "<unknown>"
-    msg += f"\nLatest Poll: {__read_latest_poll()}"
+    msg += f"\nLatest Poll: {__STATS_LATEST_POLL}"
     return msg 
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The bot's modules live in the repository's root, and are imported by name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Some modules read and write files in the working directory when they're
+# imported, so run the tests somewhere they can't touch the bot's own files.
+os.chdir(tempfile.mkdtemp(prefix="tiktoknotifier-tests-"))
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from breaker import AccountBreaker, BreakerState
+from poller import PollingCog
+from stats import ReasonForFailure
+
+def make_cog(monitored_usernames: set):
+    """Just enough of a `PollingCog` to exercise its breaker methods."""
+
+    cog = SimpleNamespace(
+        breaker=AccountBreaker(2, 600.0, 3600.0,
+                               [ReasonForFailure.PAGE_NOT_AVAILABLE]),
+        monitored_usernames=monitored_usernames, state={})
+    cog.get_user_state = lambda username: \
+        PollingCog.get_user_state(cog, username)
+    return cog
+
+def fail(cog, username: str, times: int):
+    for _ in range(times):
+        PollingCog.record_breaker_outcome(
+            cog, username, ReasonForFailure.PAGE_NOT_AVAILABLE)
+
+def test_breaker_opens_after_repeated_failures():
+    cog = make_cog(set())
+    fail(cog, "bob", 2)
+    assert cog.state["bob"]["breaker"]["state"] == BreakerState.OPEN
+    assert PollingCog.get_breaker_delay(cog, "bob") > 0
+
+def test_monitored_accounts_are_never_backed_off():
+    cog = make_cog({"bob"})
+    fail(cog, "bob", 5)
+    assert "breaker" not in cog.state["bob"]
+    assert PollingCog.get_breaker_delay(cog, "bob") == 0.0
+
+def test_monitoring_clears_an_open_breaker():
+    cog = make_cog(set())
+    fail(cog, "bob", 2)
+    cog.monitored_usernames.add("bob")
+    assert PollingCog.get_breaker_delay(cog, "bob") == 0.0
+    fail(cog, "bob", 1)
+    assert "breaker" not in cog.state["bob"]
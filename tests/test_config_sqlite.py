@@ -0,0 +1,47 @@
+import json
+
+from profile_page import extract_profile_data
+
+def sigi_page(data: dict) -> bytes:
+    return ('<html><head><script id="SIGI_STATE" type="application/json">' +
+            json.dumps(data) + '</script></head><body></body></html>') \
+        .encode('utf-8')
+
+def test_sigi_state_without_users_falls_back_to_dom():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {}},
+                      "ItemList": {"user-post": {"list": ["1"]}},
+                      "ItemModule": {"1": {"desc": "hi"}}})
+    assert extract_profile_data(page, "bob") is None
+
+def test_sigi_state_with_other_user_is_read():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {"Bob": {"roomId": ""}}},
+                      "ItemList": {"user-post": {"list": ["7", "5"]}},
+                      "ItemModule": {"7": {"desc": "new"}, "5": {"desc": "old"}}})
+    profile = extract_profile_data(page, "bob")
+import os
+import tempfile
+
+import pytest
+
+from config_sqlite import SQLiteConfigStorage
+
+CONFIG = {"bob": {"1": {"videos": True, "lives": False}}}
+
+def new_storage() -> SQLiteConfigStorage:
+    return SQLiteConfigStorage(os.path.join(tempfile.mkdtemp(), "config.db"))
+
+def test_import_marks_the_database_as_migrated():
+    storage = new_storage()
+    storage.import_config(CONFIG)
+    assert storage.is_migrated()
+    assert storage.load() == CONFIG
+
+def test_failed_import_leaves_neither_rows_nor_mark():
+    storage = new_storage()
+    with pytest.raises(TypeError):
+        # The second user's setting can't be encoded as JSON.
+        storage.import_config({**CONFIG, "amy": {"1": {"videos": object()}}})
+    assert not storage.is_migrated()
+    assert storage.load() == {}
@@ -0,0 +1,59 @@
+import json
+
+from profile_page import extract_profile_data
+
+def sigi_page(data: dict) -> bytes:
+    return ('<html><head><script id="SIGI_STATE" type="application/json">' +
+            json.dumps(data) + '</script></head><body></body></html>') \
+        .encode('utf-8')
+
+def test_sigi_state_without_users_falls_back_to_dom():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {}},
+                      "ItemList": {"user-post": {"list": ["1"]}},
+                      "ItemModule": {"1": {"desc": "hi"}}})
+    assert extract_profile_data(page, "bob") is None
+
+def test_sigi_state_with_other_user_is_read():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {"Bob": {"roomId": ""}}},
+                      "ItemList": {"user-post": {"list": ["7", "5"]}},
+                      "ItemModule": {"7": {"desc": "new"}, "5": {"desc": "old"}}})
+    profile = extract_profile_data(page, "bob")
+import asyncio
+
+from dispatch import NotificationDispatcher
+
+def test_drain_delivers_queued_and_retried_notifications():
+    async def main():
+        sent = []
+        async def send(user_id: str, message: str):
+            if message == "flaky" and message not in sent:
+                sent.append(message)
+                raise ConnectionError()
+            await asyncio.sleep(0.01)
+            sent.append(message)
+        # A long retry delay, which draining mustn't wait out.
+        dispatcher = NotificationDispatcher(send, 2, 1000.0, 3, 60.0)
+        dispatcher.start()
+        for message in ["a", "flaky", "b", "c"]:
+            dispatcher.enqueue("1", message)
+        undelivered = await dispatcher.drain(5.0)
+        dispatcher.stop()
+        return undelivered, sent
+    undelivered, sent = asyncio.run(main())
+    assert undelivered == 0
+    assert sorted(sent) == ["a", "b", "c", "flaky", "flaky"]
+
+def test_drain_gives_up_after_timeout():
+    async def main():
+        async def send(user_id: str, message: str):
+            await asyncio.sleep(60.0)
+        dispatcher = NotificationDispatcher(send, 1, 1000.0, 1, 1.0)
+        dispatcher.start()
+        for message in ["a", "b"]:
+            dispatcher.enqueue("1", message)
+        undelivered = await dispatcher.drain(0.1)
+        dispatcher.stop()
+        return undelivered
+    assert asyncio.run(main()) == 1
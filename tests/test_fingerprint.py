@@ -0,0 +1,66 @@
+import json
+
+from profile_page import extract_profile_data
+
+def sigi_page(data: dict) -> bytes:
+    return ('<html><head><script id="SIGI_STATE" type="application/json">' +
+            json.dumps(data) + '</script></head><body></body></html>') \
+        .encode('utf-8')
+
+def test_sigi_state_without_users_falls_back_to_dom():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {}},
+                      "ItemList": {"user-post": {"list": ["1"]}},
+                      "ItemModule": {"1": {"desc": "hi"}}})
+    assert extract_profile_data(page, "bob") is None
+
+def test_sigi_state_with_other_user_is_read():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {"Bob": {"roomId": ""}}},
+                      "ItemList": {"user-post": {"list": ["7", "5"]}},
+                      "ItemModule": {"7": {"desc": "new"}, "5": {"desc": "old"}}})
+    profile = extract_profile_data(page, "bob")
+from fingerprint import PageFingerprintCache, fingerprint_page
+from http_client import StreamedPage
+from profile_page import PageScanner
+
+def streamed_page(content: bytes, complete: bool) -> StreamedPage:
+    scanner = PageScanner("bob")
+    scanner.feed(content)
+    return StreamedPage(200, {}, scanner, complete)
+
+PAGE = b'<div data-e2e="user-post-item-list"><div data-e2e="user-post-item">' \
+    b'<a href="/@bob/video/7"></a></div></div>'
+
+def test_complete_page_is_fingerprinted():
+    fingerprints = PageFingerprintCache()
+    fingerprints.remember("bob", streamed_page(PAGE, True))
+    assert fingerprints.is_unchanged("bob", streamed_page(PAGE, True))
+
+def test_truncated_page_is_not_fingerprinted():
+    fingerprints = PageFingerprintCache()
+    fingerprints.remember("bob", streamed_page(PAGE, False))
+    assert fingerprints.entries["bob"]["digest"] is None
+    assert not fingerprints.is_unchanged("bob", streamed_page(PAGE, True))
+
+def test_truncated_page_never_matches():
+    fingerprints = PageFingerprintCache()
+    fingerprints.remember("bob", streamed_page(PAGE, True))
+    assert not fingerprints.is_unchanged("bob", streamed_page(PAGE, False))
+
+def video_list(video_ids: list) -> bytes:
+    items = b"".join([b'<div data-e2e="user-post-item"><div class="pad">' +
+                      b"x" * 3600 + b'</div><a href="/@bob/video/' +
+                      str(video_id).encode() + b'"></a></div>' for video_id
+                      in video_ids])
+    return b'<div><div data-e2e="user-post-item-list">' + items + \
+        b'</div><div>footer</div></div>'
+
+def test_deleting_a_video_near_the_end_changes_the_fingerprint():
+    before = video_list(range(10, 0, -1))
+    after = video_list([10, 9, 8, 7, 6, 5, 4, 2, 1])
+    assert fingerprint_page(before) != fingerprint_page(after)
+
+def test_cut_short_video_list_is_not_fingerprinted():
+    page = video_list(range(10, 0, -1))
+    assert fingerprint_page(page[:-40]) is None
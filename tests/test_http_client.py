@@ -0,0 +1,92 @@
+import json
+
+from profile_page import extract_profile_data
+
+def sigi_page(data: dict) -> bytes:
+    return ('<html><head><script id="SIGI_STATE" type="application/json">' +
+            json.dumps(data) + '</script></head><body></body></html>') \
+        .encode('utf-8')
+
+def test_sigi_state_without_users_falls_back_to_dom():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {}},
+                      "ItemList": {"user-post": {"list": ["1"]}},
+                      "ItemModule": {"1": {"desc": "hi"}}})
+    assert extract_profile_data(page, "bob") is None
+
+def test_sigi_state_with_other_user_is_read():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {"Bob": {"roomId": ""}}},
+                      "ItemList": {"user-post": {"list": ["7", "5"]}},
+                      "ItemModule": {"7": {"desc": "new"}, "5": {"desc": "old"}}})
+    profile = extract_profile_data(page, "bob")
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from http_client import FetchExecutor, PollerHTTPClient
+
+class ConnectionCountingServer(ThreadingHTTPServer):
+    """Serves a page whose access denied marker is followed by a large body, and
+    counts the connections it accepts."""
+
+    daemon_threads = True
+    accepted = 0
+
+    def get_request(self):
+        self.accepted += 1
+        return super().get_request()
+
+    def handle_error(self, request, client_address):
+        pass
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b"Access Denied" + b" " * (1024 * 1024)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        try:
+            self.wfile.write(self.body)
+        except ConnectionError:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+def fetch_pages(early_exit: bool, count: int, drain_limit: int=0) -> tuple:
+    server = ConnectionCountingServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/@bob"
+    async def main():
+        executor = FetchExecutor(1)
+        client = PollerHTTPClient(executor, 1, 5.0, 5.0, early_exit,
+                                  drain_limit)
+        for _ in range(count):
+            page = await client.fetch_page(url, "bob")
+            assert not page.complete
+        await client.close()
+        executor.shutdown()
+        return client.connection_counts()
+    try:
+        return asyncio.run(main()), server.accepted
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_connections_closed_early_are_counted_as_opened():
+    (opened, reused), accepted = fetch_pages(True, 5)
+    assert opened == accepted == 5
+    assert reused == 0
+
+def test_drained_connections_are_reused():
+    (opened, reused), accepted = fetch_pages(False, 5)
+    assert opened == accepted == 1
+    assert reused == 4
+
+def test_small_remainders_are_drained_despite_early_exit():
+    (opened, reused), accepted = fetch_pages(True, 5, 2 * 1024 * 1024)
+    assert opened == accepted == 1
+    assert reused == 4
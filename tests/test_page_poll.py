@@ -0,0 +1,46 @@
+import json
+
+from profile_page import extract_profile_data
+
+def sigi_page(data: dict) -> bytes:
+    return ('<html><head><script id="SIGI_STATE" type="application/json">' +
+            json.dumps(data) + '</script></head><body></body></html>') \
+        .encode('utf-8')
+
+def test_sigi_state_without_users_falls_back_to_dom():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {}},
+                      "ItemList": {"user-post": {"list": ["1"]}},
+                      "ItemModule": {"1": {"desc": "hi"}}})
+    assert extract_profile_data(page, "bob") is None
+
+def test_sigi_state_with_other_user_is_read():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {"Bob": {"roomId": ""}}},
+                      "ItemList": {"user-post": {"list": ["7", "5"]}},
+                      "ItemModule": {"7": {"desc": "new"}, "5": {"desc": "old"}}})
+    profile = extract_profile_data(page, "bob")
+from page_poll import find_videos
+from profile_page import ElementIndex
+from stats import ReasonForFailure
+
+def video_list(links: list) -> bytes:
+    return b'<html><body><div data-e2e="user-post-item-list">' + \
+        b"".join([b'<div><div data-e2e="user-post-item">' + link + b'</div>' +
+                  b'<div data-e2e="user-post-item-desc"><a title="caption">' +
+                  b'</a></div></div>' for link in links]) + \
+        b'</div></body></html>'
+
+def test_videos_are_read_from_the_dom():
+    index = ElementIndex(video_list([b'<a href="/@bob/video/7"></a>',
+                                     b'<a href="/@bob/video/5"></a>']))
+    assert find_videos("bob", index) == ([(7, "caption"), (5, "caption")], "",
+                                         None)
+
+def test_one_unreadable_video_fails_the_poll():
+    index = ElementIndex(video_list([b'<a></a>',
+                                     b'<a href="/@bob/video/5"></a>']))
+    videos, error_string, reason = find_videos("bob", index)
+    assert videos == []
+    assert error_string
+    assert reason == ReasonForFailure.NO_VIDEO_LINK
@@ -0,0 +1,48 @@
+import json
+
+from profile_page import extract_profile_data
+
+def sigi_page(data: dict) -> bytes:
+    return ('<html><head><script id="SIGI_STATE" type="application/json">' +
+            json.dumps(data) + '</script></head><body></body></html>') \
+        .encode('utf-8')
+
+def test_sigi_state_without_users_falls_back_to_dom():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {}},
+                      "ItemList": {"user-post": {"list": ["1"]}},
+                      "ItemModule": {"1": {"desc": "hi"}}})
+    assert extract_profile_data(page, "bob") is None
+
+def test_sigi_state_with_other_user_is_read():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {"Bob": {"roomId": ""}}},
+                      "ItemList": {"user-post": {"list": ["7", "5"]}},
+                      "ItemModule": {"7": {"desc": "new"}, "5": {"desc": "old"}}})
+    profile = extract_profile_data(page, "bob")
+from types import MappingProxyType, SimpleNamespace
+
+from config import ConfigSnapshot, Setting
+from poller import PollingCog
+
+def synced_live_usernames(config: dict) -> list:
+    """Refreshes just enough of a `PollingCog` to see who the LIVE lane is
+    told to check."""
+
+    synced = []
+    cog = SimpleNamespace(
+        config_version=None, shards=None,
+        caption_matchers=SimpleNamespace(refresh=lambda config: None),
+        scheduler=SimpleNamespace(sync=lambda usernames: None),
+        live_lane=SimpleNamespace(sync=synced.extend))
+    PollingCog.refresh_config(cog, ConfigSnapshot(
+        1, tuple(config.keys()), MappingProxyType(config)))
+    return synced
+
+def test_alarm_subscribers_are_checked_for_live():
+    assert synced_live_usernames({
+        "bob": {"1": {Setting.VIDEOS: True, Setting.LIVES: False,
+                      Setting.ALARM: True}},
+        "amy": {"1": {Setting.VIDEOS: True, Setting.LIVES: False}},
+        "sam": {"1": {Setting.VIDEOS: False, Setting.LIVES: True}},
+    }) == ["bob", "sam"]
@@ -0,0 +1,41 @@
+import json
+
+from profile_page import extract_profile_data
+
+def sigi_page(data: dict) -> bytes:
+    return ('<html><head><script id="SIGI_STATE" type="application/json">' +
+            json.dumps(data) + '</script></head><body></body></html>') \
+        .encode('utf-8')
+
+def test_sigi_state_without_users_falls_back_to_dom():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {}},
+                      "ItemList": {"user-post": {"list": ["1"]}},
+                      "ItemModule": {"1": {"desc": "hi"}}})
+    assert extract_profile_data(page, "bob") is None
+
+def test_sigi_state_with_other_user_is_read():
+    page = sigi_page({"UserPage": {"statusCode": 0},
+                      "UserModule": {"users": {"Bob": {"roomId": ""}}},
+                      "ItemList": {"user-post": {"list": ["7", "5"]}},
+                      "ItemModule": {"7": {"desc": "new"}, "5": {"desc": "old"}}})
+    profile = extract_profile_data(page, "bob")
+import asyncio
+
+from scheduler import PollScheduler
+
+def test_new_usernames_can_be_held_back():
+    async def main():
+        scheduler = PollScheduler()
+        scheduler.sync(["bob", "amy"], {"bob": 60.0})
+        first = await scheduler.get()
+        return first, scheduler.time_until_next_due()
+    first, delay = asyncio.run(main())
+    assert first == "amy"
+    assert 59.0 < delay <= 60.0
+
+def test_delays_only_apply_to_new_usernames():
+    scheduler = PollScheduler()
+    scheduler.sync(["bob"])
+    scheduler.sync(["bob"], {"bob": 60.0})
+    assert scheduler.time_until_next_due() <= 0
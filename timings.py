@@ -0,0 +1,220 @@
+"""MIT License
+
+Copyright (c) 2023 CasualYouTuber31
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+"""Times each phase of a poll, so that it's clear where polling spends its time.
+
+Timing is off unless the `phase-timing` option is `true`. Whilst it is off,
+`span()` returns a context manager that does nothing. Timings are only kept in
+memory, aggregated for each phase and for each user, and are written to
+phase-timings.json whenever the stats are flushed.
+"""
+
+from time import perf_counter
+from threading import Lock
+from contextlib import nullcontext
+from enum import StrEnum
+import json
+
+from options import get_option
+from state_store import write_file_atomically
+
+class Phase(StrEnum):
+    """The phases of a poll, followed by the work that is done outside of any
+    one poll. The latter are timed per operation rather than per poll."""
+
+    # Requesting and receiving the user's page. When the page is streamed, this
+    # includes reading the data TikTok embeds within it.
+    FETCH = "fetch"
+    # Finding the user's videos, or the reason they couldn't be found.
+    PARSE = "parse"
+    # Updating the user's state and stats.
+    PERSIST = "persist"
+    # Building notifications, and queueing them to be sent.
+    NOTIFY = "notify"
+    # Writing the state file, timed per write.
+    FLUSH = "flush"
+    # Sending a notification to Discord, timed per DM.
+    SEND = "send"
+
+"""What each phase's count is a count of, for phases not timed per poll."""
+OPERATION_NAMES = {
+    Phase.FLUSH: "write",
+    Phase.SEND: "DM",
+}
+
+global __TIMING_ENABLED
+__TIMING_ENABLED = get_option("phase-timing", False)
+
+global __TIMINGS_FILE_PATH
+__TIMINGS_FILE_PATH = "./phase-timings.json"
+
+global __TIMINGS_LOCK
+__TIMINGS_LOCK = Lock()
+
+"""Phase -> [count, total seconds, longest seconds], across all users. Phases
+that don't belong to a single poll, such as `FLUSH` and `SEND`, are only counted
+here."""
+global __TIMINGS_TOTAL
+__TIMINGS_TOTAL = {}
+
+"""Username -> phase -> [count, total seconds, longest seconds]."""
+global __TIMINGS_BY_USER
+__TIMINGS_BY_USER = {}
+
+"""Set whenever a timing is recorded, and cleared once they've been written."""
+global __TIMINGS_DIRTY
+__TIMINGS_DIRTY = False
+
+"""Returned by `span()` whilst timing is off. Reusable, as it holds no state."""
+__NULL_SPAN = nullcontext()
+
+class Span:
+    """Times the code within a `with` block."""
+
+    __slots__ = ("phase", "username", "timings", "started_at")
+
+    def __init__(self, phase: Phase, username: str, timings: dict):
+        self.phase = phase
+        self.username = username
+        self.timings = timings
+
+    def __enter__(self):
+        self.started_at = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = perf_counter() - self.started_at
+        if self.timings is not None:
+            self.timings[self.phase] = \
+                self.timings.get(self.phase, 0.0) + seconds
+        else:
+            record_timing(self.phase, self.username, seconds)
+        return False
+
+def timing_enabled() -> bool:
+    return __TIMING_ENABLED
+
+def span(phase: Phase, username: str=None, timings: dict=None):
+    """Returns a context manager that times the code within it.
+
+    Parameters
+    ----------
+    phase : Phase
+        The phase that the code belongs to.
+    username : str
+        The user the code is working on, if any.
+    timings : dict
+        If given, the time is added to this dict of phase -> seconds instead of
+        being recorded, so that it can be recorded later, by another process if
+        need be, using `record_timings()`.
+    """
+
+    if not __TIMING_ENABLED:
+        return __NULL_SPAN
+    return Span(phase, username, timings)
+
+def new_timings():
+    """Returns an empty dict to pass to `span()`, or `None` if timing is off."""
+
+    return {} if __TIMING_ENABLED else None
+
+def __add(aggregate: dict, phase: Phase, seconds: float):
+    """You must have previously acquired the __TIMINGS_LOCK!"""
+
+    if phase not in aggregate:
+        aggregate[phase] = [0, 0.0, 0.0]
+    entry = aggregate[phase]
+    entry[0] += 1
+    entry[1] += seconds
+    if seconds > entry[2]:
+        entry[2] = seconds
+
+def record_timing(phase: Phase, username: str, seconds: float):
+    global __TIMINGS_DIRTY
+    with __TIMINGS_LOCK:
+        __add(__TIMINGS_TOTAL, phase, seconds)
+        if username is not None:
+            __add(__TIMINGS_BY_USER.setdefault(username, {}), phase, seconds)
+        __TIMINGS_DIRTY = True
+
+def record_timings(username: str, timings: dict):
+    """Records a dict of phase -> seconds filled in by `span()`."""
+
+    if not timings:
+        return
+    for phase, seconds in timings.items():
+        record_timing(phase, username, seconds)
+
+def remove_user_timings(username: str):
+    with __TIMINGS_LOCK:
+        __TIMINGS_BY_USER.pop(username, None)
+
+def __describe(entry: list) -> dict:
+    count, total, longest = entry
+    return {"count": count, "total": total,
+            "mean": total / count if count else 0.0, "max": longest}
+
+def dump_timings() -> dict:
+    """Returns every timing, in a form that can be written as JSON."""
+
+    with __TIMINGS_LOCK:
+        return {
+            "phases": {phase: __describe(entry) for phase, entry in
+                       __TIMINGS_TOTAL.items()},
+            "users": {username: {phase: __describe(entry) for phase, entry in
+                                 phases.items()} for username, phases in
+                      __TIMINGS_BY_USER.items()},
+        }
+
+def flush_timings() -> None:
+    """Blocking. Writes the timings to disk if they have changed since they
+    were last written."""
+
+    global __TIMINGS_DIRTY
+    if not __TIMINGS_DIRTY:
+        return
+    __TIMINGS_DIRTY = False
+    try:
+        write_file_atomically(__TIMINGS_FILE_PATH, json.dumps(dump_timings()))
+    except Exception as e:
+        print(f"COULDN'T WRITE TO PHASE TIMINGS FILE: {e}")
+
+def summarise_timings(username: str="") -> str:
+    if not __TIMING_ENABLED:
+        return "Phase Timings: off"
+    with __TIMINGS_LOCK:
+        if username:
+            aggregate = __TIMINGS_BY_USER.get(username, {})
+        else:
+            aggregate = __TIMINGS_TOTAL
+        entries = {phase: list(entry) for phase, entry in aggregate.items()}
+    msg = "Phase Timings:"
+    if not entries:
+        return msg + " N/A"
+    for phase in Phase:
+        if phase in entries:
+            count, total, longest = entries[phase]
+            msg += f"\n- {phase.title()}: mean {total / count * 1000.0:.1f}ms, " \
+                f"max {longest * 1000.0:.1f}ms, total {total:.1f}s over {count} " \
+                f"{OPERATION_NAMES.get(phase, 'poll')}/s"
+    return msg